@@ -0,0 +1,90 @@
+"""
+Allergen/property bitmasks: each Sensitivity owns one bit, and every FoodItem keeps the bits of the
+sensitivities named in its contains / may_contain / properties arrays, so allergen filters become
+integer AND tests instead of JSONB name matching.
+"""
+
+from sqlalchemy import text
+
+from models import db, FoodItem, Sensitivity
+
+# BIGINT masks hold bits 0..62 (the sign bit is left unused). Sensitivities created after all bits
+# are taken get no bit_index; filters fall back to name matching for those.
+MASK_BITS = 63
+
+# FoodItem JSONB name array -> the mask column kept in sync with it
+MASK_COLUMNS = {
+    "contains": "contains_mask",
+    "may_contain": "may_contain_mask",
+    "properties": "properties_mask",
+}
+
+# Arbitrary constant key that serializes bit assignment between concurrent transactions
+_BIT_ASSIGNMENT_LOCK = 7_140_001
+
+def assign_sensitivity_bits() -> int:
+    """Gives every sensitivity without a bit the lowest free one, in id order. Returns how many were assigned."""
+    db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _BIT_ASSIGNMENT_LOCK})
+    return db.session.execute(text("""
+        WITH free AS (
+            SELECT b AS bit_index, row_number() OVER (ORDER BY b) AS rn
+            FROM generate_series(0, :max_bit) AS b
+            WHERE b NOT IN (SELECT bit_index FROM sensitivities WHERE bit_index IS NOT NULL)
+        ), pending AS (
+            SELECT id, row_number() OVER (ORDER BY id) AS rn
+            FROM sensitivities WHERE bit_index IS NULL
+        )
+        UPDATE sensitivities s SET bit_index = free.bit_index
+        FROM pending JOIN free USING (rn)
+        WHERE s.id = pending.id
+    """), {"max_bit": MASK_BITS - 1}).rowcount
+
+def recompute_allergen_masks(product_ids=None) -> int:
+    """
+    Recomputes the masks of the given products (all products when None) with one set-based UPDATE.
+    Only rows whose masks actually change are written. Returns the number of rows updated.
+    """
+    mask_exprs = ",\n".join(
+        f"(SELECT COALESCE(bit_or(1::bigint << s.bit_index), 0) FROM sensitivities s "
+        f"WHERE s.bit_index IS NOT NULL AND COALESCE(p.{source}, '[]'::jsonb) ? s.name) AS {mask}"
+        for source, mask in MASK_COLUMNS.items()
+    )
+    return db.session.execute(text(f"""
+        UPDATE food_items f
+        SET {", ".join(f"{mask} = m.{mask}" for mask in MASK_COLUMNS.values())}
+        FROM (
+            SELECT p.id, {mask_exprs}
+            FROM food_items p
+            WHERE CAST(:ids AS INTEGER[]) IS NULL OR p.id = ANY(CAST(:ids AS INTEGER[]))
+        ) m
+        WHERE f.id = m.id AND ({", ".join(f"f.{mask}" for mask in MASK_COLUMNS.values())})
+              IS DISTINCT FROM ({", ".join(f"m.{mask}" for mask in MASK_COLUMNS.values())})
+    """), {"ids": list(product_ids) if product_ids is not None else None}).rowcount
+
+def refresh_allergen_masks() -> int:
+    """Assigns bits to new sensitivities and recomputes every product. Used after taxonomy changes and imports."""
+    assign_sensitivity_bits()
+    return recompute_allergen_masks()
+
+def set_product_masks(product: FoodItem) -> None:
+    """Sets a single product's masks in Python from its current name arrays (before it is flushed)."""
+    bits = dict(db.session.query(Sensitivity.name, Sensitivity.bit_index).filter(Sensitivity.bit_index.isnot(None)).all())
+    for source, mask in MASK_COLUMNS.items():
+        value = 0
+        for name in getattr(product, source) or []:
+            if name in bits:
+                value |= 1 << bits[name]
+        setattr(product, mask, value)
+
+def sensitivity_mask(sensitivity_ids) -> tuple[int, list[str]]:
+    """
+    (mask of the sensitivities that own a bit, names of those that do not). The names need the
+    JSONB fallback; they only exist once more than MASK_BITS sensitivities have been defined.
+    """
+    mask, unmapped = 0, []
+    for s in Sensitivity.query.filter(Sensitivity.id.in_(list(sensitivity_ids))).all():
+        if s.bit_index is None:
+            unmapped.append(s.name)
+        else:
+            mask |= 1 << s.bit_index
+    return mask, unmapped
@@ -0,0 +1,231 @@
+"""Set-based import of backup ZIP archives (as produced by /api/system/export) into the database."""
+
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from sqlalchemy import text
+
+from models import db
+from images import IMAGE_FETCH_WORKERS, image_extension
+from allergen_masks import refresh_allergen_masks
+from nutrition_features import enqueue_standardization
+from embeddings import EMBEDDING_PENDING, EMBEDDING_READY, current_embedder, start_background_backfill
+
+# Column types of the products staging table, in products.csv order (minus the old id)
+PRODUCT_STAGING_COLUMNS = {
+    "name": "VARCHAR(200)",
+    "category_id": "INTEGER",
+    "image_url": "VARCHAR(500)",
+    "iddsi": "INTEGER",
+    "calories": "DOUBLE PRECISION",
+    "protein": "DOUBLE PRECISION",
+    "carbs": "DOUBLE PRECISION",
+    "fat": "DOUBLE PRECISION",
+    "sugars": "DOUBLE PRECISION",
+    "sodium": "DOUBLE PRECISION",
+    "contains": "JSONB",
+    "may_contain": "JSONB",
+    "texture_id": "INTEGER",
+    "properties": "JSONB",
+    "company": "VARCHAR(100)",
+    "texture_notes": "TEXT",
+    "allergy_notes": "TEXT",
+    "forbidden_for": "VARCHAR(200)",
+    "nutrition_vector": "vector(6)",
+    "openai_embedding": "vector(1536)",
+    "embedding_model": "VARCHAR(100)",
+}
+NUMERIC_COLUMNS = ["calories", "protein", "carbs", "fat", "sugars", "sodium"]
+TEXT_COLUMNS = ["company", "texture_notes", "allergy_notes", "forbidden_for"]
+JSON_LIST_COLUMNS = ["contains", "may_contain", "properties"]
+VECTOR_DIMENSIONS = {"nutrition_vector": 6, "openai_embedding": 1536}
+
+def _read_csv(zf, file_names, filename):
+    """Reads one CSV from the archive, or None if it is missing or unreadable."""
+    if filename not in file_names:
+        return None
+    with zf.open(filename) as f:
+        try:
+            return pd.read_csv(f)
+        except Exception as e:
+            # Catching any pandas error (EmptyDataError, ParserError, etc.)
+            print(f"Skipping {filename} due to read error: {e}")
+            return None
+
+def _clean_names(series: pd.Series) -> pd.Series:
+    """Stripped names with blanks and 'nan' removed (index preserved)."""
+    names = series.astype(str).str.strip()
+    return names[(names != '') & (names.str.lower() != 'nan')]
+
+def _json_list_text(value) -> str:
+    """Normalizes a JSON-list cell to JSON text, falling back to '[]' like the row-based importer did."""
+    if pd.isna(value):
+        return "[]"
+    try:
+        parsed = json.loads(value)
+    except (TypeError, ValueError):
+        return "[]"
+    return json.dumps(parsed if isinstance(parsed, list) else [], ensure_ascii=False)
+
+def _merge_taxonomy(table: str, df) -> tuple[int, dict]:
+    """
+    Inserts every name not already present (case-insensitive) with one INSERT ... SELECT,
+    then returns (rows added, {old id from the archive: current id}).
+    """
+    if df is None or df.empty or "name" not in df.columns:
+        return 0, {}
+    names = _clean_names(df["name"])
+    unique_names = names[~names.str.lower().duplicated()].tolist()
+
+    added = db.session.execute(text(f"""
+        INSERT INTO {table} (name, created_at)
+        SELECT v.name, timezone('utc', now())
+        FROM unnest(CAST(:names AS TEXT[])) AS v(name)
+        WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE lower(trim(t.name)) = lower(v.name))
+        ON CONFLICT (name) DO NOTHING
+    """), {"names": unique_names}).rowcount
+
+    if "id" not in df.columns:
+        return added, {}
+    current = dict(db.session.execute(text(f"SELECT lower(trim(name)), id FROM {table}")).all())
+    id_map = {
+        old_id: current[name.lower()]
+        for old_id, name in zip(df.loc[names.index, "id"], names)
+        if pd.notna(old_id) and name.lower() in current
+    }
+    return added, id_map
+
+def _upload_images(zf, file_names, paths, uploader) -> dict:
+    """Uploads the distinct archive images in parallel. Returns {archive path: public URL} for the successful ones."""
+    paths = [p for p in paths if p in file_names]
+
+    def upload(path):
+        try:
+            return path, uploader.upload(zf.read(path), image_extension(path))
+        except Exception as e:
+            print(f"Failed to upload packaged image {path} to supabase: {e}")
+            return path, ""
+
+    with ThreadPoolExecutor(max_workers=IMAGE_FETCH_WORKERS) as pool:
+        return {path: url for path, url in pool.map(upload, paths) if url}
+
+def _existing_names(names) -> set[str]:
+    """The lowercased names among `names` that are already in the catalog."""
+    return set(db.session.execute(text("""
+        SELECT lower(trim(name)) FROM food_items WHERE lower(trim(name)) = ANY(CAST(:names AS TEXT[]))
+    """), {"names": list(names)}).scalars())
+
+def _prepare_products(df, cat_id_map, tex_id_map, zf, file_names, uploader) -> pd.DataFrame:
+    """
+    Vectorized clean-up of products.csv into the staging column layout. Products whose name is
+    already in the catalog are dropped here, so their images are not uploaded.
+    """
+    names = _clean_names(df["name"]) if "name" in df.columns else pd.Series(dtype=str)
+    # First occurrence wins for names repeated inside the archive
+    names = names[~names.str.lower().duplicated()]
+    names = names[~names.str.lower().isin(_existing_names(names.str.lower()))]
+    df = df.loc[names.index].copy()
+    df["name"] = names
+
+    for col in PRODUCT_STAGING_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+
+    df["category_id"] = df["category_id"].map(cat_id_map).astype("Int64")
+    df["texture_id"] = df["texture_id"].map(tex_id_map).astype("Int64")
+    df["iddsi"] = pd.to_numeric(df["iddsi"], errors="coerce").fillna(0).astype(int)
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].where(df[col].notna(), "").astype(str)
+    for col in JSON_LIST_COLUMNS:
+        df[col] = df[col].map(_json_list_text)
+    for col, dim in VECTOR_DIMENSIONS.items():
+        # A well-formed vector literal is '[v1, ..., vN]' with N-1 commas; anything else becomes NULL
+        vectors = df[col].astype("string").str.strip()
+        valid = vectors.str.startswith("[") & vectors.str.endswith("]") & (vectors.str.count(",") == dim - 1)
+        df[col] = vectors.where(valid.fillna(False), None)
+
+    image_urls = df["image_url"].astype("string").fillna("")
+    packaged = image_urls.str.startswith("images/")
+    uploaded = _upload_images(zf, file_names, image_urls[packaged].unique().tolist(), uploader) if uploader else {}
+    # Packaged images become their bucket URL; older archives that only hold external URLs keep them
+    df["image_url"] = image_urls.map(uploaded).where(packaged, image_urls.where(image_urls.str.startswith("http"), ""))
+    df["image_url"] = df["image_url"].fillna("")
+
+    return df[list(PRODUCT_STAGING_COLUMNS)]
+
+def _copy_into_staging(df: pd.DataFrame) -> None:
+    """Creates a temp staging table and fills it with a single COPY."""
+    columns = ", ".join(f"{name} {sql_type}" for name, sql_type in PRODUCT_STAGING_COLUMNS.items())
+    db.session.execute(text(f"CREATE TEMP TABLE import_food_items ({columns}) ON COMMIT DROP"))
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep="\\N")
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY import_food_items ({', '.join(PRODUCT_STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer,
+    )
+
+def import_backup_archive(zf, uploader=None) -> dict:
+    """
+    Imports a backup archive in a single transaction and returns the counts for the import report.
+
+    Taxonomies are merged with one INSERT ... SELECT each. Products are cleaned with vectorized
+    pandas transforms, COPY'd into a temp staging table and merged with one INSERT ... SELECT
+    that skips names already in the catalog. Packaged images are uploaded in parallel
+    (content-addressed, see ContentAddressedUploader). Names are matched case-insensitively, as before.
+    Embeddings made by another embedder than the configured one (or of unknown origin, from
+    archives older than the embedding_model column) are imported as pending and re-embedded.
+    """
+    file_names = set(zf.namelist())
+    try:
+        cat_added, cat_id_map = _merge_taxonomy("categories", _read_csv(zf, file_names, "categories.csv"))
+        sen_added, _ = _merge_taxonomy("sensitivities", _read_csv(zf, file_names, "sensitivities.csv"))
+        tex_added, tex_id_map = _merge_taxonomy("textures", _read_csv(zf, file_names, "textures.csv"))
+        diet_added, _ = _merge_taxonomy("diets", _read_csv(zf, file_names, "diets.csv"))
+
+        prod_added = pending_added = 0
+        df_prod = _read_csv(zf, file_names, "products.csv")
+        if df_prod is not None and not df_prod.empty:
+            staged = _prepare_products(df_prod, cat_id_map, tex_id_map, zf, file_names, uploader)
+            _copy_into_staging(staged)
+            columns = ", ".join(PRODUCT_STAGING_COLUMNS)
+            statuses = db.session.execute(text(f"""
+                INSERT INTO food_items ({columns}, embedding_status, created_at, updated_at)
+                SELECT {columns},
+                       CASE WHEN s.openai_embedding IS NOT NULL AND s.embedding_model = :model
+                            THEN :ready ELSE :pending END,
+                       timezone('utc', now()), timezone('utc', now())
+                FROM import_food_items s
+                WHERE NOT EXISTS (SELECT 1 FROM food_items f WHERE lower(trim(f.name)) = lower(s.name))
+                RETURNING embedding_status
+            """), {"model": current_embedder().name, "ready": EMBEDDING_READY, "pending": EMBEDDING_PENDING}).scalars().all()
+            prod_added = len(statuses)
+            pending_added = statuses.count(EMBEDDING_PENDING)
+
+        # Bits for imported sensitivities, and masks for imported products (only changed rows are written)
+        refresh_allergen_masks()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # Indexing the new products' standardized nutrition costs far more than the import itself,
+    # so it runs as a background job (substitute lookups skip products until then)
+    if prod_added:
+        enqueue_standardization()
+    if pending_added:
+        start_background_backfill()
+
+    return {
+        "categories_added": cat_added,
+        "sensitivities_added": sen_added,
+        "textures_added": tex_added,
+        "diets_added": diet_added,
+        "products_added": prod_added,
+        **(uploader.stats if uploader else {}),
+    }
@@ -0,0 +1,85 @@
+"""In-process cache of serialized catalog responses, keyed by URL and the data versions they were built from."""
+
+import os
+import threading
+from collections import OrderedDict
+from flask import jsonify, request, Response
+
+from data_versions import current_versions
+from metrics import CACHE_ENTRIES, CACHE_LOOKUPS
+
+# Total size of the serialized responses kept per process; least recently used ones are evicted first
+CATALOG_CACHE_MAX_BYTES = int(os.environ.get("CATALOG_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Cache-Control for versioned GETs: clients may store the response but must revalidate it (cheap 304)
+VERSIONED_CACHE_CONTROL = os.environ.get("VERSIONED_CACHE_CONTROL", "no-cache")
+
+_cache_lock = threading.Lock()
+_snapshots: "OrderedDict[str, tuple[str, bytes]]" = OrderedDict()   # URL -> (ETag, JSON body)
+_cache_bytes = 0
+_cache_stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+def _get_snapshot(key: str, etag: str) -> bytes | None:
+    """Cached body for this URL if it was built at exactly these versions."""
+    with _cache_lock:
+        entry = _snapshots.get(key)
+        if entry is None or entry[0] != etag:
+            return None
+        _snapshots.move_to_end(key)
+        return entry[1]
+
+def _put_snapshot(key: str, etag: str, body: bytes) -> None:
+    """Stores a body, replacing any older version of the same URL and evicting to stay within the byte budget."""
+    global _cache_bytes
+    if len(body) > CATALOG_CACHE_MAX_BYTES:
+        return
+    with _cache_lock:
+        old = _snapshots.pop(key, None)
+        if old is not None:
+            _cache_bytes -= len(old[1])
+        _snapshots[key] = (etag, body)
+        _cache_bytes += len(body)
+        while _cache_bytes > CATALOG_CACHE_MAX_BYTES:
+            _, (_, evicted) = _snapshots.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+def catalog_cache_stats() -> dict:
+    """Hit/miss counters of this process' catalog cache, plus its current size."""
+    with _cache_lock:
+        return {**_cache_stats, "entries": len(_snapshots), "bytes": _cache_bytes}
+
+# 304s are counted as hits: the response was answered without building it
+CACHE_LOOKUPS.add(lambda: {("catalog", "hit"): _cache_stats["hits"] + _cache_stats["not_modified"],
+                           ("catalog", "miss"): _cache_stats["misses"]})
+CACHE_ENTRIES.add(lambda: {("catalog",): len(_snapshots)})
+
+def versioned_json(tables, build):
+    """
+    Conditional, cached JSON GET keyed on the versions of the tables the response is read from.
+
+    Answers 304 with no body when If-None-Match still matches, serves the serialized body from
+    memory when this URL was already built at the current versions, and only otherwise calls
+    build() and serializes it. With the version listener connected, the first two need no
+    database round-trip at all.
+    """
+    versions = current_versions(tables)
+    etag = "-".join(str(versions[t]) for t in tables)
+
+    if request.if_none_match.contains(etag):
+        with _cache_lock:
+            _cache_stats["not_modified"] += 1
+        response = Response(status=304)
+    else:
+        key = request.full_path
+        body = _get_snapshot(key, etag)
+        with _cache_lock:
+            _cache_stats["hits" if body is not None else "misses"] += 1
+        if body is None:
+            # Built after the versions were read, so it is never older than the ETag it is stored under
+            body = jsonify(build()).get_data()
+            _put_snapshot(key, etag, body)
+        response = Response(body, mimetype="application/json")
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = VERSIONED_CACHE_CONTROL
+    return response
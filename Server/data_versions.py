@@ -0,0 +1,185 @@
+"""
+Per-table data versions: bumped by database triggers, announced with NOTIFY, and tracked in memory
+by a LISTEN thread in each process so that checking them normally costs no database round-trip.
+"""
+
+import os
+import re
+import select
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from models import db, DataVersion
+from db_config import pgbouncer_mode
+
+# Tables whose writes bump data_versions. Triggers catch every writer (routes, bulk import, jobs, scripts).
+VERSIONED_TABLES = ['food_items', 'categories', 'sensitivities', 'textures', 'diets']
+
+# NOTIFY channel carrying '<table>:<version>' after each committed write to a versioned table
+VERSION_CHANNEL = 'data_versions'
+
+# Seconds between keep-alive checks of the LISTEN connection, and before reconnecting after it drops
+VERSION_LISTEN_TIMEOUT = float(os.environ.get("VERSION_LISTEN_TIMEOUT", 30))
+VERSION_LISTEN_RETRY = float(os.environ.get("VERSION_LISTEN_RETRY", 5))
+
+BUMP_FUNCTION_BODY = f"""
+DECLARE
+    new_version BIGINT;
+BEGIN
+    INSERT INTO data_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = data_versions.version + 1
+    RETURNING version INTO new_version;
+    -- Delivered to listeners only when the writing transaction commits
+    PERFORM pg_notify('{VERSION_CHANNEL}', TG_TABLE_NAME || ':' || new_version);
+    RETURN NULL;
+END
+"""
+
+def install_version_triggers() -> None:
+    """Creates (or updates) the trigger function and one statement-level trigger per versioned table, if needed. Caller commits."""
+    source = db.session.execute(text("SELECT prosrc FROM pg_proc WHERE proname = 'bump_data_version'")).scalar()
+    if source is None or source.strip() != BUMP_FUNCTION_BODY.strip():
+        db.session.execute(text(
+            f"CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$\n{BUMP_FUNCTION_BODY}$$ LANGUAGE plpgsql"
+        ))
+
+    for table in VERSIONED_TABLES:
+        # duplicate_object: already installed, or another worker starting up at the same time created it first
+        db.session.execute(text(f"""
+            DO $$ BEGIN
+                CREATE TRIGGER {table}_bump_data_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+            EXCEPTION WHEN duplicate_object THEN NULL;
+            END $$
+        """))
+
+def fetch_versions(tables) -> dict:
+    """Current version of each table, read from the database (0 for tables never written)."""
+    rows = db.session.query(DataVersion.table_name, DataVersion.version).filter(DataVersion.table_name.in_(list(tables))).all()
+    versions = dict.fromkeys(tables, 0)
+    versions.update(dict(rows))
+    return versions
+
+# ── In-memory versions ───────────────────────────────────────────────────────
+# Kept current by the LISTEN thread. Trusted only while that thread is connected; otherwise
+# current_versions() falls back to reading the table.
+_versions_lock = threading.Lock()
+_known_versions = {}
+_listening = False
+_listener_thread = None
+
+def _remember_versions(versions: dict) -> None:
+    """Merges versions into the in-memory map. Versions only move forward, whatever order updates arrive in."""
+    with _versions_lock:
+        for table, version in versions.items():
+            _known_versions[table] = max(_known_versions.get(table, 0), version)
+
+def _listen(engine) -> None:
+    """LISTEN thread: applies every version NOTIFY to the in-memory map, reconnecting if the connection drops."""
+    global _listening
+    while True:
+        fairy = None
+        try:
+            # A dedicated connection, detached so it never goes back to the pool
+            fairy = engine.raw_connection()
+            conn = fairy.driver_connection
+            fairy.detach()
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {VERSION_CHANNEL}")
+            # Read the table only after LISTEN, so no write can fall between the two
+            cursor.execute("SELECT table_name, version FROM data_versions")
+            with _versions_lock:
+                _known_versions.clear()
+                _known_versions.update(dict.fromkeys(VERSIONED_TABLES, 0))
+            _remember_versions(dict(cursor.fetchall()))
+            _listening = True
+
+            while True:
+                if select.select([conn], [], [], VERSION_LISTEN_TIMEOUT) == ([], [], []):
+                    cursor.execute("SELECT 1")   # Keep-alive; raises if the connection is gone
+                    continue
+                conn.poll()
+                updates = {}
+                while conn.notifies:
+                    table, _, version = conn.notifies.pop(0).payload.partition(':')
+                    updates[table] = max(updates.get(table, 0), int(version))
+                _remember_versions(updates)
+        except Exception as e:
+            print(f"[Data versions] Listener disconnected: {e}")
+        finally:
+            _listening = False
+            if fairy is not None:
+                try:
+                    fairy.close()
+                except Exception:
+                    pass
+        time.sleep(VERSION_LISTEN_RETRY)
+
+def _listener_engine(engine):
+    """
+    Engine for the LISTEN connection. PgBouncer in transaction mode hands each transaction to any
+    server connection, so notifications need DATABASE_DIRECT_URL; without it there is no listener
+    and versions are read from the table.
+    """
+    if not pgbouncer_mode():
+        return engine
+    direct_url = os.environ.get("DATABASE_DIRECT_URL")
+    return create_engine(direct_url, poolclass=NullPool) if direct_url else None
+
+def start_version_listener(engine) -> None:
+    """Starts this process' LISTEN thread unless it is already running (or cannot run, see _listener_engine)."""
+    global _listener_thread
+    with _versions_lock:
+        if _listener_thread is None or not _listener_thread.is_alive():
+            listen_engine = _listener_engine(engine)
+            if listen_engine is None:
+                return
+            _listener_thread = threading.Thread(target=_listen, args=(listen_engine,), name="data-version-listener", daemon=True)
+            _listener_thread.start()
+
+def current_versions(tables) -> dict:
+    """
+    Current version of each table. Served from memory while the LISTEN thread is connected;
+    tables it has no trusted value for (listener down, or just written by this process) are read
+    from the database in one query. Must run inside an app context.
+    """
+    start_version_listener(db.engine)
+    with _versions_lock:
+        if _listening and all(t in _known_versions for t in tables):
+            return {t: _known_versions[t] for t in tables}
+    versions = fetch_versions(tables)
+    if _listening:
+        _remember_versions(versions)
+    return versions
+
+# ── Read-your-writes within a process ────────────────────────────────────────
+# NOTIFY reaches the listener shortly after a commit. So that a request reading right after a
+# write in the same process never sees the old version, writes drop the in-memory versions at
+# commit time; the next read fetches them from the database. Writes are spotted at the cursor, so
+# raw text() statements (bulk import, migrations) count as much as ORM flushes and bulk updates.
+# (WITH: a CTE may modify data; a read-only one only costs the next reader one query)
+_WRITE_STATEMENT = re.compile(r"\s*(INSERT|UPDATE|DELETE|TRUNCATE|MERGE|WITH)\b", re.IGNORECASE)
+_writes = threading.local()   # A scoped session executes and commits on the same thread
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _note_write(conn, cursor, statement, parameters, context, executemany):
+    if _WRITE_STATEMENT.match(statement):
+        _writes.pending = True
+
+@event.listens_for(Session, 'after_commit')
+def _forget_versions_after_write(session):
+    if getattr(_writes, 'pending', False):
+        _writes.pending = False
+        with _versions_lock:
+            for table in VERSIONED_TABLES:
+                _known_versions.pop(table, None)
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_write_flag(session):
+    _writes.pending = False
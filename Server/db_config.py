@@ -0,0 +1,74 @@
+"""
+Database engine configuration from the environment: connection pooling, PgBouncer compatibility
+and statement timeouts.
+
+    DB_POOL_SIZE             connections kept open per process (default 5)
+    DB_MAX_OVERFLOW          extra connections allowed under load, closed when returned (default 10)
+    DB_POOL_TIMEOUT          seconds to wait for a free connection before failing (default 30)
+    DB_POOL_RECYCLE          seconds after which a connection is replaced, before the server or a
+                             proxy drops it as idle (default 1800)
+    DB_POOL_PRE_PING         test connections on checkout, replacing dead ones (default true)
+    DB_PGBOUNCER             true when DATABASE_URL points at PgBouncer in transaction mode: no
+                             pooling in the app (PgBouncer pools) and only transaction-scoped
+                             settings (default false)
+    DATABASE_DIRECT_URL      with DB_PGBOUNCER: a direct (non-pooled) URL for the data version
+                             LISTEN connection, which PgBouncer cannot carry
+    DB_STATEMENT_TIMEOUT_MS  cancel statements of web requests running longer than this (default 0,
+                             off). Background jobs and migrations are not limited.
+"""
+
+import os
+from flask import has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool, QueuePool
+
+from request_metrics import record_pool_wait
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).lower() == "true"
+
+def pgbouncer_mode() -> bool:
+    """True when the app connects through PgBouncer in transaction pooling mode."""
+    return _env_bool("DB_PGBOUNCER", False)
+
+def statement_timeout_ms() -> int:
+    return int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+
+class _TimedGet:
+    """Pool mixin: reports the time spent getting a connection (waiting for one, or opening one) to the request metrics."""
+
+    def _do_get(self):
+        with record_pool_wait():
+            return super()._do_get()
+
+class TimedQueuePool(_TimedGet, QueuePool):
+    pass
+
+class TimedNullPool(_TimedGet, NullPool):
+    pass
+
+def engine_options() -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured pooling mode."""
+    if pgbouncer_mode():
+        # PgBouncer already pools server connections; a second pool here would only pin them.
+        # Each checkout opens a fresh client connection to PgBouncer, which is cheap.
+        return {"poolclass": TimedNullPool}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+@event.listens_for(Engine, "begin")
+def _limit_request_statements(conn):
+    """
+    Applies DB_STATEMENT_TIMEOUT_MS to transactions of web requests. Set per transaction (SET LOCAL),
+    which PgBouncer in transaction mode supports, unlike a session setting or a startup option.
+    """
+    timeout = statement_timeout_ms()
+    if timeout and has_request_context():
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout}")
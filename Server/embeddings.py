@@ -0,0 +1,532 @@
+"""Embedding helpers: the pluggable embedders (OpenAI or local), semantic text for products, the embedding and query caches, single and batched embedding calls, and the backfill and re-embedding jobs."""
+
+import os
+import re
+import time
+import zlib
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import load_only
+from openai import OpenAI
+from dotenv import load_dotenv
+
+from models import db, FoodItem, EmbeddingCache, Job
+from jobs import job_handler, enqueue_job, active_job, job_to_dict
+from metrics import CACHE_ENTRIES, CACHE_LOOKUPS, Counter, Histogram
+
+load_dotenv()
+api_key = os.environ.get("OPENAI_API_KEY")
+client = OpenAI(api_key=api_key) if api_key else None
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+
+# Backfill tuning: texts per embeddings request, and how many requests run at once
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 100))
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", 4))
+
+# FoodItem.embedding_status values
+EMBEDDING_READY = 'ready'
+EMBEDDING_PENDING = 'pending'
+EMBEDDING_FAILED = 'failed'
+
+# Number of embeddings kept in the in-memory LRU in front of the embedding_cache table
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 1000))
+
+# Search query embeddings kept per worker, keyed by normalized query text, and for how long (seconds)
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 2000))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 3600))
+
+EMBEDDING_CALLS = Counter("embedding_requests_total", "Embedding calls (one per batch) by embedder and outcome (ok, error).",
+                          ("embedder", "outcome"))
+EMBEDDING_SECONDS = Histogram("embedding_request_duration_seconds", "Duration of embedding calls by embedder.", ("embedder",))
+
+def ai_enabled() -> bool:
+    """True when the AI_ENABLED flag is set, i.e. product embeddings are real and not zero placeholders."""
+    return os.environ.get("AI_ENABLED", "false").lower() == "true"
+
+# ── Embedders ────────────────────────────────────────────────────────────────
+# EMBEDDER picks how text becomes a vector: 'openai' (default) or 'local', which needs no network
+# for offline / air-gapped deployments. Products and queries must be embedded by the same one:
+# each product records its embedder, and after a switch the backfill re-embeds the others.
+
+_FINAL_LETTERS = str.maketrans("ךםןףץ\u05be", "כמנפצ ")
+_NON_WORD = re.compile(r"[^\w]+")
+
+def normalize_text(text: str) -> str:
+    """
+    Text as compared for search: Unicode-normalized, lowercase, Hebrew points and cantillation
+    removed, final letters folded (ם = מ) and whitespace collapsed - the same folding the
+    lexical search applies in SQL (product_search.search_normalize).
+    """
+    text = "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+    return " ".join(text.translate(_FINAL_LETTERS).replace('"', '').replace("'", "").split())
+
+class OpenAIEmbedder:
+    """text-embedding-3-small through the OpenAI API (OPENAI_API_KEY, optional OPENAI_BASE_URL)."""
+    name = EMBEDDING_MODEL
+    persistent_cache = True   # API calls cost time and money: keep vectors in the embedding_cache table
+
+    def available(self) -> bool:
+        return client is not None
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+class HashingEmbedder:
+    """
+    Local CPU embedder: the words and character trigrams of the normalized text, hashed into
+    EMBEDDING_DIM signed buckets (feature hashing), counted with sublinear weights and
+    L2-normalized. Stateless - no vocabulary to fit or ship - and deterministic, so cosine
+    similarity ranks texts by shared words and word fragments (which also tolerates typos).
+    """
+    name = "local-hashed-ngrams-v1"
+    persistent_cache = False   # Recomputing is cheaper than a database round trip
+
+    def available(self) -> bool:
+        return True
+
+    @staticmethod
+    def _features(text: str):
+        for word in _NON_WORD.split(normalize_text(text)):
+            if not word:
+                continue
+            yield word
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = []
+        for text in texts:
+            hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in self._features(text)), dtype=np.int64)
+            # The low bits pick the bucket, one higher bit the sign, so collisions tend to cancel out
+            buckets = hashes % EMBEDDING_DIM
+            signs = np.where((hashes >> 20) & 1, 1.0, -1.0)
+            counts = np.bincount(buckets, weights=signs, minlength=EMBEDDING_DIM)
+            vector = np.sign(counts) * np.log1p(np.abs(counts))
+            norm = np.linalg.norm(vector)
+            vectors.append((vector / norm if norm else vector).tolist())
+        return vectors
+
+EMBEDDERS = {"openai": OpenAIEmbedder(), "local": HashingEmbedder()}
+
+def current_embedder():
+    """The embedder selected by the EMBEDDER environment variable."""
+    name = os.environ.get("EMBEDDER", "openai").lower()
+    if name not in EMBEDDERS:
+        raise RuntimeError(f"Unknown EMBEDDER '{name}' (expected one of: {', '.join(EMBEDDERS)})")
+    return EMBEDDERS[name]
+
+def embeddings_available() -> bool:
+    """True when products carry real embeddings and the configured embedder can embed queries."""
+    return ai_enabled() and current_embedder().available()
+
+# ── Embedding cache ──────────────────────────────────────────────────────────
+# Identical text always embeds to the same vector, so embeddings are cached by (model, SHA-256 of text):
+# an in-memory LRU per worker in front of the shared embedding_cache table.
+_cache_lock = threading.Lock()
+_memory_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_cache_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "query_hits": 0, "query_misses": 0}
+_query_cache: "OrderedDict[tuple[str, str], tuple[float, list[float]]]" = OrderedDict()
+
+def _content_hash(text: str) -> str:
+    """SHA-256 hex digest of the exact text sent to the embeddings API."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _remember(content_hash: str, vector) -> None:
+    """Adds a vector to the in-memory LRU (stored as float32 to keep it small), evicting the oldest entry."""
+    with _cache_lock:
+        _memory_cache[content_hash] = np.asarray(vector, dtype=np.float32)
+        _memory_cache.move_to_end(content_hash)
+        while len(_memory_cache) > EMBEDDING_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def lookup_cached_embeddings(texts: list[str]) -> list[list[float] | None]:
+    """
+    Returns the cached embedding for each text, or None where it has never been embedded.
+    Checks the in-memory LRU first, then fetches all remaining hashes from the database in one query.
+    """
+    embedder = current_embedder()
+    if not embedder.persistent_cache:
+        return [None] * len(texts)
+    hashes = [_content_hash(t) for t in texts]
+    results: list[list[float] | None] = [None] * len(texts)
+
+    missing = {}
+    with _cache_lock:
+        for i, h in enumerate(hashes):
+            vector = _memory_cache.get(h)
+            if vector is not None:
+                _memory_cache.move_to_end(h)
+                results[i] = vector.tolist()
+                _cache_stats["memory_hits"] += 1
+            else:
+                missing.setdefault(h, []).append(i)
+
+    db_hits = 0
+    if missing:
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(EmbeddingCache.content_hash, EmbeddingCache.embedding)
+                .where(EmbeddingCache.model == embedder.name, EmbeddingCache.content_hash.in_(list(missing)))
+            ).all()
+        for content_hash, vector in rows:
+            _remember(content_hash, vector)
+            for i in missing.pop(content_hash):
+                results[i] = [float(v) for v in vector]
+                db_hits += 1
+
+    with _cache_lock:
+        _cache_stats["db_hits"] += db_hits
+        _cache_stats["misses"] += sum(len(indexes) for indexes in missing.values())
+    return results
+
+def store_cached_embeddings(texts: list[str], vectors: list[list[float]]) -> None:
+    """Saves freshly computed embeddings to both cache layers. Uses its own transaction, so it never commits caller state."""
+    embedder = current_embedder()
+    if not embedder.persistent_cache:
+        return
+    rows = {}
+    for text, vector in zip(texts, vectors):
+        content_hash = _content_hash(text)
+        _remember(content_hash, vector)
+        rows[content_hash] = {"model": embedder.name, "content_hash": content_hash, "embedding": vector}
+    if not rows:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(insert(EmbeddingCache).values(list(rows.values())).on_conflict_do_nothing())
+
+def embedding_cache_stats() -> dict:
+    """Hit/miss counters of the embedding cache in this worker, plus the current LRU size."""
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["memory_entries"] = len(_memory_cache)
+        stats["query_entries"] = len(_query_cache)
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_ratio"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 4) if lookups else None
+    queries = stats["query_hits"] + stats["query_misses"]
+    stats["query_hit_ratio"] = round(stats["query_hits"] / queries, 4) if queries else None
+    stats["embedder"] = current_embedder().name
+    return stats
+
+CACHE_LOOKUPS.add(lambda: {
+    ("embedding", "hit"): _cache_stats["memory_hits"] + _cache_stats["db_hits"],
+    ("embedding", "miss"): _cache_stats["misses"],
+    ("query_embedding", "hit"): _cache_stats["query_hits"],
+    ("query_embedding", "miss"): _cache_stats["query_misses"],
+})
+CACHE_ENTRIES.add(lambda: {("embedding",): len(_memory_cache), ("query_embedding",): len(_query_cache)})
+
+def _embed(embedder, texts: list[str]) -> list[list[float]]:
+    """embedder.embed(texts), timed and counted for /metrics."""
+    started = time.perf_counter()
+    try:
+        vectors = embedder.embed(texts)
+    except Exception:
+        EMBEDDING_CALLS.inc(embedder=embedder.name, outcome="error")
+        raise
+    finally:
+        EMBEDDING_SECONDS.observe(time.perf_counter() - started, embedder=embedder.name)
+    EMBEDDING_CALLS.inc(embedder=embedder.name, outcome="ok")
+    return vectors
+
+def get_embedding(text):
+    """Helper function to generate an embedding for a given text with the configured embedder,
+    if it is not available (e.g. no OpenAI key) will fill zeroes"""
+    embedder = current_embedder()
+    if not embedder.available():
+        return [0.0] * EMBEDDING_DIM
+    cached = lookup_cached_embeddings([text])[0]
+    if cached is not None:
+        return cached
+    try:
+        embedding = _embed(embedder, [text])[0]
+    except Exception as e:
+        print(f"Embedding failed: {e}")
+        return [0.0] * EMBEDDING_DIM
+    store_cached_embeddings([text], [embedding])
+    return embedding
+
+def embed_query(text: str) -> list[float]:
+    """
+    Embedding of a search query. Queries repeat a lot, so embeddings are kept in a per-worker LRU
+    keyed by the normalized query text ("  Yogurt " and "yogurt" share one entry) for
+    QUERY_CACHE_TTL seconds. Failed embeddings (zeros) are not cached.
+
+    The key is only for lookup: the query is embedded as typed (whitespace collapsed), since
+    folding final letters or dropping quotes would misspell Hebrew for the OpenAI model.
+    Unlike product texts, queries never go to the shared embedding_cache table: it would keep
+    every string anyone searched for, forever.
+    """
+    embedder = current_embedder()
+    key = (embedder.name, normalize_text(text))
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _query_cache.get(key)
+        if entry is not None and entry[0] > now:
+            _query_cache.move_to_end(key)
+            _cache_stats["query_hits"] += 1
+            return entry[1]
+        _cache_stats["query_misses"] += 1
+
+    if not embedder.available():
+        return [0.0] * EMBEDDING_DIM
+    try:
+        vector = _embed(embedder, [" ".join(text.split())])[0]
+    except Exception as e:
+        print(f"Embedding failed: {e}")
+        return [0.0] * EMBEDDING_DIM
+    if any(vector):
+        with _cache_lock:
+            _query_cache[key] = (now + QUERY_CACHE_TTL, vector)
+            _query_cache.move_to_end(key)
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return vector
+
+def make_semantic_search_text_for_embedding(data: dict) -> str:
+    """
+    Builds a human-readable semantic sentence from product data
+    for use as OpenAI embedding input.
+    """
+    name        = data.get('name', '')
+    company     = data.get('company', '')
+    iddsi       = data.get('iddsi', 0)
+    calories    = data.get('calories', 0.0)
+    protein     = data.get('protein', 0.0)
+    carbs       = data.get('carbs', 0.0)
+    fat         = data.get('fat', 0.0)
+    sugars      = data.get('sugares', 0.0)
+    sodium      = data.get('sodium', 0.0)
+
+    contains    = data.get('contains', [])
+    may_contain = data.get('mayContain', [])
+    properties  = data.get('properties', [])
+
+    texture_notes = data.get('textureNotes', '')
+    allergy_notes = data.get('allergyNotes', '')
+    forbidden_for = data.get('forbiddenFor', '')
+
+    # Format list fields — fall back to readable "none" strings
+    contains_str    = ", ".join(contains)    if contains    else "ללא"
+    may_contain_str = ", ".join(may_contain) if may_contain else "ללא"
+    props_str       = ", ".join(properties)  if properties  else "רגיל"
+
+    parts = [
+        f"שם מוצר: {name}.",
+        f"חברה: {company}." if company else None,
+        f"מרקם IDDSI: {iddsi}.",
+        f"קלוריות: {calories} קק״ל, חלבון: {protein}g, פחמימות: {carbs}g, שומן: {fat}g, סוכר: {sugars}g, נתרן: {sodium}mg.",
+        f"מכיל ודאית: {contains_str}.",
+        f"עלול להכיל: {may_contain_str}.",
+        f"תכונות: {props_str}.",
+        f"הערות מרקם: {texture_notes}."  if texture_notes else None,
+        f"הערות אלרגיה: {allergy_notes}." if allergy_notes else None,
+        f"אסור עבור: {forbidden_for}."    if forbidden_for else None,
+    ]
+
+    return " ".join(p for p in parts if p)
+
+def build_product_embedding_pipeline(data: dict) -> list[float]:
+    """
+    Full pipeline: data dict → semantic sentence → OpenAI embedding vector.
+    """
+    # if there is no flag "AI_ENABLED" it will be false by default, so we won't generate embeddings.
+    if not ai_enabled():
+        return [0.0] * EMBEDDING_DIM
+
+
+    semantic_text = make_semantic_search_text_for_embedding(data)
+    print(f"[Embedding] Semantic text: {semantic_text}")   # helpful during dev
+    embedding = get_embedding(semantic_text)
+    return embedding
+
+def get_embeddings(texts: list[str]) -> list[list[float]]:
+    """
+    Embeds many texts with a single embeddings request (or local computation), preserving input order.
+    Unlike get_embedding, failures raise so callers never persist zero vectors by mistake.
+    """
+    return _embed(current_embedder(), texts)
+
+def product_embedding_data(p: FoodItem) -> dict:
+    """Maps a stored FoodItem back to the request-shaped dict used by make_semantic_search_text_for_embedding."""
+    return {
+        "name": p.name, "company": p.company, "iddsi": p.iddsi,
+        "calories": p.calories, "protein": p.protein, "carbs": p.carbs,
+        "fat": p.fat, "sugares": p.sugars, "sodium": p.sodium,
+        "contains": p.contains, "mayContain": p.may_contain,
+        "properties": p.properties, "textureNotes": p.texture_notes,
+        "allergyNotes": p.allergy_notes, "forbiddenFor": p.forbidden_for,
+    }
+
+def semantic_columns():
+    """Loader option for just the FoodItem columns that feed the semantic text (plus id and updated_at)."""
+    return load_only(
+        FoodItem.id, FoodItem.name, FoodItem.company, FoodItem.iddsi,
+        FoodItem.calories, FoodItem.protein, FoodItem.carbs, FoodItem.fat, FoodItem.sugars, FoodItem.sodium,
+        FoodItem.contains, FoodItem.may_contain, FoodItem.properties,
+        FoodItem.texture_notes, FoodItem.allergy_notes, FoodItem.forbidden_for,
+        FoodItem.updated_at,
+    )
+
+def missing_embedding_condition():
+    """
+    SQL condition matching products with no embedding, the all-zero placeholder, a pending/failed
+    refresh, or an embedding from another embedder than the configured one.
+    """
+    return or_(
+        FoodItem.openai_embedding.is_(None),
+        func.vector_norm(FoodItem.openai_embedding) == 0,
+        FoodItem.embedding_status != EMBEDDING_READY,
+        func.coalesce(FoodItem.embedding_model, EMBEDDING_MODEL) != current_embedder().name,
+    )
+
+def backfill_missing_embeddings(batch_size: int = EMBEDDING_BATCH_SIZE,
+                                concurrency: int = EMBEDDING_CONCURRENCY,
+                                after_id: int = 0,
+                                on_progress=None) -> dict:
+    """
+    Embeds every product that is missing an embedding. Must run inside an app context.
+
+    Products are read in id order, `batch_size * concurrency` rows at a time. Each round sends
+    `concurrency` batched embeddings requests in parallel and commits the results before the next
+    round, so the last committed id (passed to `on_progress(last_id, embedded)`) is a safe
+    checkpoint: passing it back as `after_id` resumes where a previous run stopped.
+    Texts found in the embedding cache are reused without an API call. Batches whose request
+    fails are left untouched and counted in `failed`.
+    """
+    if not embeddings_available():
+        raise RuntimeError("AI is disabled - set AI_ENABLED=true and OPENAI_API_KEY (or EMBEDDER=local) to generate embeddings")
+
+    stats = {"embedded": 0, "failed": 0, "last_id": after_id}
+    embedder_name = current_embedder().name
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            products = (
+                FoodItem.query.options(semantic_columns())
+                .filter(FoodItem.id > stats["last_id"], missing_embedding_condition())
+                .order_by(FoodItem.id)
+                .limit(batch_size * concurrency)
+                .all()
+            )
+            if not products:
+                break
+
+            texts = [make_semantic_search_text_for_embedding(product_embedding_data(p)) for p in products]
+            vectors = lookup_cached_embeddings(texts)
+
+            # Only texts the cache has never seen are sent to the API, in batches of `batch_size`
+            to_embed = [i for i, v in enumerate(vectors) if v is None]
+            batches = [to_embed[i:i + batch_size] for i in range(0, len(to_embed), batch_size)]
+            # Only the HTTP calls run in worker threads; all DB access stays on this thread
+            futures = [pool.submit(get_embeddings, [texts[i] for i in batch]) for batch in batches]
+
+            for batch, future in zip(batches, futures):
+                try:
+                    batch_vectors = future.result()
+                except Exception as e:
+                    print(f"[Embedding backfill] Batch starting at id {products[batch[0]].id} failed: {e}")
+                    stats["failed"] += len(batch)
+                    continue
+                store_cached_embeddings([texts[i] for i in batch], batch_vectors)
+                for i, v in zip(batch, batch_vectors):
+                    vectors[i] = v
+
+            # updated_at is passed through unchanged: refreshing an embedding is not a product edit
+            updates = [
+                {"id": p.id, "openai_embedding": v, "embedding_model": embedder_name,
+                 "embedding_status": EMBEDDING_READY, "updated_at": p.updated_at}
+                for p, v in zip(products, vectors) if v is not None
+            ]
+            if updates:
+                db.session.execute(update(FoodItem), updates)
+            db.session.commit()
+
+            stats["embedded"] += len(updates)
+            stats["last_id"] = products[-1].id
+            if on_progress:
+                on_progress(stats["last_id"], stats["embedded"])
+
+    return stats
+
+EMBEDDING_BACKFILL_JOB = 'embedding_backfill'
+REEMBED_JOB = 'reembed_products'
+
+@job_handler(EMBEDDING_BACKFILL_JOB)
+def _run_backfill_job(job) -> dict:
+    """Job handler: backfill_missing_embeddings with its checkpoint reported as job progress."""
+    def on_progress(last_id, embedded):
+        job.report_progress(last_id=last_id, embedded=embedded)
+    return backfill_missing_embeddings(on_progress=on_progress)
+
+def backfill_status() -> dict | None:
+    """The most recent embedding backfill job, or None if none was ever started."""
+    job = Job.query.filter_by(kind=EMBEDDING_BACKFILL_JOB).order_by(Job.id.desc()).first()
+    return job_to_dict(job) if job else None
+
+def start_background_backfill() -> Job | None:
+    """
+    Queues a backfill job so no request waits on the embeddings API. Returns the queued (or
+    already queued/running) job, or None if AI is disabled. Must run inside an app context.
+    """
+    if not embeddings_available():
+        return None
+    return active_job(EMBEDDING_BACKFILL_JOB) or enqueue_job(EMBEDDING_BACKFILL_JOB)
+
+# ── Re-embedding ─────────────────────────────────────────────────────────────
+# Product writes only mark rows as pending and queue a job for their ids. Rows left pending
+# by a job that failed for good are picked up by the next backfill.
+
+def reembed_products(product_ids) -> int:
+    """
+    Re-embeds the given products from their current data and marks them ready (or failed).
+    A row edited again after it was read here is skipped - that edit queued its own refresh.
+    Returns the number of products updated. Must run inside an app context.
+    """
+    products = FoodItem.query.options(semantic_columns()).filter(FoodItem.id.in_(list(product_ids))).all()
+    if not products:
+        return 0
+
+    texts = [make_semantic_search_text_for_embedding(product_embedding_data(p)) for p in products]
+    vectors = lookup_cached_embeddings(texts)
+    to_embed = [i for i, v in enumerate(vectors) if v is None]
+    if to_embed:
+        try:
+            fresh = get_embeddings([texts[i] for i in to_embed])
+            store_cached_embeddings([texts[i] for i in to_embed], fresh)
+            for i, v in zip(to_embed, fresh):
+                vectors[i] = v
+        except Exception as e:
+            print(f"[Embedding refresh] Failed for products {[products[i].id for i in to_embed]}: {e}")
+
+    for p, vector in zip(products, vectors):
+        # updated_at is written back unchanged: refreshing an embedding is not a product edit
+        values = {"embedding_status": EMBEDDING_FAILED, "updated_at": FoodItem.updated_at}
+        if vector is not None:
+            values.update(openai_embedding=vector, embedding_model=current_embedder().name, embedding_status=EMBEDDING_READY)
+        db.session.execute(
+            update(FoodItem)
+            .where(FoodItem.id == p.id, FoodItem.updated_at == p.updated_at)
+            .values(**values)
+        )
+    db.session.commit()
+    return len(products)
+
+@job_handler(REEMBED_JOB)
+def _run_reembed_job(job) -> dict:
+    """Job handler: re-embeds the products listed in the payload."""
+    return {"updated": reembed_products(job.payload.get("product_ids", []))}
+
+def enqueue_reembed(product_ids) -> None:
+    """Queues products for asynchronous re-embedding. Must run inside an app context."""
+    if product_ids:
+        enqueue_job(REEMBED_JOB, {"product_ids": list(product_ids)})
@@ -0,0 +1,166 @@
+"""Product image transfer helpers: pooled, concurrent image downloads and content-addressed storage for export/import."""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import Histogram
+
+# Export image fetching: parallel downloads, retries per image, per-request timeout (seconds),
+# and the total time budget (seconds) after which remaining images are left as plain URLs
+IMAGE_FETCH_WORKERS = int(os.environ.get("IMAGE_FETCH_WORKERS", 8))
+IMAGE_FETCH_RETRIES = int(os.environ.get("IMAGE_FETCH_RETRIES", 2))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get("IMAGE_FETCH_TIMEOUT", 5))
+IMAGE_FETCH_BUDGET = float(os.environ.get("IMAGE_FETCH_BUDGET", 120))
+
+STORAGE_UPLOAD_SECONDS = Histogram("storage_upload_duration_seconds",
+                                   "Duration of Supabase Storage uploads by source (import, api) and outcome (ok, duplicate, error).",
+                                   ("source", "outcome"))
+
+def observe_upload(source: str, started: float, outcome: str) -> None:
+    """Records a storage upload that began at `started` (time.perf_counter()) in /metrics."""
+    STORAGE_UPLOAD_SECONDS.observe(time.perf_counter() - started, source=source, outcome=outcome)
+
+def make_http_session(pool_size: int = IMAGE_FETCH_WORKERS, retries: int = IMAGE_FETCH_RETRIES) -> requests.Session:
+    """A requests Session whose connection pool fits `pool_size` threads, retrying transient failures with backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _download(session: requests.Session, url: str, timeout: float) -> bytes | None:
+    """Downloads one image, returning None (and logging) on any failure."""
+    try:
+        resp = session.get(url, timeout=timeout)
+        if resp.status_code == 200:
+            return resp.content
+        print(f"Failed to fetch image: {url} -> HTTP {resp.status_code}")
+    except Exception as e:
+        print(f"Failed to fetch image: {url} -> {e}")
+    return None
+
+def fetch_images(items, workers: int = IMAGE_FETCH_WORKERS, budget: float = IMAGE_FETCH_BUDGET,
+                 timeout: float = IMAGE_FETCH_TIMEOUT):
+    """
+    Downloads images concurrently through one pooled session.
+
+    `items` is an iterable of (key, url) pairs and is consumed lazily on the calling thread, so
+    it may be a database cursor. Yields (key, url, content) in completion order, with content=None
+    for failed downloads. At most 2 * workers downloads are in memory at once. Once `budget`
+    seconds have passed no new downloads start, and the remaining items are yielded with None.
+    """
+    deadline = time.monotonic() + budget
+    items = iter(items)
+    with make_http_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < workers * 2:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                key, url = item
+                if time.monotonic() >= deadline:
+                    yield key, url, None
+                    continue
+                in_flight[pool.submit(_download, session, url, timeout)] = (key, url)
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, url = in_flight.pop(future)
+                yield key, url, future.result()
+
+def image_extension(url_or_path: str) -> str:
+    """File extension of an image URL or archive path, falling back to 'jpg' for odd or query-string URLs."""
+    ext = url_or_path.split('.')[-1]
+    if len(ext) > 4 or '?' in ext or '/' in ext: ext = 'jpg'
+    return ext.lower()
+
+def content_address(content: bytes, ext: str) -> str:
+    """Content-addressed file name: identical image bytes always map to the same '<sha256>.<ext>' name."""
+    return f"{hashlib.sha256(content).hexdigest()}.{ext}"
+
+_CONTENT_ADDRESS = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,4}$')
+
+def content_addressed_name(url: str) -> str | None:
+    """The '<sha256>.<ext>' name a URL already ends in (images uploaded by an import), or None."""
+    name = url.split('?')[0].rsplit('/', 1)[-1].lower()
+    return name if _CONTENT_ADDRESS.match(name) else None
+
+class ContentAddressedUploader:
+    """
+    Uploads images to a Supabase Storage bucket under their content address.
+
+    An image whose object already exists - from an earlier import, or earlier in this one - is
+    referenced instead of being transferred again. Tracks how many images were uploaded vs. reused
+    and how many bytes were saved.
+    """
+
+    def __init__(self, supabase, bucket: str = "products"):
+        self.storage = supabase.storage.from_(bucket)
+        self.session = make_http_session()
+        self._known = {}  # object name -> public URL, for objects confirmed to exist
+        self._lock = threading.Lock()
+        self.stats = {"images_uploaded": 0, "images_reused": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+
+    def _count(self, key: str, size: int) -> None:
+        with self._lock:
+            if key == "reused":
+                self.stats["images_reused"] += 1
+                self.stats["bytes_saved"] += size
+            else:
+                self.stats["images_uploaded"] += 1
+                self.stats["bytes_uploaded"] += size
+
+    def _exists(self, public_url: str) -> bool:
+        """True when the object is already in the (public) bucket - a HEAD request, no body transferred."""
+        try:
+            return self.session.head(public_url, timeout=IMAGE_FETCH_TIMEOUT).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def upload(self, content: bytes, ext: str) -> str:
+        """Stores the image if the bucket does not have it yet and returns its public URL."""
+        name = content_address(content, ext)
+        with self._lock:
+            known_url = self._known.get(name)
+        if known_url:
+            self._count("reused", len(content))
+            return known_url
+
+        public_url = self.storage.get_public_url(name)
+        if self._exists(public_url):
+            self._count("reused", len(content))
+        else:
+            mime_type = f"image/{ext}" if ext != 'jpg' else 'image/jpeg'
+            started = time.perf_counter()
+            try:
+                self.storage.upload(path=name, file=content, file_options={"content-type": mime_type})
+                observe_upload("import", started, "ok")
+                self._count("uploaded", len(content))
+            except Exception as e:
+                # A concurrent import may have created the same object in the meantime
+                if "Duplicate" not in str(e) and "already exists" not in str(e):
+                    observe_upload("import", started, "error")
+                    raise
+                observe_upload("import", started, "duplicate")
+                self._count("reused", len(content))
+
+        with self._lock:
+            self._known[name] = public_url
+        return public_url
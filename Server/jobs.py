@@ -0,0 +1,260 @@
+"""Postgres-backed background jobs: enqueueing, claiming with SKIP LOCKED, progress reporting and the worker loop."""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, or_
+
+from models import db, Job
+
+# Job.status values
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+# Seconds an idle worker waits before polling for new jobs again
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+# A running job refreshes heartbeat_at this often; one silent for JOB_STALE_AFTER seconds lost its worker
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", 15))
+JOB_STALE_AFTER = float(os.environ.get("JOB_STALE_AFTER", 120))
+# Jobs whose worker died are retried until they have been started this many times
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+
+# Files uploaded to and produced by jobs (import archives, export archives) are kept on disk here,
+# not in the database. With a separate worker process it must be a directory the web processes
+# and the worker share (a shared volume).
+JOB_FILES_DIR = os.environ.get("JOB_FILES_DIR", os.path.join(tempfile.gettempdir(), "job_files"))
+# Produced files are deleted after this many hours (checked whenever a job attaches a new one)
+JOB_FILE_RETENTION_HOURS = float(os.environ.get("JOB_FILE_RETENTION_HOURS", 24))
+
+def in_process_worker_enabled() -> bool:
+    """
+    True (the default) when web processes run a worker thread themselves. Deployments that
+    cannot keep threads alive after a response (serverless) set JOB_WORKER_IN_PROCESS=false
+    and run `python worker.py` instead.
+    """
+    return os.environ.get("JOB_WORKER_IN_PROCESS", "true").lower() == "true"
+
+# kind -> handler(job: RunningJob) -> JSON-serializable result
+_handlers = {}
+
+def job_handler(kind: str):
+    """Registers the decorated function as the handler for jobs of this kind."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+class RunningJob:
+    """What a handler sees of its job. Every write uses its own short transaction, so it is visible immediately."""
+    def __init__(self, job_id: int, kind: str, payload: dict):
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload or {}
+
+    def input_path(self) -> str | None:
+        """Path of the file uploaded with the job, if any."""
+        with db.engine.connect() as conn:
+            name = conn.execute(select(Job.input_path).where(Job.id == self.id)).scalar()
+        return os.path.join(JOB_FILES_DIR, name) if name else None
+
+    def report_progress(self, **progress) -> None:
+        """Replaces the progress shown by GET /api/jobs/<id> (and counts as a heartbeat)."""
+        with db.engine.begin() as conn:
+            conn.execute(update(Job).where(Job.id == self.id).values(progress=progress, heartbeat_at=datetime.utcnow()))
+
+    def new_file(self):
+        """An open binary file in JOB_FILES_DIR to write the job's output to, then pass to attach_file()."""
+        os.makedirs(JOB_FILES_DIR, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=JOB_FILES_DIR, prefix=f"job_{self.id}_", suffix=".part", delete=False)
+
+    def attach_file(self, path: str) -> None:
+        """Records the file this job produced (written through new_file()), served by GET /api/jobs/<id>/file."""
+        name = f"job_{self.id}"
+        os.replace(path, os.path.join(JOB_FILES_DIR, name))
+        with db.engine.begin() as conn:
+            conn.execute(update(Job).where(Job.id == self.id).values(result_path=name))
+        prune_job_files()
+
+def job_file_path(job: Job) -> str | None:
+    """Where the file a job produced is stored, or None if it produced none."""
+    return os.path.join(JOB_FILES_DIR, job.result_path) if job.result_path else None
+
+def _spool_input(file) -> str:
+    """Copies an uploaded file (a werkzeug FileStorage or binary file object) to JOB_FILES_DIR. Returns its name there."""
+    os.makedirs(JOB_FILES_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=JOB_FILES_DIR, prefix="job_input_", delete=False) as out:
+        shutil.copyfileobj(getattr(file, 'stream', file), out)
+    return os.path.basename(out.name)
+
+def _remove_input(job_id: int) -> None:
+    """Deletes a finished job's uploaded file; it is never read again."""
+    with db.engine.connect() as conn:
+        name = conn.execute(select(Job.input_path).where(Job.id == job_id)).scalar()
+    if name:
+        try:
+            os.remove(os.path.join(JOB_FILES_DIR, name))
+        except FileNotFoundError:
+            pass
+
+def prune_job_files() -> int:
+    """
+    Deletes produced files (and leftovers of failed attempts, or inputs of jobs whose worker died)
+    older than JOB_FILE_RETENTION_HOURS.
+    """
+    cutoff = time.time() - JOB_FILE_RETENTION_HOURS * 3600
+    removed = 0
+    with os.scandir(JOB_FILES_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith("job_") and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+def job_to_dict(job: Job) -> dict:
+    """Serializes a Job for the API (files are never inlined)."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress or {},
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "createdAt": job.created_at.isoformat() if job.created_at else None,
+        "startedAt": job.started_at.isoformat() if job.started_at else None,
+        "finishedAt": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def enqueue_job(kind: str, payload: dict | None = None, input_file=None) -> Job:
+    """
+    Adds a job to the queue and commits. Must run inside an app context. input_file (an upload
+    or binary file object) is copied to JOB_FILES_DIR and deleted once the job has finished.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    input_path = _spool_input(input_file) if input_file is not None else None
+    job = Job(kind=kind, status=JOB_QUEUED, payload=payload or {}, progress={}, input_path=input_path)
+    db.session.add(job)
+    db.session.commit()
+    if in_process_worker_enabled():
+        start_worker_thread(current_app._get_current_object())
+    return job
+
+def active_job(kind: str) -> Job | None:
+    """The oldest queued or running job of this kind, used to avoid enqueueing duplicates."""
+    return (
+        Job.query.filter(Job.kind == kind, Job.status.in_([JOB_QUEUED, JOB_RUNNING]))
+        .order_by(Job.id)
+        .first()
+    )
+
+def requeue_stale_jobs() -> int:
+    """
+    Returns running jobs whose worker stopped sending heartbeats to the queue, or fails them once
+    they have used up JOB_MAX_ATTEMPTS. Returns the number of jobs touched.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+    stale = (Job.status == JOB_RUNNING) & or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < cutoff)
+    with db.engine.begin() as conn:
+        failed = conn.execute(
+            update(Job).where(stale, Job.attempts >= JOB_MAX_ATTEMPTS)
+            .values(status=JOB_FAILED, error="Worker stopped responding", finished_at=datetime.utcnow())
+        ).rowcount
+        requeued = conn.execute(update(Job).where(stale).values(status=JOB_QUEUED)).rowcount
+    return failed + requeued
+
+def claim_next_job(kinds=None) -> RunningJob | None:
+    """
+    Atomically marks the oldest queued job as running and returns it. FOR UPDATE SKIP LOCKED
+    lets any number of workers poll the same table without blocking or claiming a job twice.
+    """
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        query = select(Job.id).where(Job.status == JOB_QUEUED)
+        if kinds:
+            query = query.where(Job.kind.in_(list(kinds)))
+        job_id = conn.execute(query.order_by(Job.id).limit(1).with_for_update(skip_locked=True)).scalar()
+        if job_id is None:
+            return None
+        row = conn.execute(
+            update(Job).where(Job.id == job_id)
+            .values(status=JOB_RUNNING, started_at=now, heartbeat_at=now, attempts=Job.attempts + 1)
+            .returning(Job.id, Job.kind, Job.payload)
+        ).one()
+    return RunningJob(row.id, row.kind, row.payload)
+
+def _heartbeat(job_id: int, app, stop: threading.Event) -> None:
+    """Keeps heartbeat_at fresh while a handler runs, even through phases that report no progress."""
+    with app.app_context():
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(update(Job).where(Job.id == job_id, Job.status == JOB_RUNNING)
+                                 .values(heartbeat_at=datetime.utcnow()))
+            except Exception as e:
+                print(f"[Jobs] Heartbeat for job {job_id} failed: {e}")
+
+def run_job(job: RunningJob, app) -> None:
+    """Runs one claimed job to completion and records its result or error."""
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job.id, app, stop), name=f"job-{job.id}-heartbeat", daemon=True).start()
+    values = {}
+    try:
+        handler = _handlers.get(job.kind)
+        if handler is None:
+            raise RuntimeError(f"No handler registered for job kind '{job.kind}'")
+        values = {"status": JOB_SUCCEEDED, "result": handler(job)}
+    except Exception as e:
+        print(f"[Jobs] Job {job.id} ({job.kind}) failed: {e}")
+        db.session.rollback()
+        values = {"status": JOB_FAILED, "error": str(e)}
+    finally:
+        stop.set()
+        db.session.remove()
+        values["finished_at"] = datetime.utcnow()
+        with db.engine.begin() as conn:
+            conn.execute(update(Job).where(Job.id == job.id).values(**values))
+        _remove_input(job.id)
+
+def work(app, kinds=None, once: bool = False) -> int:
+    """
+    Worker loop: claims and runs jobs until the queue is empty (once=True) or forever.
+    Returns the number of jobs run.
+    """
+    ran = 0
+    with app.app_context():
+        while True:
+            try:
+                requeue_stale_jobs()
+                job = claim_next_job(kinds)
+            except Exception as e:
+                print(f"[Jobs] Could not poll the job queue: {e}")
+                job = None
+            if job is None:
+                if once:
+                    return ran
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+            run_job(job, app)
+            ran += 1
+
+# In-process worker: one daemon thread per web process, started by the first enqueue
+_worker_lock = threading.Lock()
+_worker_thread = None
+
+def start_worker_thread(app) -> None:
+    """Starts this process' job worker thread unless it is already running."""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=work, args=(app,), name="job-worker", daemon=True)
+            _worker_thread.start()
@@ -0,0 +1,83 @@
+"""
+Server-computed meal nutrition: Meal.total_* is the sum of its items' nutrients times their
+quantity, kept current with set-based UPDATEs whenever a meal's items or a product's nutrients change.
+"""
+
+from sqlalchemy import text
+
+from models import db
+
+# FoodItem nutrient column -> the Meal total kept in sync with it
+TOTAL_COLUMNS = {
+    "calories": "total_calories",
+    "protein": "total_protein",
+    "carbs": "total_carbs",
+    "fat": "total_fat",
+    "sugars": "total_sugars",
+    "sodium": "total_sodium",
+}
+
+# Stored totals further than this from the recomputed ones are reported as inconsistent
+TOTALS_TOLERANCE = 1e-6
+
+def _computed_totals_sql(meal_ids) -> str:
+    """
+    One row per meal with its totals computed from meal_items (meals without items total 0),
+    restricted to :meal_ids unless meal_ids is None. The filter is left out rather than written as
+    ':ids IS NULL OR ...' so that a filtered recompute stays an index lookup.
+    """
+    where = "WHERE m.id = ANY(CAST(:meal_ids AS INTEGER[]))" if meal_ids is not None else ""
+    return f"""
+        SELECT m.id, {", ".join(f"COALESCE(sum(f.{n} * mi.quantity), 0) AS {t}" for n, t in TOTAL_COLUMNS.items())}
+        FROM meals m
+        LEFT JOIN meal_items mi ON mi.meal_id = m.id
+        LEFT JOIN food_items f ON f.id = mi.food_item_id
+        {where}
+        GROUP BY m.id
+    """
+
+def meals_using_products(product_ids) -> list[int]:
+    """IDs of the meals that contain any of the given products (an index lookup on meal_items)."""
+    return list(db.session.execute(text(
+        "SELECT DISTINCT meal_id FROM meal_items WHERE food_item_id = ANY(CAST(:ids AS INTEGER[])) ORDER BY meal_id"
+    ), {"ids": list(product_ids)}).scalars())
+
+def recompute_meal_totals(meal_ids=None, product_ids=None) -> int:
+    """
+    Recomputes the totals of the given meals, of the meals that use any of the given products,
+    or of every meal when both are None - with one UPDATE. Only meals whose totals actually
+    change are written. Returns the number of meals updated.
+    """
+    if product_ids is not None:
+        meal_ids = set(meal_ids or ()) | set(meals_using_products(product_ids))
+    stored = ", ".join(f"meals.{t}" for t in TOTAL_COLUMNS.values())
+    computed = ", ".join(f"c.{t}" for t in TOTAL_COLUMNS.values())
+    return db.session.execute(text(f"""
+        UPDATE meals
+        SET {", ".join(f"{t} = c.{t}" for t in TOTAL_COLUMNS.values())}
+        FROM ({_computed_totals_sql(meal_ids)}) c
+        WHERE meals.id = c.id AND ({stored}) IS DISTINCT FROM ({computed})
+    """), {"meal_ids": list(meal_ids) if meal_ids is not None else None}).rowcount
+
+def inconsistent_meals(meal_ids=None) -> list[dict]:
+    """
+    Consistency check: meals whose stored totals differ from their products' current nutrients,
+    as [{"id", "stored": {...}, "computed": {...}}] ordered by meal id.
+    """
+    mismatch = " OR ".join(
+        f"abs(COALESCE(m.{t}, 0) - c.{t}) > :tolerance" for t in TOTAL_COLUMNS.values()
+    )
+    rows = db.session.execute(text(f"""
+        SELECT m.id, {", ".join(f"m.{t} AS stored_{t}, c.{t} AS computed_{t}" for t in TOTAL_COLUMNS.values())}
+        FROM meals m JOIN ({_computed_totals_sql(meal_ids)}) c ON c.id = m.id
+        WHERE {mismatch}
+        ORDER BY m.id
+    """), {"meal_ids": list(meal_ids) if meal_ids is not None else None, "tolerance": TOTALS_TOLERANCE}).mappings()
+    return [
+        {
+            "id": row["id"],
+            "stored": {n: row[f"stored_{t}"] for n, t in TOTAL_COLUMNS.items()},
+            "computed": {n: row[f"computed_{t}"] for n, t in TOTAL_COLUMNS.items()},
+        }
+        for row in rows
+    ]
@@ -0,0 +1,221 @@
+"""
+Constraint-based meal suggestions: assembles meals of N distinct products that satisfy allergen,
+texture and diet restrictions and land inside nutrient target ranges.
+
+The catalog is held in memory as NumPy arrays (one row per product), rebuilt only when the
+food_items data version changes. Restrictions become one boolean mask over those arrays, and the
+meals are found with a beam search: each step extends the best partial meals by every candidate
+at once, scoring all extensions in a single vectorized pass.
+"""
+
+import threading
+import numpy as np
+from sqlalchemy import text
+
+from models import db, Diet
+from allergen_masks import sensitivity_mask
+from data_versions import current_versions
+
+# Nutrient order of the arrays, and the FoodItem column for each
+NUTRIENTS = ["calories", "protein", "carbs", "fat", "sugars", "sodium"]
+
+# Bounds on the request
+MIN_MEAL_SIZE = 1
+MAX_MEAL_SIZE = 6
+MAX_SUGGESTIONS = 50
+# Search effort: the candidates searched (those closest to their share of the targets) and the
+# partial meals kept per step. Larger finds better meals, smaller is faster.
+SEARCH_CANDIDATES = 2000
+BEAM_WIDTH = 64
+
+class SuggestionError(ValueError):
+    """Invalid suggestion request (reported to the client as a 400)."""
+
+class CatalogSnapshot:
+    """The numeric columns the engine needs, for every product, as parallel NumPy arrays (ordered by id)."""
+
+    def __init__(self, rows):
+        columns = list(zip(*rows)) or [()] * (3 + len(NUTRIENTS))
+        self.ids = np.array(columns[0], dtype=np.int64)
+        self.iddsi = np.array(columns[1], dtype=np.int64)
+        self.contains_mask = np.array(columns[2], dtype=np.int64)
+        self.may_contain_mask = np.array(columns[3], dtype=np.int64)
+        self.nutrients = np.array(columns[4:], dtype=np.float64).T.reshape(-1, len(NUTRIENTS))
+
+_snapshot_lock = threading.Lock()
+_snapshot = (None, None)   # (food_items version, CatalogSnapshot)
+
+def catalog_snapshot() -> CatalogSnapshot:
+    """The in-memory catalog, reloaded with one query when food_items has changed since it was built."""
+    global _snapshot
+    version = current_versions(('food_items',))['food_items']
+    with _snapshot_lock:
+        if _snapshot[0] == version:
+            return _snapshot[1]
+    rows = db.session.execute(text(f"""
+        SELECT id, COALESCE(iddsi, -1), contains_mask, may_contain_mask,
+               {", ".join(f"COALESCE({n}, 0)" for n in NUTRIENTS)}
+        FROM food_items ORDER BY id
+    """)).all()
+    snapshot = CatalogSnapshot(rows)
+    with _snapshot_lock:
+        _snapshot = (version, snapshot)
+    return snapshot
+
+def _matching_ids(condition: str, params: dict) -> np.ndarray:
+    """IDs of the products matching a SQL condition on food_items (the JSONB name tests, served by the GIN indexes)."""
+    return np.array(db.session.execute(text(f"SELECT id FROM food_items WHERE {condition}"), params).scalars().all(),
+                    dtype=np.int64)
+
+def _candidate_mask(catalog: CatalogSnapshot, exclude_ids, show_may_contain, iddsi_min, iddsi_max, diet_name) -> np.ndarray:
+    """Boolean array: the products allowed by the restrictions (same semantics as the catalog filters)."""
+    allowed = np.ones(len(catalog.ids), dtype=bool)
+    if exclude_ids:
+        mask, names = sensitivity_mask(exclude_ids)
+        if mask:
+            allowed &= (catalog.contains_mask & mask) == 0
+            if not show_may_contain:
+                allowed &= (catalog.may_contain_mask & mask) == 0
+        if names:
+            # Sensitivities without a mask bit: name matching, as in the catalog filters
+            columns = ["contains"] + ([] if show_may_contain else ["may_contain"])
+            condition = " OR ".join(f"{c} ?| CAST(:names AS TEXT[])" for c in columns)
+            allowed &= ~np.isin(catalog.ids, _matching_ids(condition, {"names": names}))
+    if iddsi_min is not None:
+        allowed &= catalog.iddsi >= iddsi_min
+    if iddsi_max is not None:
+        allowed &= catalog.iddsi <= iddsi_max
+    if diet_name:
+        condition = "properties @> jsonb_build_array(CAST(:name AS TEXT)) OR properties @> jsonb_build_array(lower(:name))"
+        allowed &= np.isin(catalog.ids, _matching_ids(condition, {"name": diet_name.strip()}))
+    return allowed
+
+def _parse_targets(targets: dict):
+    """{nutrient: {"min", "max"}} -> (column indexes, lower bounds, upper bounds) arrays."""
+    columns, lower, upper = [], [], []
+    for nutrient, bounds in (targets or {}).items():
+        if nutrient not in NUTRIENTS:
+            raise SuggestionError(f"Unknown nutrient target: {nutrient}")
+        lo = float(bounds.get('min', 0.0) or 0.0)
+        hi = float(bounds['max']) if bounds.get('max') is not None else np.inf
+        if hi < lo:
+            raise SuggestionError(f"Target for {nutrient} has max below min")
+        columns.append(NUTRIENTS.index(nutrient))
+        lower.append(lo)
+        upper.append(hi)
+    return np.array(columns, dtype=np.int64), np.array(lower), np.array(upper)
+
+def _score(totals, lower, upper) -> np.ndarray:
+    """
+    How far meal totals are from the target ranges: the squared relative miss summed over the
+    targets, 0 inside every range, plus a small pull towards the middle of each range that breaks
+    ties between meals that all fit. `totals` is (targets, ...); one target is scored at a time so
+    every operation runs over a long contiguous array.
+    """
+    score = np.zeros(totals.shape[1:], dtype=np.float32)
+    for t, lo, hi in zip(totals, lower, upper):
+        # Misses are measured relative to the target, so 10 mg of sodium and 10 kcal are not weighed alike
+        scale = max(hi if np.isfinite(hi) else lo, 1.0)
+        if np.isfinite(hi):
+            distance = np.abs(t - (lo + hi) / 2)
+            miss = np.maximum(distance - (hi - lo) / 2, 0.0)
+        else:
+            distance = lo - t
+            miss = np.maximum(distance, 0.0)
+            distance = np.abs(distance)
+        score += (miss / scale) ** 2 + 1e-3 * distance / scale
+    return score
+
+def _prune(nutrients: np.ndarray, size: int, lower, upper, keep: int) -> np.ndarray:
+    """
+    Indexes of the `keep` candidates that best fit their share (1/size) of the targets. Products
+    that alone exceed an upper bound are dropped first, as no fitting meal can contain them.
+    """
+    candidates = np.flatnonzero((nutrients <= upper).all(axis=1))
+    if len(candidates) <= keep:
+        return candidates
+    share = _score(nutrients[candidates].T * size, lower, upper)
+    return candidates[np.argpartition(share, keep - 1)[:keep]]
+
+def _beam_search(nutrients: np.ndarray, size: int, lower, upper, width: int):
+    """
+    Best meals of `size` distinct rows of `nutrients` (candidates x targets).
+    Returns (row index array (meals x size), scores), best first.
+    """
+    n = len(nutrients)
+    columns = np.ascontiguousarray(nutrients.T, dtype=np.float32)      # targets x candidates
+    beam_rows = np.empty((1, 0), dtype=np.int64)
+    beam_totals = np.zeros((nutrients.shape[1], 1), dtype=np.float32)   # targets x beam
+    beam_scores = np.empty(0)
+    for step in range(1, size + 1):
+        # Partial meals are judged by where they are heading: totals scaled up to the full meal size
+        totals = (beam_totals[:, :, None] + columns[:, None, :]) * np.float32(size / step)
+        scores = _score(totals, lower, upper)                            # beam x candidates
+        if beam_rows.shape[1]:
+            np.put_along_axis(scores, beam_rows, np.inf, axis=1)        # no product twice in one meal
+
+        # Best extensions first; the same set of products reached in a different order is kept once
+        flat = scores.ravel()
+        keep = min(len(flat), width * (step + 1))
+        best = np.argpartition(flat, keep - 1)[:keep]
+        best = best[np.argsort(flat[best], kind='stable')]
+        next_rows, next_scores, seen = [], [], set()
+        for flat_index in best:
+            if not np.isfinite(flat[flat_index]):
+                break
+            parent, candidate = divmod(int(flat_index), n)
+            rows = beam_rows[parent].tolist() + [candidate]
+            key = frozenset(rows)
+            if key in seen:
+                continue
+            seen.add(key)
+            next_rows.append(rows)
+            next_scores.append(float(flat[flat_index]))
+            if len(next_rows) == width:
+                break
+        if not next_rows:
+            return np.empty((0, size), dtype=np.int64), np.empty(0)
+        beam_rows = np.array(next_rows, dtype=np.int64)
+        beam_totals = columns[:, beam_rows].sum(axis=2)
+        beam_scores = np.array(next_scores)
+    return beam_rows, beam_scores
+
+def suggest_meals(exclude_ids=(), show_may_contain=False, iddsi_min=None, iddsi_max=None, diet_id=None,
+                  targets=None, size=3, limit=10) -> dict:
+    """
+    Top `limit` meals of `size` distinct products meeting the restrictions, closest to the nutrient
+    targets first. A diet restricts products to those listing the diet's name (as is, or lowercase)
+    among their properties.
+    Raises SuggestionError on invalid arguments.
+    """
+    if not MIN_MEAL_SIZE <= size <= MAX_MEAL_SIZE:
+        raise SuggestionError(f"size must be between {MIN_MEAL_SIZE} and {MAX_MEAL_SIZE}")
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        raise SuggestionError(f"limit must be between 1 and {MAX_SUGGESTIONS}")
+    diet_name = None
+    if diet_id is not None:
+        diet = db.session.get(Diet, diet_id)
+        if diet is None:
+            raise SuggestionError("Diet not found")
+        diet_name = diet.name
+    columns, lower, upper = _parse_targets(targets)
+
+    catalog = catalog_snapshot()
+    candidates = np.flatnonzero(_candidate_mask(catalog, exclude_ids, show_may_contain, iddsi_min, iddsi_max, diet_name))
+    nutrients = catalog.nutrients[candidates][:, columns]
+    pruned = _prune(nutrients, size, lower, upper, SEARCH_CANDIDATES)
+    rows, scores = _beam_search(nutrients[pruned], size, lower, upper, max(BEAM_WIDTH, limit))
+    rows = pruned[rows]
+
+    suggestions = []
+    for meal_rows, score in zip(rows[:limit], scores[:limit]):
+        products = candidates[meal_rows]
+        totals = catalog.nutrients[products].sum(axis=0)
+        in_range = bool(((totals[columns] >= lower) & (totals[columns] <= upper)).all())
+        suggestions.append({
+            "product_ids": [int(catalog.ids[p]) for p in products],
+            "nutrition": {n: round(float(v), 2) for n, v in zip(NUTRIENTS, totals)},
+            "meets_targets": in_range,
+            "score": round(float(score), 6),
+        })
+    return {"suggestions": suggestions, "candidates": int(len(candidates))}
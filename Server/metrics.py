@@ -0,0 +1,186 @@
+"""
+Process metrics (counters, gauges, histograms) in the Prometheus text format, served at /metrics.
+
+Recording takes no lock: every thread updates its own shard - a dict only that thread writes -
+and a scrape adds the shards up. Shards of finished threads are folded into one on scrape and
+whenever the number of shards has doubled since the last fold, so a thread-per-request server
+and short-lived pools (image fetches, jobs) stay bounded in memory even when nothing scrapes.
+Values are per process: with several gunicorn workers, each scrape reports the worker that
+answered it.
+"""
+
+import bisect
+import threading
+from contextlib import contextmanager
+import time
+
+# Latency buckets in seconds: web requests and external calls, and the much shorter DB statements
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_local = threading.local()
+_shards = []         # (thread, shard) for every thread that recorded something
+_retired = {}        # Summed shards of threads that have finished
+_registry_lock = threading.Lock()   # Taken once per thread (first record) and per scrape, never per update
+_metrics = []        # Registration order is exposition order
+
+# Fold finished threads once this many shards exist; reset to twice the live ones after each fold,
+# which keeps folding amortized O(1) per new thread
+MIN_FOLD_AT = 64
+_fold_at = MIN_FOLD_AT
+
+def _fold_finished() -> None:
+    """Merges the shards of finished threads into _retired. Call with _registry_lock held."""
+    global _fold_at
+    alive = []
+    for thread, shard in _shards:
+        if thread.is_alive():
+            alive.append((thread, shard))
+        else:
+            _merge(_retired, shard)
+    _shards[:] = alive
+    _fold_at = max(MIN_FOLD_AT, 2 * len(alive))
+
+def _shard() -> dict:
+    """This thread's shard: (metric name, label values) -> number, or bucket counts + [sum, count] for histograms."""
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _registry_lock:
+            _shards.append((threading.current_thread(), shard))
+            if len(_shards) >= _fold_at:
+                _fold_finished()
+    return shard
+
+def _merge(total: dict, shard: dict) -> None:
+    # dict.copy() runs without releasing the GIL, so the owner thread cannot resize it mid-copy
+    for key, value in shard.copy().items():
+        if isinstance(value, list):
+            current = total.setdefault(key, [0.0] * len(value))
+            for i, v in enumerate(list(value)):
+                current[i] += v
+        else:
+            total[key] = total.get(key, 0.0) + value
+
+def _collect() -> dict:
+    """Sum of every shard, folding those of finished threads into _retired."""
+    with _registry_lock:
+        _fold_finished()
+        total = {}
+        _merge(total, _retired)
+        for _, shard in _shards:
+            _merge(total, shard)
+    return total
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        _metrics.append(self)
+
+    def _key(self, labels: dict):
+        return (self.name, tuple(labels.get(n, "") for n in self.labels))
+
+    def samples(self, values: dict):
+        """Exposition lines for this metric from the collected values."""
+        for (name, label_values), value in sorted(values.items()):
+            if name == self.name:
+                yield f"{self.name}{_format_labels(self.labels, label_values)} {value:g}"
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        shard = _shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. requests in flight (the shards add up to the current value)."""
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        shard = _shard()
+        key = self._key(labels)
+        counts = shard.get(key)
+        if counts is None:
+            # One count per bucket plus +Inf, then sum and count
+            counts = shard[key] = [0.0] * (len(self.buckets) + 3)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the enclosed block, in seconds (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, values: dict):
+        for (name, label_values), counts in sorted(values.items()):
+            if name != self.name:
+                continue
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, [('le', le)])} {cumulative:g}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {counts[-2]:g}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {counts[-1]:g}"
+
+class CallbackMetric(_Metric):
+    """
+    A counter or gauge read at scrape time, for stats kept elsewhere: each source added with add()
+    returns {label values tuple: value}. Several modules can feed one metric (e.g. every cache).
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labels=()):
+        super().__init__(name, help, labels)
+        self.kind, self.sources = kind, []
+
+    def add(self, read) -> None:
+        self.sources.append(read)
+
+    def samples(self, values: dict):
+        collected = {}
+        for read in self.sources:
+            collected.update(read())
+        for label_values, value in sorted(collected.items()):
+            if value is not None:
+                yield f"{self.name}{_format_labels(self.labels, label_values)} {value:g}"
+
+# Caches report themselves here; hit ratio = hit / (hit + miss) per cache
+CACHE_LOOKUPS = CallbackMetric("cache_lookups_total", "Cache lookups by cache and result (hit, miss).",
+                               'counter', ("cache", "result"))
+CACHE_ENTRIES = CallbackMetric("cache_entries", "Entries currently held by each in-process cache.", 'gauge', ("cache",))
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    values = _collect()
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples(values))
+    return "\n".join(lines) + "\n"
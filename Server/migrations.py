@@ -0,0 +1,188 @@
+"""
+Ordered, recorded schema migrations.
+
+db.create_all() only creates missing tables, so every change to an existing table (columns,
+indexes, triggers, backfills) is a migration below. Each one runs once per database, in its own
+transaction, and is recorded in schema_migrations. Statements stay idempotent (IF NOT EXISTS)
+so databases that were migrated by hand before this existed are simply marked as applied.
+Append new migrations to the end of MIGRATIONS; never edit or reorder applied ones.
+"""
+
+import os
+from datetime import datetime
+from sqlalchemy import text
+
+from models import db, SchemaMigration
+from data_versions import install_version_triggers
+from allergen_masks import refresh_allergen_masks
+from meal_nutrition import recompute_meal_totals
+from nutrition_features import refresh_nutrition_scaling
+from nutrition_clusters import rebuild_clusters
+from product_search import ensure_search_index, install_search_index
+
+# Arbitrary constant key that serializes migration runs between processes starting at the same time
+_MIGRATION_LOCK = 7_140_002
+
+def _execute(*statements: str):
+    """Migration made of plain SQL statements."""
+    def apply():
+        for statement in statements:
+            db.session.execute(text(statement))
+    return apply
+
+def _embedding_hnsw_index():
+    # m / ef_construction only apply when the index is first built; ef_search is set per query
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_food_items_openai_embedding_hnsw ON food_items '
+        'USING hnsw (openai_embedding vector_cosine_ops) '
+        f'WITH (m = {int(os.environ.get("HNSW_M", 16))}, '
+        f'ef_construction = {int(os.environ.get("HNSW_EF_CONSTRUCTION", 64))})'
+    ))
+
+def _allergen_masks():
+    _execute(
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS contains_mask BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS may_contain_mask BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS properties_mask BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE sensitivities ADD COLUMN IF NOT EXISTS bit_index SMALLINT UNIQUE",
+    )()
+    refresh_allergen_masks()
+
+def _meal_items():
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS meal_items (
+            meal_id      INTEGER NOT NULL REFERENCES meals(id) ON DELETE CASCADE,
+            position     INTEGER NOT NULL,
+            food_item_id INTEGER NOT NULL REFERENCES food_items(id) ON DELETE CASCADE,
+            quantity     DOUBLE PRECISION NOT NULL DEFAULT 1,
+            PRIMARY KEY (meal_id, position)
+        )
+    """))
+    # Also when db.create_all() created the table first
+    db.session.execute(text("ALTER TABLE meal_items ALTER COLUMN quantity SET DEFAULT 1"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_meal_items_food_item_id ON meal_items (food_item_id, meal_id)"
+    ))
+    has_product_ids = db.session.execute(text("""
+        SELECT 1 FROM information_schema.columns WHERE table_name = 'meals' AND column_name = 'product_ids'
+    """)).first() is not None
+    if has_product_ids:
+        # Ids of products deleted since the meal was saved are dropped; the rest keep their order
+        db.session.execute(text("""
+            INSERT INTO meal_items (meal_id, position, food_item_id, quantity)
+            SELECT m.id, row_number() OVER (PARTITION BY m.id ORDER BY e.ordinality) - 1, f.id, 1
+            FROM meals m
+            CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(m.product_ids, '[]'::jsonb)) WITH ORDINALITY AS e(product_id, ordinality)
+            JOIN food_items f ON f.id::text = e.product_id
+            ON CONFLICT DO NOTHING
+        """))
+        db.session.execute(text("ALTER TABLE meals DROP COLUMN product_ids"))
+    recompute_meal_totals()
+
+def _nutrition_std():
+    db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS nutrition_std vector(6)"))
+    refresh_nutrition_scaling()
+    # Built after the backfill: one bulk build is much faster than indexing row by row
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_food_items_nutrition_std_hnsw ON food_items "
+        "USING hnsw (nutrition_std vector_l2_ops)"
+    ))
+
+# (id, apply) in the order they must run
+MIGRATIONS = [
+    ("0001_food_item_columns", _execute(
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS company VARCHAR(100)",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS texture_notes TEXT",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS allergy_notes TEXT",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS forbidden_for VARCHAR(200)",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS texture_id INTEGER REFERENCES textures(id)",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS nutrition_vector vector(6)",
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS openai_embedding vector(1536)",
+    )),
+    ("0002_meals_table", _execute("""
+        CREATE TABLE IF NOT EXISTS meals (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            description TEXT,
+            diet_id INTEGER REFERENCES diets(id) ON DELETE SET NULL,
+            product_ids JSONB DEFAULT '[]',
+            total_calories FLOAT DEFAULT 0,
+            total_protein  FLOAT DEFAULT 0,
+            total_carbs    FLOAT DEFAULT 0,
+            total_fat      FLOAT DEFAULT 0,
+            total_sugars   FLOAT DEFAULT 0,
+            total_sodium   FLOAT DEFAULT 0,
+            filter_restriction_ids  JSONB DEFAULT '[]',
+            filter_texture_ids      JSONB DEFAULT '[]',
+            filter_show_may_contain BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)),
+    ("0003_embedding_hnsw_index", _embedding_hnsw_index),
+    ("0004_embedding_status", _execute(
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS embedding_status VARCHAR(20) DEFAULT 'ready'",
+    )),
+    ("0005_data_version_triggers", install_version_triggers),
+    ("0006_allergen_masks", _allergen_masks),
+    # jsonb_path_ops: smaller and faster than the default GIN opclass, and serves the @> "has
+    # property" filters. Allergen exclusions filter on the masks, so contains / may_contain get none
+    ("0007_jsonb_path_ops_indexes", _execute(
+        "CREATE INDEX IF NOT EXISTS ix_food_items_properties_gin ON food_items USING gin (properties jsonb_path_ops)",
+    )),
+    # Totals used to be sent by the client; replace them with the server-computed ones once
+    ("0008_server_meal_totals", recompute_meal_totals),
+    ("0009_meal_items", _meal_items),
+    ("0010_nutrition_std", _nutrition_std),
+    ("0011_nutrition_clusters", rebuild_clusters),
+    ("0012_product_search_index", install_search_index),
+    # Nullable without a default: no table rewrite, NULL reads as the original OpenAI model
+    ("0013_embedding_model", _execute(
+        "ALTER TABLE food_items ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(100)",
+    )),
+    # Tables built by db.create_all() got the masks without a DEFAULT, so raw INSERTs that leave
+    # them out (bulk import, scripts) failed on NOT NULL; recompute_allergen_masks fills them in
+    ("0014_allergen_mask_defaults", _execute(
+        "ALTER TABLE food_items ALTER COLUMN contains_mask SET DEFAULT 0",
+        "ALTER TABLE food_items ALTER COLUMN may_contain_mask SET DEFAULT 0",
+        "ALTER TABLE food_items ALTER COLUMN properties_mask SET DEFAULT 0",
+    )),
+]
+
+def applied_migrations() -> set[str]:
+    """Ids of the migrations already recorded in this database."""
+    return {row.id for row in SchemaMigration.query.all()}
+
+def run_pending_migrations() -> list[str]:
+    """
+    Applies every migration not yet recorded, in order, each in its own transaction.
+    Safe to call from several processes at once. Returns the ids applied by this call.
+    """
+    applied_now = []
+    pending = [(mid, apply) for mid, apply in MIGRATIONS if mid not in applied_migrations()]
+    db.session.rollback()
+    for migration_id, apply in pending:
+        try:
+            db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK})
+            # Another process may have applied it while this one waited for the lock
+            if db.session.get(SchemaMigration, migration_id) is None:
+                apply()
+                db.session.add(SchemaMigration(id=migration_id, applied_at=datetime.utcnow()))
+                applied_now.append(migration_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    if applied_now:
+        print(f"Applied migrations: {', '.join(applied_now)}")
+
+    # Optional-extension indexes skipped by an earlier migration, once the extension is there
+    try:
+        ensure_search_index()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return applied_now
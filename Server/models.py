@@ -24,6 +24,8 @@ class Sensitivity(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
+    # This sensitivity's bit in FoodItem.*_mask (0-62); None once all bits are taken
+    bit_index = db.Column(db.SmallInteger, unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Texture(db.Model):
@@ -74,6 +76,11 @@ class FoodItem(db.Model):
     may_contain = db.Column(JSONB, default=[])  # React: mayContain
     properties = db.Column(JSONB, default=[])  # React: properties (e.g., ["vegan", "kosher"])
 
+    # Bitmasks of the arrays above, one bit per Sensitivity.bit_index (maintained by allergen_masks.py)
+    contains_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    may_contain_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    properties_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
     # --- הערות צוות רפואי ---
     allergy_notes = db.Column(db.Text)  # Excel: הערות אלרגיה
     forbidden_for = db.Column(db.String(200))  # Excel: למי אסור
@@ -81,14 +88,116 @@ class FoodItem(db.Model):
     # --- וקטורים לבינה מלאכותית (AI / ML) ---
     # וקטור קטן בגודל 6 המייצג את הערכים התזונתיים עבור אלגוריתמים כמו K-Means
     nutrition_vector = db.Column(Vector(6))
+    # nutrition_vector standardized with the catalog-wide NutritionScaling, for "similar nutrition" lookups
+    nutrition_std = db.Column(Vector(6))
 
     # וקטור גדול בגודל 1536 עבור חיפוש סמנטי בשפה טבעית (OpenAI)
     openai_embedding = db.Column(Vector(1536))
+    # Embedder that produced openai_embedding (see embeddings.EMBEDDERS); NULL for rows embedded before it was recorded, all by OpenAI
+    embedding_model = db.Column(db.String(100))
+    # 'ready' | 'pending' (re-embedding queued after an edit) | 'failed'
+    embedding_status = db.Column(db.String(20), default='ready')
 
     # --- בקרה ומעקב (Audit) ---
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # The mask filters (mask & bits = 0) cannot seek in a B-tree, so the masks have no index.
+    # A GIN (jsonb_path_ops) index serves the @> containment filters on properties; allergen
+    # exclusions use the masks, so contains / may_contain are not indexed.
+    __table_args__ = (
+        db.Index('ix_food_items_properties_gin', 'properties', postgresql_using='gin', postgresql_ops={'properties': 'jsonb_path_ops'}),
+    )
+
+
+class EmbeddingCache(db.Model):
+    """Persistent embedding cache: one vector per embedding model and SHA-256 of the embedded text."""
+    __tablename__ = 'embedding_cache'
+
+    model        = db.Column(db.String(100), primary_key=True)
+    content_hash = db.Column(db.String(64), primary_key=True)
+    embedding    = db.Column(Vector(1536), nullable=False)
+    created_at   = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class NutritionScaling(db.Model):
+    """Catalog mean and inverse standard deviation of nutrition_vector, used to standardize it (a single row)."""
+    __tablename__ = 'nutrition_scaling'
+
+    id         = db.Column(db.Integer, primary_key=True)
+    mean       = db.Column(Vector(6), nullable=False)
+    inv_std    = db.Column(Vector(6), nullable=False)   # 0 for a nutrient with no spread, which then never counts
+    products   = db.Column(db.Integer, nullable=False)   # Sample size the statistics were computed from
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class NutritionCluster(db.Model):
+    """One k-means cluster of the standardized nutrition vectors (see nutrition_clusters.py)."""
+    __tablename__ = 'nutrition_clusters'
+
+    id         = db.Column(db.Integer, primary_key=True)   # 0..k-1, renumbered on every rebuild
+    centroid   = db.Column(Vector(6), nullable=False)      # In nutrition_std space
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class FoodItemCluster(db.Model):
+    """
+    The nutrition cluster of a product. Kept out of food_items so that reclustering rewrites this
+    narrow table instead of every product row and its vector index entries.
+    """
+    __tablename__ = 'food_item_clusters'
+
+    food_item_id = db.Column(db.Integer, db.ForeignKey('food_items.id', ondelete='CASCADE'), primary_key=True)
+    cluster_id   = db.Column(db.Integer, db.ForeignKey('nutrition_clusters.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.Index('ix_food_item_clusters_cluster_id', 'cluster_id', 'food_item_id'),)
+
+
+class DataVersion(db.Model):
+    """Per-table change counter, bumped by a database trigger on every write; used for ETags."""
+    __tablename__ = 'data_versions'
+
+    table_name = db.Column(db.String(100), primary_key=True)
+    version    = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class SchemaMigration(db.Model):
+    """One applied schema migration from migrations.MIGRATIONS."""
+    __tablename__ = 'schema_migrations'
+
+    id         = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Job(db.Model):
+    """A long-running admin operation (export, import, CSV upload, embeddings) executed by a job worker."""
+    __tablename__ = 'jobs'
+
+    id     = db.Column(db.Integer, primary_key=True)
+    kind   = db.Column(db.String(50), nullable=False)
+    # 'queued' | 'running' | 'succeeded' | 'failed'
+    status = db.Column(db.String(20), nullable=False, default='queued')
+
+    payload  = db.Column(JSONB, default={})   # JSON arguments for the handler
+    progress = db.Column(JSONB, default={})   # Reported by the handler while it runs
+    result   = db.Column(JSONB)               # Handler return value once succeeded
+    error    = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    # Names of the uploaded input (e.g. the CSV or backup ZIP) and of the produced file (e.g. the
+    # export archive) in jobs.JOB_FILES_DIR; kept out of the database, where a large archive
+    # would be read whole and could exceed the 1 GB bytea limit
+    input_path  = db.Column(db.String(255))
+    result_path = db.Column(db.String(255))
+
+    created_at   = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at   = db.Column(db.DateTime)
+    finished_at  = db.Column(db.DateTime)
+    # Refreshed periodically by the worker; a running job with a stale heartbeat lost its worker
+    heartbeat_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_jobs_status_id', 'status', 'id'),)
+
 
 class User(db.Model):
     """System user with role-based access (admin, dietitian, lineworker)."""
@@ -115,10 +224,11 @@ class Meal(db.Model):
     diet_id = db.Column(db.Integer, db.ForeignKey('diets.id'), nullable=True)
     diet    = db.relationship('Diet', backref='meals', lazy=True)
 
-    # Ordered list of food_item IDs that make up this meal (JSONB preserves order)
-    product_ids = db.Column(JSONB, default=[])
+    # The food items that make up this meal, in order
+    items = db.relationship('MealItem', back_populates='meal', order_by='MealItem.position',
+                            cascade='all, delete-orphan', lazy=True)
 
-    # ── Pre-computed nutrition totals (snapshot at save time) ────────────────
+    # ── Nutrition totals of the items (kept current by meal_nutrition.py) ────
     total_calories = db.Column(db.Float, default=0.0)
     total_protein  = db.Column(db.Float, default=0.0)
     total_carbs    = db.Column(db.Float, default=0.0)
@@ -135,4 +245,25 @@ class Meal(db.Model):
     filter_show_may_contain = db.Column(db.Boolean, default=False)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def product_ids(self) -> list[int]:
+        """Ordered food_item IDs of the meal's items."""
+        return [item.food_item_id for item in self.items]
+
+
+class MealItem(db.Model):
+    """One food item in a meal. The index on food_item_id answers "which meals use this product"."""
+    __tablename__ = 'meal_items'
+
+    meal_id      = db.Column(db.Integer, db.ForeignKey('meals.id', ondelete='CASCADE'), primary_key=True)
+    position     = db.Column(db.Integer, primary_key=True)   # 0-based order within the meal
+    # Deleting a product removes it from every meal that used it
+    food_item_id = db.Column(db.Integer, db.ForeignKey('food_items.id', ondelete='CASCADE'), nullable=False)
+    quantity     = db.Column(db.Float, nullable=False, default=1.0, server_default='1')   # Servings; totals are nutrients x quantity
+
+    meal      = db.relationship('Meal', back_populates='items')
+    food_item = db.relationship('FoodItem', lazy=True)
+
+    __table_args__ = (db.Index('ix_meal_items_food_item_id', 'food_item_id', 'meal_id'),)
@@ -0,0 +1,154 @@
+"""
+Nutrition clusters: mini-batch k-means over the standardized nutrition vectors (nutrition_std),
+with one cluster per product in food_item_clusters. Browsing a cluster, or looking for
+substitutes inside one, then touches a cluster's products instead of the whole catalog.
+
+The clustering is a batch job (rebuild_clusters); products added or edited in between are
+assigned to the nearest existing centroid (assign_clusters) without moving any centroid.
+"""
+
+import math
+import os
+from datetime import datetime
+import numpy as np
+from sqlalchemy import text
+
+from models import db, NutritionCluster
+from jobs import job_handler, enqueue_job, active_job
+
+MAX_CLUSTERS = 256
+# Mini-batch k-means effort: products per step and number of steps
+KMEANS_BATCH_SIZE = int(os.environ.get("KMEANS_BATCH_SIZE", 1024))
+KMEANS_ITERATIONS = int(os.environ.get("KMEANS_ITERATIONS", 100))
+# Rows per distance matrix when assigning every product (bounds memory to rows x clusters)
+_ASSIGN_CHUNK = 8192
+
+NUTRITION_CLUSTERS_JOB = 'nutrition_clusters'
+
+def default_cluster_count(products: int) -> int:
+    """About sqrt(products / 2): clusters of a few hundred products at catalog sizes in the tens of thousands."""
+    return max(1, min(MAX_CLUSTERS, round(math.sqrt(products / 2))))
+
+def nearest_centroids(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid for each point (squared L2 expanded as |x|^2 - 2x.c + |c|^2)."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    nearest = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), _ASSIGN_CHUNK):
+        chunk = points[start:start + _ASSIGN_CHUNK]
+        # |x|^2 is the same for every centroid, so it does not change the argmin
+        nearest[start:start + len(chunk)] = (centroid_norms - 2 * chunk @ centroids.T).argmin(axis=1)
+    return nearest
+
+def _kmeans_plus_plus(points: np.ndarray, k: int, rng) -> np.ndarray:
+    """k-means++ seeding: each next centroid is drawn with probability proportional to its squared distance."""
+    centroids = np.empty((k, points.shape[1]))
+    centroids[0] = points[rng.integers(len(points))]
+    closest = ((points - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        pick = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centroids[i] = points[pick]
+        closest = np.minimum(closest, ((points - centroids[i]) ** 2).sum(axis=1))
+    return centroids
+
+def mini_batch_kmeans(points: np.ndarray, k: int, batch_size: int = KMEANS_BATCH_SIZE,
+                      iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """
+    Mini-batch k-means (Sculley, 2010) over the rows of `points`; returns the (k x dim) centroids.
+    Each step assigns a random batch and moves every centroid towards the mean of its batch
+    points with a per-centroid rate of 1 / points seen so far, so the centroids settle as running
+    means. Seeded on a sample with k-means++.
+    """
+    rng = np.random.default_rng(seed)
+    points = np.asarray(points, dtype=np.float64)
+    k = min(k, len(points))
+    sample = points[rng.choice(len(points), min(len(points), max(batch_size, 20 * k)), replace=False)]
+    centroids = _kmeans_plus_plus(sample, k, rng)
+    seen = np.zeros(k)
+    for _ in range(iterations):
+        batch = points[rng.integers(0, len(points), batch_size)]
+        nearest = nearest_centroids(batch, centroids)
+        counts = np.bincount(nearest, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, nearest, batch)
+        seen += counts
+        hit = counts > 0
+        centroids[hit] += (sums[hit] - counts[hit, None] * centroids[hit]) / seen[hit, None]
+    return centroids
+
+def _standardized_vectors():
+    """(product ids, nutrition_std matrix) of every standardized product."""
+    rows = db.session.execute(text(
+        "SELECT id, CAST(nutrition_std AS REAL[]) FROM food_items WHERE nutrition_std IS NOT NULL ORDER BY id"
+    )).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0))
+    ids, vectors = zip(*rows)
+    return np.array(ids, dtype=np.int64), np.array(vectors, dtype=np.float64)
+
+def rebuild_clusters(k: int | None = None, seed: int = 0) -> dict:
+    """
+    Reclusters every standardized product (k clusters, default_cluster_count() when None) and
+    replaces the stored centroids and assignments. Clusters left empty are dropped and the rest
+    renumbered from 0. Returns {"clusters", "products"}.
+    """
+    ids, points = _standardized_vectors()
+    db.session.execute(text("DELETE FROM food_item_clusters"))
+    db.session.execute(text("DELETE FROM nutrition_clusters"))
+    if not len(ids):
+        return {"clusters": 0, "products": 0}
+
+    centroids = mini_batch_kmeans(points, k or default_cluster_count(len(ids)), seed=seed)
+    nearest = nearest_centroids(points, centroids)
+    used, clusters = np.unique(nearest, return_inverse=True)
+
+    now = datetime.utcnow()
+    db.session.add_all([
+        NutritionCluster(id=i, centroid=centroids[c].tolist(), updated_at=now) for i, c in enumerate(used)
+    ])
+    db.session.flush()
+    db.session.execute(text("""
+        INSERT INTO food_item_clusters (food_item_id, cluster_id)
+        SELECT unnest(CAST(:ids AS INTEGER[])), unnest(CAST(:clusters AS INTEGER[]))
+    """), {"ids": ids.tolist(), "clusters": clusters.tolist()})
+    # Every row was just replaced: without fresh statistics the planner takes a cluster for one row
+    db.session.execute(text("ANALYZE food_item_clusters"))
+    return {"clusters": int(len(used)), "products": int(len(ids))}
+
+def assign_clusters(product_ids=None, missing_only=False) -> int:
+    """
+    Assigns the given products (every product when None; only unassigned ones when missing_only)
+    to their nearest stored centroid, with one statement. Centroids are not moved. No-op until a
+    clustering exists. Returns the number of assignments written.
+    """
+    where = "AND f.id = ANY(CAST(:ids AS INTEGER[]))" if product_ids is not None else ""
+    if missing_only:
+        where += " AND NOT EXISTS (SELECT 1 FROM food_item_clusters a WHERE a.food_item_id = f.id)"
+    return db.session.execute(text(f"""
+        INSERT INTO food_item_clusters (food_item_id, cluster_id)
+        SELECT f.id, (SELECT c.id FROM nutrition_clusters c ORDER BY c.centroid <-> f.nutrition_std LIMIT 1)
+        FROM food_items f
+        WHERE f.nutrition_std IS NOT NULL AND EXISTS (SELECT 1 FROM nutrition_clusters) {where}
+        ON CONFLICT (food_item_id) DO UPDATE SET cluster_id = EXCLUDED.cluster_id
+        WHERE food_item_clusters.cluster_id IS DISTINCT FROM EXCLUDED.cluster_id
+    """), {"ids": list(product_ids) if product_ids is not None else None}).rowcount
+
+def clustering_exists() -> bool:
+    return db.session.query(NutritionCluster.id).first() is not None
+
+def cluster_new_products() -> int:
+    """Assigns the products without a cluster, clustering the whole catalog first if there is no clustering yet."""
+    if not clustering_exists():
+        return rebuild_clusters()["products"]
+    return assign_clusters(missing_only=True)
+
+@job_handler(NUTRITION_CLUSTERS_JOB)
+def _run_clusters_job(job) -> dict:
+    """Job handler: reclusters the catalog (payload {"k": int} optional)."""
+    result = rebuild_clusters(job.payload.get("k"))
+    db.session.commit()
+    return result
+
+def enqueue_cluster_rebuild(k: int | None = None):
+    """Queues a reclustering, unless one is already queued or running."""
+    return active_job(NUTRITION_CLUSTERS_JOB) or enqueue_job(NUTRITION_CLUSTERS_JOB, {"k": k} if k else {})
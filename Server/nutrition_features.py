@@ -0,0 +1,132 @@
+"""
+Standardized nutrition features: nutrition_vector rescaled to zero mean and unit variance per
+nutrient over the catalog, so that distances weigh 10 kcal and 10 mg of sodium by how much they
+actually vary. Stored in FoodItem.nutrition_std and indexed (HNSW, L2) for substitute lookups.
+"""
+
+from datetime import datetime
+from sqlalchemy import text
+
+from models import db, NutritionScaling, Job
+from jobs import JOB_QUEUED, job_handler, enqueue_job
+from nutrition_clusters import assign_clusters, cluster_new_products, clustering_exists, rebuild_clusters
+
+NUTRITION_DIM = 6
+# Nutrient columns in nutrition_vector order
+NUTRITION_COLUMNS = ["calories", "protein", "carbs", "fat", "sugars", "sodium"]
+
+_SCALING_ID = 1
+
+# Job standardizing products off the request path (payload {"rescale": true}: recompute the statistics first)
+NUTRITION_SCALING_JOB = 'nutrition_scaling'
+
+def backfill_nutrition_vectors() -> int:
+    """Builds nutrition_vector from the nutrient columns for products that have none (e.g. imported with a malformed one)."""
+    components = ", ".join(f"COALESCE({c}, 0)" for c in NUTRITION_COLUMNS)
+    return db.session.execute(text(f"""
+        UPDATE food_items SET nutrition_vector = CAST(ARRAY[{components}] AS vector)
+        WHERE nutrition_vector IS NULL
+    """)).rowcount
+
+def standardize_products(product_ids=None, missing_only=False) -> int:
+    """
+    Recomputes nutrition_std of the given products (every product when None; only those without
+    one when missing_only) from the stored scaling, with one UPDATE. Only changed rows are
+    written. Returns the number updated.
+    """
+    where = "AND f.id = ANY(CAST(:ids AS INTEGER[]))" if product_ids is not None else ""
+    if missing_only:
+        where += " AND f.nutrition_std IS NULL"
+    return db.session.execute(text(f"""
+        UPDATE food_items f SET nutrition_std = (f.nutrition_vector - s.mean) * s.inv_std
+        FROM nutrition_scaling s
+        WHERE s.id = :scaling_id {where}
+          AND f.nutrition_std IS DISTINCT FROM (f.nutrition_vector - s.mean) * s.inv_std
+    """), {"scaling_id": _SCALING_ID, "ids": list(product_ids) if product_ids is not None else None}).rowcount
+
+def refresh_nutrition_scaling() -> int:
+    """
+    Recomputes the catalog mean / standard deviation of nutrition_vector and restandardizes every
+    product. Used after bulk changes; single edits keep the existing scaling. Returns rows updated.
+    """
+    backfill_nutrition_vectors()
+    stats = ", ".join(f"avg(v[{i}]), stddev_pop(v[{i}])" for i in range(1, NUTRITION_DIM + 1))
+    row = db.session.execute(text(f"""
+        SELECT count(*), {stats}
+        FROM (SELECT CAST(nutrition_vector AS REAL[]) AS v FROM food_items WHERE nutrition_vector IS NOT NULL) p
+    """)).one()
+    count, values = row[0], row[1:]
+    if not count:
+        return 0
+    mean = [float(values[2 * i]) for i in range(NUTRITION_DIM)]
+    inv_std = [1.0 / float(std) if std else 0.0 for std in values[1::2]]
+
+    scaling = db.session.get(NutritionScaling, _SCALING_ID) or NutritionScaling(id=_SCALING_ID)
+    scaling.mean, scaling.inv_std, scaling.products = mean, inv_std, count
+    scaling.updated_at = datetime.utcnow()
+    db.session.add(scaling)
+    db.session.flush()
+    return standardize_products()
+
+def standardize_new_products() -> int:
+    """
+    Standardizes the products that have no nutrition_std yet (e.g. after an import) with the
+    existing scaling, computing the scaling first if there is none. Rescaling the whole catalog
+    rewrites every row and its index entries, so it is left to refresh_nutrition_scaling().
+    """
+    if db.session.get(NutritionScaling, _SCALING_ID) is None:
+        return refresh_nutrition_scaling()
+    backfill_nutrition_vectors()
+    return standardize_products(missing_only=True)
+
+def index_product_nutrition(product_ids) -> bool:
+    """
+    Standardizes and clusters just-written products within the current transaction, with the
+    stored scaling and centroids. Returns False when either does not exist yet (a fresh install
+    whose migrations ran on an empty catalog): the caller then commits and calls
+    enqueue_standardization(), whose job computes them.
+    """
+    if db.session.get(NutritionScaling, _SCALING_ID) is None:
+        return False
+    standardize_products(product_ids)
+    assign_clusters(product_ids)
+    return clustering_exists()
+
+def nutrition_from_std(vectors) -> list[dict]:
+    """
+    Nutrient values ({column: value}) of nutrition_std vectors under the stored scaling, e.g. to
+    show a cluster centroid as a typical product. Nutrients with no spread read as the mean.
+    """
+    scaling = db.session.get(NutritionScaling, _SCALING_ID)
+    if scaling is None:
+        return [{} for _ in vectors]
+    return [
+        {c: round(float(m + (v / s if s else 0.0)), 2) for c, v, m, s in zip(NUTRITION_COLUMNS, vector, scaling.mean, scaling.inv_std)}
+        for vector in vectors
+    ]
+
+@job_handler(NUTRITION_SCALING_JOB)
+def _run_scaling_job(job) -> dict:
+    """
+    Job handler: standardizes and clusters the products that lack nutrition_std, or rescales the
+    whole catalog - which moves every vector, so the clusters are rebuilt too.
+    """
+    if job.payload.get("rescale"):
+        updated = refresh_nutrition_scaling()
+        clustered = rebuild_clusters()["products"]
+    else:
+        updated = standardize_new_products()
+        clustered = cluster_new_products()
+    db.session.commit()
+    return {"updated": updated, "clustered": clustered}
+
+def enqueue_standardization(rescale: bool = False) -> Job:
+    """
+    Queues the standardization job, reusing a queued one that already covers the request. A running
+    job is not reused: it may have passed over rows written after it started.
+    """
+    queued = Job.query.filter(Job.kind == NUTRITION_SCALING_JOB, Job.status == JOB_QUEUED).order_by(Job.id).all()
+    for job in queued:
+        if job.payload.get("rescale") or not rescale:
+            return job
+    return enqueue_job(NUTRITION_SCALING_JOB, {"rescale": rescale})
@@ -0,0 +1,159 @@
+"""
+Hybrid product search: a lexical ranking over the product's text fields (name, texture notes,
+allergy notes, forbidden-for - mostly Hebrew) and a semantic ranking over openai_embedding,
+fused with reciprocal-rank fusion (RRF).
+
+The lexical side matches pg_trgm word similarity against a normalized copy of the text, so
+queries tolerate typos and Hebrew spelling variants, through a GIN trigram expression index.
+Where pg_trgm is not installed it falls back to substring matching on the same text.
+"""
+
+import math
+from sqlalchemy import func, text, type_coerce
+from pgvector.sqlalchemy import Vector
+
+from models import db, FoodItem
+from embeddings import EMBEDDING_MODEL, current_embedder
+
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = 50
+# RRF constant: a product's fused score is sum(1 / (RRF_K + rank)) over the rankings it appears in
+RRF_K = 60
+# Minimum pg_trgm word similarity (0..1) for a lexical match; lower tolerates more typos
+WORD_SIMILARITY_THRESHOLD = 0.4
+
+# Normalization shared by the index and the queries: lowercase, Hebrew points and cantillation
+# removed, quote marks of abbreviations dropped (מ"ג = מג), final letters folded (ם = מ), maqaf to space
+SEARCH_FUNCTIONS_SQL = r"""
+    CREATE OR REPLACE FUNCTION search_normalize(value TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT regexp_replace(
+            translate(lower(value), 'ךםןףץ' || chr(1470), 'כמנפצ '),
+            '[\u0591-\u05C7\u05F3\u05F4"'']', '', 'g'
+        )
+    $$;
+    CREATE OR REPLACE FUNCTION product_search_text(name TEXT, texture_notes TEXT, allergy_notes TEXT, forbidden_for TEXT)
+    RETURNS TEXT LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT search_normalize(
+            coalesce(name, '') || ' ' || coalesce(texture_notes, '') || ' ' ||
+            coalesce(allergy_notes, '') || ' ' || coalesce(forbidden_for, '')
+        )
+    $$;
+"""
+
+SEARCH_INDEX_NAME = 'ix_food_items_search_trgm'
+
+_trigram_available = None   # Per process: whether the trigram index exists (checked once)
+
+def _search_text():
+    """The indexed expression: normalized name and notes of a product."""
+    return func.product_search_text(FoodItem.name, FoodItem.texture_notes, FoodItem.allergy_notes, FoodItem.forbidden_for)
+
+def _pg_trgm_installable() -> bool:
+    return db.session.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first() is not None
+
+def install_search_index() -> bool:
+    """
+    Creates the normalization functions and, when the pg_trgm extension can be installed, the
+    trigram index over product_search_text(). Returns whether the index exists.
+    """
+    global _trigram_available
+    db.session.execute(text(SEARCH_FUNCTIONS_SQL))
+    if not _pg_trgm_installable():
+        _trigram_available = False
+        return False
+    db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    db.session.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX_NAME} ON food_items USING gin "
+        "((product_search_text(name, texture_notes, allergy_notes, forbidden_for)) gin_trgm_ops)"
+    ))
+    _trigram_available = True
+    return True
+
+def ensure_search_index() -> bool:
+    """
+    Creates the trigram index if it is missing and pg_trgm can be installed by now. Migration 0012
+    is recorded even where the extension was missing, so this runs after every migration pass
+    (server start, /api/run-migrations) to pick up an extension installed later. Returns whether
+    the index exists.
+    """
+    global _trigram_available
+    _trigram_available = None
+    if trigram_search_available():
+        return True
+    if not _pg_trgm_installable():
+        print("[Search] pg_trgm is not available: lexical search falls back to substring matching")
+        return False
+    print("[Search] pg_trgm is available: creating the trigram search index")
+    try:
+        # A savepoint, so a failure (e.g. no privilege to create extensions) does not stop the server
+        with db.session.begin_nested():
+            return install_search_index()
+    except Exception as e:
+        print(f"[Search] Could not create the trigram search index: {e}")
+        _trigram_available = False
+        return False
+
+def trigram_search_available() -> bool:
+    """Whether the trigram index exists in this database (checked once per process)."""
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = db.session.execute(
+            text("SELECT 1 FROM pg_indexes WHERE indexname = :name"), {"name": SEARCH_INDEX_NAME}
+        ).first() is not None
+    return _trigram_available
+
+def lexical_ranking(id_query, term: str, limit: int = HYBRID_CANDIDATES) -> list[int]:
+    """
+    IDs of the products whose text matches `term`, best first. `id_query` is a FoodItem.id query
+    carrying the filters, so they narrow the candidates before ranking.
+    """
+    document = _search_text()
+    normalized = func.search_normalize(term)
+    if trigram_search_available():
+        # term <% document: some extent of the document is similar enough to the term (GIN-indexed)
+        db.session.execute(text(f"SET LOCAL pg_trgm.word_similarity_threshold = {WORD_SIMILARITY_THRESHOLD}"))
+        similarity = func.word_similarity(normalized, document)
+        query = id_query.filter(normalized.op('<%')(document)).order_by(similarity.desc(), FoodItem.id)
+    else:
+        query = id_query.filter(func.strpos(document, normalized) > 0).order_by(FoodItem.id)
+    return [row[0] for row in query.limit(limit)]
+
+def nearest_by_embedding(query, query_vector, limit: int, ef_search: int = 40) -> list:
+    """
+    Rows of `query` (which carries the filters) closest to `query_vector` by cosine distance, each
+    with the distance appended, best first. The HNSW scan hands only its first ef_search candidates
+    to the filters, so a restrictive filter can leave fewer than `limit`; the filtered set is then
+    ranked exactly with cosine_distance(), which the index does not serve. (pgvector 0.8 can keep
+    scanning instead - hnsw.iterative_scan - but this must run on older versions.)
+    Only embeddings from the configured embedder are compared: vectors from another model live in
+    a different space, so their distances to the query are meaningless.
+    """
+    query = query.filter(
+        FoodItem.openai_embedding.isnot(None),
+        func.coalesce(FoodItem.embedding_model, EMBEDDING_MODEL) == current_embedder().name,
+    )
+    # Never go below the limit: the filters can only remove candidates
+    db.session.execute(text(f"SET LOCAL hnsw.ef_search = {max(limit, ef_search)}"))
+    distance = FoodItem.openai_embedding.cosine_distance(query_vector)
+    rows = _defined(query.add_columns(distance).order_by(distance).limit(limit).all())
+    if len(rows) < limit:
+        exact = func.cosine_distance(FoodItem.openai_embedding, type_coerce(query_vector, Vector(len(query_vector))))
+        rows = _defined(query.add_columns(exact).order_by(exact).limit(limit).all())
+    return rows
+
+def _defined(rows) -> list:
+    # Zero placeholder embeddings have an undefined (NaN) cosine distance
+    return [row for row in rows if row[-1] is not None and not math.isnan(row[-1])]
+
+def semantic_ranking(id_query, query_vector, limit: int = HYBRID_CANDIDATES) -> list[int]:
+    """IDs of the products closest to `query_vector` (cosine, HNSW index), best first; same filters as lexical_ranking."""
+    return [row[0] for row in nearest_by_embedding(id_query, query_vector, limit)]
+
+def rrf_fuse(rankings) -> list[tuple[int, float]]:
+    """Reciprocal-rank fusion of ID rankings: [(id, score)] best first, ties broken by id."""
+    scores = {}
+    for ranking in rankings:
+        for rank, product_id in enumerate(ranking, start=1):
+            scores[product_id] = scores.get(product_id, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
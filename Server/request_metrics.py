@@ -0,0 +1,114 @@
+"""
+Per-request database instrumentation: for every web request, the number of queries, the time
+spent in them and the time spent getting a connection from the pool. Sent back in the
+Server-Timing and X-DB-Query-Count headers and logged for slow requests. The same events feed
+the process-wide /metrics: request latency per blueprint and route, requests in flight, and the
+duration of every query (requests and background jobs alike) and pool checkout.
+
+    SLOW_REQUEST_MS   requests taking longer than this are logged (default 500)
+    LOG_ALL_REQUESTS  log every request, not only slow ones (default false)
+
+The numbers of a streamed response cover the work done before the body starts streaming.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import DB_BUCKETS, Counter, Gauge, Histogram
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+LOG_ALL_REQUESTS = os.environ.get("LOG_ALL_REQUESTS", "false").lower() == "true"
+
+# Response headers set on every request (listed for CORS so browser clients can read them)
+REQUEST_METRICS_HEADERS = ["Server-Timing", "X-DB-Query-Count"]
+
+HTTP_REQUESTS = Counter("http_requests_total", "Requests by blueprint, route, method and status.",
+                        ("blueprint", "route", "method", "status"))
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Request latency by blueprint, route and method.",
+                         ("blueprint", "route", "method"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled by this process.")
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Duration of database statements.", buckets=DB_BUCKETS)
+DB_POOL_WAIT_SECONDS = Histogram("db_pool_wait_seconds", "Time spent getting a connection from the pool.",
+                                 buckets=DB_BUCKETS)
+
+def _current():
+    """This request's counters, or None outside a request (jobs, migrations, worker threads)."""
+    return g.get('db_metrics') if has_request_context() else None
+
+@contextmanager
+def record_pool_wait():
+    """Times the enclosed connection checkout as pool wait of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        DB_POOL_WAIT_SECONDS.observe(elapsed)
+        metrics = _current()
+        if metrics is not None:
+            metrics["pool_ms"] += elapsed * 1000
+
+# The start time is kept on the statement's execution context, not on the connection: a statement
+# that raises never reaches after_cursor_execute, and its context is simply dropped with it. The
+# few statements run without a context (sequence / default pre-execution) use one slot per connection.
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+    else:
+        conn.info['query_started'] = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        started = getattr(context, '_query_started', None)
+    else:
+        started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    DB_QUERY_SECONDS.observe(elapsed)
+    metrics = _current()
+    if metrics is not None:
+        metrics["queries"] += 1
+        metrics["db_ms"] += elapsed * 1000
+
+def _start_request():
+    HTTP_IN_FLIGHT.inc()
+    g.in_flight = True
+    g.db_metrics = {"queries": 0, "db_ms": 0.0, "pool_ms": 0.0, "started": time.perf_counter()}
+
+def _finish_request(response):
+    metrics = g.pop('db_metrics', None)
+    if metrics is None:
+        return response
+    total_ms = (time.perf_counter() - metrics["started"]) * 1000
+    # The URL rule, not the path, so /api/products/<id> is one route; unmatched URLs share one label
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    blueprint = request.blueprint or "app"
+    HTTP_REQUESTS.inc(blueprint=blueprint, route=route, method=request.method, status=response.status_code)
+    HTTP_SECONDS.observe(total_ms / 1000, blueprint=blueprint, route=route, method=request.method)
+    response.headers['Server-Timing'] = (
+        f'db;dur={metrics["db_ms"]:.2f};desc="{metrics["queries"]} queries", '
+        f'db-pool;dur={metrics["pool_ms"]:.2f}, app;dur={total_ms:.2f}'
+    )
+    response.headers['X-DB-Query-Count'] = str(metrics["queries"])
+    if LOG_ALL_REQUESTS or total_ms >= SLOW_REQUEST_MS:
+        print(f"[Request] {request.method} {request.path} {response.status_code} - {total_ms:.1f} ms, "
+              f"{metrics['queries']} queries, {metrics['db_ms']:.1f} ms db, {metrics['pool_ms']:.1f} ms pool wait")
+    return response
+
+def _end_request(exc):
+    # Teardown runs even when the request failed before a response was made
+    if g.pop('in_flight', False):
+        HTTP_IN_FLIGHT.dec()
+
+def init_request_metrics(app) -> None:
+    """Installs the per-request hooks on the Flask app."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
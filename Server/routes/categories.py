@@ -1,14 +1,18 @@
 from flask import Blueprint, jsonify, request, Response
 import pandas as pd
 from models import db, Category, FoodItem
+from jobs import enqueue_job, job_handler
+from catalog_cache import versioned_json
+from routes.jobs import job_accepted, wants_async
 
 categories_bp = Blueprint('categories_bp', __name__)
 
+UPLOAD_JOB = 'categories_upload'
+
 @categories_bp.route('/api/categories', methods=['GET'])
 def get_categories():
     """Retrieves all product categories."""
-    categories = Category.query.all()
-    return jsonify([{"id": c.id, "name": c.name} for c in categories])
+    return versioned_json(('categories',), lambda: [{"id": c.id, "name": c.name} for c in Category.query.all()])
 
 @categories_bp.route('/api/categories/table', methods=['GET'])
 def get_categories_table():
@@ -26,43 +30,59 @@ def get_categories_table():
     )
     return response
 
+def _add_categories_from_csv(file) -> int:
+    """Adds every category in the CSV that does not exist yet (case-insensitive). Returns how many were added."""
+    df = pd.read_csv(file)
+    
+    if "Category" not in df.columns:
+        raise ValueError("CSV must contain a 'Category' column")
+        
+    added_count = 0
+    existing_categories = {c.name.strip().lower() for c in Category.query.all()}
+    
+    for index, row in df.iterrows():
+        cat_name = str(row["Category"]).strip()
+        if not cat_name or cat_name.lower() == 'nan':
+            continue
+            
+        cat_name_lower = cat_name.lower()
+        if cat_name_lower not in existing_categories:
+            new_category = Category(name=cat_name)
+            db.session.add(new_category)
+            existing_categories.add(cat_name_lower)
+            added_count += 1
+            
+    db.session.commit()
+    return added_count
+
 @categories_bp.route('/api/categories/upload', methods=['POST'])
 def upload_categories():
-    """Uploads a CSV file of categories, ignoring duplicates."""
+    """Uploads a CSV file of categories, ignoring duplicates. With `Prefer: respond-async` the file is queued as a background job."""
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-        
+
+    if wants_async():
+        return job_accepted(enqueue_job(UPLOAD_JOB, {"filename": file.filename}, input_file=file))
+
     try:
-        df = pd.read_csv(file)
-        
-        if "Category" not in df.columns:
-            return jsonify({"error": "CSV must contain a 'Category' column"}), 400
-            
-        added_count = 0
-        existing_categories = {c.name.strip().lower() for c in Category.query.all()}
-        
-        for index, row in df.iterrows():
-            cat_name = str(row["Category"]).strip()
-            if not cat_name or cat_name.lower() == 'nan':
-                continue
-                
-            cat_name_lower = cat_name.lower()
-            if cat_name_lower not in existing_categories:
-                new_category = Category(name=cat_name)
-                db.session.add(new_category)
-                existing_categories.add(cat_name_lower)
-                added_count += 1
-                
-        db.session.commit()
+        added_count = _add_categories_from_csv(file)
         return jsonify({"message": f"הועלו בהצלחה {added_count} קטגוריות חדשות.", "added": added_count}), 200
-        
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@job_handler(UPLOAD_JOB)
+def _run_upload_job(job) -> dict:
+    """Job handler: adds the categories from the uploaded CSV."""
+    return {"added": _add_categories_from_csv(job.input_path())}
+
 @categories_bp.route('/api/categories', methods=['POST'])
 def add_category():
     """Creates a new product category."""
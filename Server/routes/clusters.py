@@ -0,0 +1,60 @@
+from flask import Blueprint, jsonify, request
+from sqlalchemy import func
+from models import db, NutritionCluster, FoodItem, FoodItemCluster
+from nutrition_features import nutrition_from_std
+from routes.products import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_product_filters, catalog_query, _product_to_dict
+
+clusters_bp = Blueprint('clusters_bp', __name__)
+
+@clusters_bp.route('/api/nutrition-clusters', methods=['GET'])
+def get_nutrition_clusters():
+    """
+    Lists the nutrition clusters (products with similar nutrition, see nutrition_clusters.py).
+
+    Response: {"clusters": [{"id", "size", "nutrition": {nutrient: value}}, ...], "updated_at": str | null}
+    where `nutrition` is the cluster centroid in nutrient units - a typical product of the cluster.
+    """
+    clusters = NutritionCluster.query.order_by(NutritionCluster.id).all()
+    sizes = dict(
+        db.session.query(FoodItemCluster.cluster_id, func.count()).group_by(FoodItemCluster.cluster_id).all()
+    )
+    nutrition = nutrition_from_std([c.centroid for c in clusters])
+    return jsonify({
+        "clusters": [
+            {"id": c.id, "size": sizes.get(c.id, 0), "nutrition": n} for c, n in zip(clusters, nutrition)
+        ],
+        "updated_at": clusters[0].updated_at.isoformat() if clusters else None,
+    })
+
+@clusters_bp.route('/api/nutrition-clusters/<int:cluster_id>/products', methods=['GET'])
+def get_nutrition_cluster_products(cluster_id):
+    """
+    Returns one page of a cluster's products, read through the cluster index rather than the catalog.
+
+    Accepts the filters documented on `apply_product_filters` plus:
+        limit - page size (default 50, max 200)
+        after - cursor returned as `next_cursor` by the previous page
+
+    Response: {"items": [...], "next_cursor": str | null}
+    """
+    if db.session.get(NutritionCluster, cluster_id) is None:
+        return jsonify({"error": "Cluster not found"}), 404
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        query = apply_product_filters(catalog_query(), request.args) \
+            .join(FoodItemCluster, FoodItemCluster.food_item_id == FoodItem.id) \
+            .filter(FoodItemCluster.cluster_id == cluster_id)
+        after = request.args.get('after')
+        if after:
+            query = query.filter(FoodItemCluster.food_item_id > int(after))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {e}"}), 400
+
+    # Keyset pagination in (cluster_id, food_item_id) index order; one extra row tells whether more exist
+    products = query.order_by(FoodItemCluster.food_item_id).limit(limit + 1).all()
+    has_more = len(products) > limit
+    products = products[:limit]
+    return jsonify({
+        "items": [_product_to_dict(p) for p in products],
+        "next_cursor": str(products[-1].id) if has_more else None,
+    })
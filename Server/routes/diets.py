@@ -1,14 +1,18 @@
 from flask import Blueprint, jsonify, request, Response
 import pandas as pd
 from models import db, Diet
+from jobs import enqueue_job, job_handler
+from catalog_cache import versioned_json
+from routes.jobs import job_accepted, wants_async
 
 diets_bp = Blueprint('diets_bp', __name__)
 
+UPLOAD_JOB = 'diets_upload'
+
 @diets_bp.route('/api/diets', methods=['GET'])
 def get_diets():
     """Retrieves all food diets definitions."""
-    diets = Diet.query.all()
-    return jsonify([{"id": s.id, "name": s.name} for s in diets])
+    return versioned_json(('diets',), lambda: [{"id": s.id, "name": s.name} for s in Diet.query.all()])
 
 @diets_bp.route('/api/diets/table', methods=['GET'])
 def get_diets_table():
@@ -26,42 +30,58 @@ def get_diets_table():
     )
     return response
 
+def _add_diets_from_csv(file) -> int:
+    """Adds every diet in the CSV that does not exist yet (case-insensitive). Returns how many were added."""
+    df = pd.read_csv(file)
+    if "Diet" not in df.columns:
+        raise ValueError("CSV must contain a 'Diet' column")
+        
+    added_count = 0
+    existing_diets = {d.name.strip().lower() for d in Diet.query.all()}
+    
+    for index, row in df.iterrows():
+        diet_name = str(row["Diet"]).strip()
+        if not diet_name or diet_name.lower() == 'nan':
+            continue
+            
+        diet_name_lower = diet_name.lower()
+        if diet_name_lower not in existing_diets:
+            new_diet = Diet(name=diet_name)
+            db.session.add(new_diet)
+            existing_diets.add(diet_name_lower)
+            added_count += 1
+            
+    db.session.commit()
+    return added_count
+
 @diets_bp.route('/api/diets/upload', methods=['POST'])
 def upload_diets():
-    """Uploads a CSV file of diets, ignoring duplicates."""
+    """Uploads a CSV file of diets, ignoring duplicates. With `Prefer: respond-async` the file is queued as a background job."""
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-        
+
+    if wants_async():
+        return job_accepted(enqueue_job(UPLOAD_JOB, {"filename": file.filename}, input_file=file))
+
     try:
-        df = pd.read_csv(file)
-        if "Diet" not in df.columns:
-            return jsonify({"error": "CSV must contain a 'Diet' column"}), 400
-            
-        added_count = 0
-        existing_diets = {d.name.strip().lower() for d in Diet.query.all()}
-        
-        for index, row in df.iterrows():
-            diet_name = str(row["Diet"]).strip()
-            if not diet_name or diet_name.lower() == 'nan':
-                continue
-                
-            diet_name_lower = diet_name.lower()
-            if diet_name_lower not in existing_diets:
-                new_diet = Diet(name=diet_name)
-                db.session.add(new_diet)
-                existing_diets.add(diet_name_lower)
-                added_count += 1
-                
-        db.session.commit()
+        added_count = _add_diets_from_csv(file)
         return jsonify({"message": f"הועלו בהצלחה {added_count} דיאטות חדשות.", "added": added_count}), 200
-        
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@job_handler(UPLOAD_JOB)
+def _run_upload_job(job) -> dict:
+    """Job handler: adds the diets from the uploaded CSV."""
+    return {"added": _add_diets_from_csv(job.input_path())}
+
 @diets_bp.route('/api/diets', methods=['POST'])
 def add_diet():
     """Creates a new food diet definition."""
@@ -0,0 +1,49 @@
+"""Job routes: progress and output of background jobs."""
+
+import os
+from flask import Blueprint, jsonify, request, send_file
+
+from models import Job
+from jobs import job_file_path, job_to_dict, JOB_SUCCEEDED, JOB_FILE_RETENTION_HOURS
+
+jobs_bp = Blueprint('jobs_bp', __name__)
+
+def wants_async() -> bool:
+    """True when the client sent `Prefer: respond-async` (RFC 7240) and should get a job instead of waiting."""
+    return 'respond-async' in request.headers.get('Prefer', '').lower()
+
+def job_accepted(job: Job):
+    """202 response pointing the client at the job's status URL."""
+    response = jsonify({"job": job_to_dict(job)})
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job.id}"
+    return response
+
+@jobs_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Returns the status, progress and result of a background job."""
+    job = Job.query.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_to_dict(job))
+
+@jobs_bp.route('/api/jobs/<int:job_id>/file', methods=['GET'])
+def get_job_file(job_id):
+    """Downloads the file a finished job produced (e.g. the export archive)."""
+    job = Job.query.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    path = job_file_path(job)
+    if job.status != JOB_SUCCEEDED or path is None:
+        return jsonify({"error": "Job has no file to download"}), 404
+    if not os.path.exists(path):
+        return jsonify({"error": f"Job file expired (files are kept {JOB_FILE_RETENTION_HOURS:g} hours)"}), 410
+
+    # Sent from disk in chunks, never read into memory whole
+    result = job.result or {}
+    return send_file(
+        path,
+        mimetype=result.get("mimetype", "application/octet-stream"),
+        as_attachment=True,
+        download_name=result.get("filename", f"job_{job.id}"),
+    )
@@ -1,5 +1,12 @@
+import math
+
 from flask import Blueprint, jsonify, request
-from models import db, Meal, FoodItem
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from models import db, Meal, MealItem, FoodItem
+from meal_nutrition import meals_using_products, recompute_meal_totals
+from meal_suggestions import SuggestionError, suggest_meals
+from routes.products import catalog_query, _int_list_arg, _product_to_dict
 
 meals_bp = Blueprint('meals_bp', __name__)
 
@@ -12,6 +19,7 @@ def _meal_to_dict(meal: Meal) -> dict:
         "diet_id":     meal.diet_id,
         "diet_name":   meal.diet.name if meal.diet else None,
         "product_ids": meal.product_ids,
+        "items":       [{"product_id": i.food_item_id, "quantity": i.quantity} for i in meal.items],
         "nutrition": {
             "calories": meal.total_calories,
             "protein":  meal.total_protein,
@@ -29,40 +37,151 @@ def _meal_to_dict(meal: Meal) -> dict:
         "updated_at": meal.updated_at.strftime('%Y-%m-%d %H:%M:%S') if meal.updated_at else None,
     }
 
+def _items_from_request(data: dict):
+    """
+    The meal's items from a request body: "items" ([{product_id, quantity}]) or, as before,
+    "product_ids" (quantity 1 each). None when the body sets neither.
+    """
+    if 'items' in data:
+        return [(int(i['product_id']), float(i.get('quantity', 1.0))) for i in data['items']]
+    if 'product_ids' in data:
+        return [(int(pid), 1.0) for pid in data['product_ids']]
+    return None
+
+def _items_error(items):
+    """Why the items cannot be saved (a non-positive or non-finite quantity, an unknown product), or None."""
+    if any(not math.isfinite(qty) or qty <= 0 for _, qty in items):
+        return "כמות חייבת להיות מספר חיובי"
+    ids = {pid for pid, _ in items}
+    if ids and len(db.session.scalars(select(FoodItem.id).where(FoodItem.id.in_(ids))).all()) < len(ids):
+        return "מוצר לא נמצא"
+    return None
+
+def _replace_items(meal: Meal, items) -> None:
+    """Replaces the meal's items (the meal must be flushed) and recomputes its totals."""
+    db.session.execute(delete(MealItem).where(MealItem.meal_id == meal.id))
+    if items:
+        db.session.execute(insert(MealItem), [
+            {"meal_id": meal.id, "position": pos, "food_item_id": pid, "quantity": qty}
+            for pos, (pid, qty) in enumerate(items)
+        ])
+    db.session.expire(meal, ['items'])
+    recompute_meal_totals(meal_ids=[meal.id])
+
 @meals_bp.route('/api/meals', methods=['GET'])
 def get_meals():
-    """Retrieves all meals ordered by most recent first."""
-    meals = Meal.query.order_by(Meal.created_at.desc()).all()
-    return jsonify([_meal_to_dict(m) for m in meals])
+    """
+    Retrieves meals ordered by most recent first.
+
+    Optional query arguments:
+        ids    - comma-separated meal IDs to return instead of every meal
+        expand - 'products' returns {"meals": [...], "products": {id: product}} instead of a list.
+                 Every product the meals use is fetched in one query and listed once,
+                 however many meals share it.
+    """
+    try:
+        meal_ids = _int_list_arg(request.args, 'ids')
+    except ValueError:
+        return jsonify({"error": "ids must be comma-separated integers"}), 400
+    expand = {e.strip() for e in request.args.get('expand', '').split(',') if e.strip()}
+    if expand - {'products'}:
+        return jsonify({"error": f"Unsupported expand: {', '.join(sorted(expand - {'products'}))}"}), 400
+
+    query = Meal.query.options(joinedload(Meal.diet), selectinload(Meal.items))
+    if meal_ids:
+        query = query.filter(Meal.id.in_(meal_ids))
+    meals = query.order_by(Meal.created_at.desc()).all()
+    data = [_meal_to_dict(m) for m in meals]
+    if 'products' not in expand:
+        return jsonify(data)
+
+    product_ids = {item.food_item_id for m in meals for item in m.items}
+    products = catalog_query().filter(FoodItem.id.in_(product_ids)).all() if product_ids else []
+    return jsonify({"meals": data, "products": {str(p.id): _product_to_dict(p) for p in products}})
 
 @meals_bp.route('/api/meals/<int:meal_id>', methods=['GET'])
 def get_meal(meal_id):
     """Retrieves a single meal by its ID, including full product details."""
-    meal = Meal.query.get(meal_id)
+    # The items and their products come back in the same query as the meal
+    meal = (
+        Meal.query
+        .options(
+            joinedload(Meal.diet),
+            joinedload(Meal.items).joinedload(MealItem.food_item).load_only(
+                FoodItem.id, FoodItem.name, FoodItem.image_url, FoodItem.calories, FoodItem.protein,
+                FoodItem.carbs, FoodItem.fat, FoodItem.sugars, FoodItem.sodium),
+        )
+        .filter_by(id=meal_id)
+        .first()
+    )
     if not meal:
         return jsonify({"error": "Meal not found"}), 404
 
     data = _meal_to_dict(meal)
-
-    # Also resolve the product_ids to full product objects so the viewer has all the data.
-    products = FoodItem.query.filter(FoodItem.id.in_(meal.product_ids)).all()
-    product_map = {p.id: p for p in products}
     data["products"] = [
         {
-            "id":       str(pid),
-            "name":     product_map[pid].name if pid in product_map else None,
-            "image":    product_map[pid].image_url if pid in product_map else None,
-            "calories": product_map[pid].calories if pid in product_map else 0,
-            "protein":  product_map[pid].protein  if pid in product_map else 0,
-            "carbs":    product_map[pid].carbs     if pid in product_map else 0,
-            "fat":      product_map[pid].fat       if pid in product_map else 0,
-            "sugares":  product_map[pid].sugars    if pid in product_map else 0,
-            "sodium":   product_map[pid].sodium    if pid in product_map else 0,
+            "id":       str(item.food_item_id),
+            "name":     item.food_item.name,
+            "image":    item.food_item.image_url,
+            "calories": item.food_item.calories,
+            "protein":  item.food_item.protein,
+            "carbs":    item.food_item.carbs,
+            "fat":      item.food_item.fat,
+            "sugares":  item.food_item.sugars,
+            "sodium":   item.food_item.sodium,
+            "quantity": item.quantity,
         }
-        for pid in meal.product_ids
+        for item in meal.items
     ]
     return jsonify(data)
 
+@meals_bp.route('/api/meals/suggest', methods=['POST'])
+def suggest():
+    """
+    Assembles new meals from the catalog that meet the given restrictions and nutrient targets.
+
+    Expected JSON body (every field optional):
+    {
+        "exclude":          [int, ...],   # sensitivity IDs the products must not contain
+        "show_may_contain": bool,         # allow products that only *may* contain them
+        "iddsi_min":        int,          # inclusive IDDSI range of every product
+        "iddsi_max":        int,
+        "diet_id":          int,          # products must list the diet's name among their properties
+        "targets":          {nutrient: {"min": float, "max": float}},   # meal totals, e.g. calories
+        "size":             int,          # products per meal (default 3)
+        "limit":            int           # number of meals (default 10)
+    }
+
+    ?expand=products adds a "products" side table ({id: product}) for every suggested product.
+    """
+    data = request.json or {}
+    try:
+        result = suggest_meals(
+            exclude_ids      = [int(i) for i in data.get('exclude', [])],
+            show_may_contain = bool(data.get('show_may_contain', False)),
+            iddsi_min        = int(data['iddsi_min']) if data.get('iddsi_min') is not None else None,
+            iddsi_max        = int(data['iddsi_max']) if data.get('iddsi_max') is not None else None,
+            diet_id          = int(data['diet_id']) if data.get('diet_id') is not None else None,
+            targets          = data.get('targets') or {},
+            size             = int(data.get('size', 3)),
+            limit            = int(data.get('limit', 10)),
+        )
+    except (SuggestionError, TypeError, ValueError, AttributeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get('expand') == 'products':
+        product_ids = {pid for s in result["suggestions"] for pid in s["product_ids"]}
+        products = catalog_query().filter(FoodItem.id.in_(product_ids)).all() if product_ids else []
+        result["products"] = {str(p.id): _product_to_dict(p) for p in products}
+    return jsonify(result)
+
+@meals_bp.route('/api/products/<int:prod_id>/meals', methods=['GET'])
+def get_product_meals(prod_id):
+    """Lists the meals that use a product (e.g. to warn before deleting or editing it)."""
+    meal_ids = meals_using_products([prod_id])
+    meals = Meal.query.options(load_only(Meal.id, Meal.name)).filter(Meal.id.in_(meal_ids)).order_by(Meal.id).all()
+    return jsonify([{"id": m.id, "name": m.name} for m in meals])
+
 @meals_bp.route('/api/meals', methods=['POST'])
 def create_meal():
     """
@@ -73,10 +192,12 @@ def create_meal():
         "name":        str  (required),
         "description": str  (optional),
         "diet_id":     int  (optional),
-        "product_ids": [int, ...],       # ordered list of food_item IDs
-        "nutrition":   {calories, protein, carbs, fat, sugares, sodium},
+        "product_ids": [int, ...],       # ordered list of food_item IDs (quantity 1 each)
+        "items":       [{product_id, quantity}, ...],   # alternative to product_ids
         "filters":     {restriction_ids, texture_ids, show_may_contain}
     }
+
+    The nutrition totals are computed from the items; a client-sent "nutrition" is ignored.
     """
     data = request.json
 
@@ -84,27 +205,25 @@ def create_meal():
     if not name:
         return jsonify({"error": "Meal name is required"}), 400
 
-    nutrition = data.get('nutrition', {})
-    filters   = data.get('filters',   {})
+    filters = data.get('filters', {})
 
     new_meal = Meal(
         name        = name,
         description = data.get('description', ''),
         diet_id     = data.get('diet_id') or None,
-        product_ids = data.get('product_ids', []),
-        total_calories = nutrition.get('calories', 0.0),
-        total_protein  = nutrition.get('protein',  0.0),
-        total_carbs    = nutrition.get('carbs',    0.0),
-        total_fat      = nutrition.get('fat',      0.0),
-        total_sugars   = nutrition.get('sugares',  0.0),
-        total_sodium   = nutrition.get('sodium',   0.0),
         filter_restriction_ids  = filters.get('restriction_ids',  []),
         filter_texture_ids      = filters.get('texture_ids',      []),
         filter_show_may_contain = filters.get('show_may_contain', False),
     )
 
     try:
+        items = _items_from_request(data) or []
+        error = _items_error(items)
+        if error:
+            return jsonify({"error": error}), 400
         db.session.add(new_meal)
+        db.session.flush()
+        _replace_items(new_meal, items)
         db.session.commit()
         return jsonify({"message": "Meal created successfully", "id": new_meal.id}), 201
     except Exception as e:
@@ -129,37 +248,35 @@ def delete_meal(meal_id):
 @meals_bp.route('/api/meals/<int:meal_id>', methods=['PUT'])
 def update_meal(meal_id):
     """
-    Updates an existing meal's details, products, nutrition snapshot, and filter state.
+    Updates an existing meal's details, products, and filter state.
 
-    Accepts the same JSON body as POST /api/meals.
+    Accepts the same JSON body as POST /api/meals; the totals are recomputed when the items change.
     """
     meal = Meal.query.get(meal_id)
     if not meal:
         return jsonify({"error": "Meal not found"}), 404
 
     data = request.json
-    nutrition = data.get('nutrition', {})
-    filters   = data.get('filters',   {})
+    filters = data.get('filters', {})
 
     try:
         if 'name'        in data: meal.name        = data['name'].strip()
         if 'description' in data: meal.description = data['description']
         if 'diet_id'     in data: meal.diet_id     = data['diet_id'] or None
-        if 'product_ids' in data: meal.product_ids = data['product_ids']
-
-        if nutrition:
-            meal.total_calories = nutrition.get('calories', meal.total_calories)
-            meal.total_protein  = nutrition.get('protein',  meal.total_protein)
-            meal.total_carbs    = nutrition.get('carbs',    meal.total_carbs)
-            meal.total_fat      = nutrition.get('fat',      meal.total_fat)
-            meal.total_sugars   = nutrition.get('sugares',  meal.total_sugars)
-            meal.total_sodium   = nutrition.get('sodium',   meal.total_sodium)
 
         if filters:
             meal.filter_restriction_ids  = filters.get('restriction_ids',  meal.filter_restriction_ids)
             meal.filter_texture_ids      = filters.get('texture_ids',      meal.filter_texture_ids)
             meal.filter_show_may_contain = filters.get('show_may_contain', meal.filter_show_may_contain)
 
+        items = _items_from_request(data)
+        if items is not None:
+            error = _items_error(items)
+            if error:
+                db.session.rollback()
+                return jsonify({"error": error}), 400
+            db.session.flush()
+            _replace_items(meal, items)
         db.session.commit()
         return jsonify({"message": "Meal updated successfully"})
     except Exception as e:
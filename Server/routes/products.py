@@ -1,17 +1,27 @@
 import os
 import uuid
+import time
 from flask import Blueprint, jsonify, request
 from werkzeug.utils import secure_filename
-from models import db, FoodItem
+from sqlalchemy import cast, func, not_, or_, text, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB, array
+from sqlalchemy.orm import defer, joinedload
+from pgvector.sqlalchemy import Vector
+from models import db, FoodItem, FoodItemCluster, NutritionCluster, Sensitivity
 from supabase import create_client, Client
 
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key) if api_key else None
-
+from catalog_cache import versioned_json
+from images import observe_upload
+from allergen_masks import sensitivity_mask, set_product_masks
+from meal_nutrition import meals_using_products, recompute_meal_totals
+from nutrition_features import NUTRITION_DIM, enqueue_standardization, index_product_nutrition
+from product_search import (
+    HYBRID_CANDIDATES, lexical_ranking, nearest_by_embedding, rrf_fuse, semantic_ranking, trigram_search_available,
+)
+from embeddings import (
+    ai_enabled, embed_query, embeddings_available, make_semantic_search_text_for_embedding, product_embedding_data,
+    enqueue_reembed, missing_embedding_condition, EMBEDDING_DIM, EMBEDDING_PENDING, EMBEDDING_READY,
+)
 
 products_bp = Blueprint('products_bp', __name__)
 
@@ -19,113 +29,382 @@ supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_ANON_KEY") or os.environ.get("SUPABASE_SERVICE_KEY")
 supabase: Client = create_client(supabase_url, supabase_key)
 
-def get_embedding(text):
-    """Helper function to generate OpenAI embedding for a given text,
-    if there is no key will fill zeroes""" 
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        return [0.0] * 1536
-    try:
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Embedding failed: {e}")
-        return [0.0] * 1536
+# Tables a serialized product is read from (it embeds its category and texture names); they key the catalog ETag
+CATALOG_TABLES = ('food_items', 'categories', 'textures')
+
+# Page size bounds for the paginated catalog query
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Nutrition substitutes: default / maximum number of results, and the HNSW candidate list size per query
+DEFAULT_SUBSTITUTES_K = 10
+MAX_SUBSTITUTES_K = 50
+SUBSTITUTES_EF_SEARCH = int(os.environ.get("SUBSTITUTES_EF_SEARCH", 100))
+# scope=cluster: clusters searched, nearest centroid first (more finds neighbours across cluster borders)
+DEFAULT_CLUSTER_PROBES = 3
+MAX_CLUSTER_PROBES = 16
+
+# Semantic search: default / maximum number of results, and the HNSW candidate list size per query
+DEFAULT_SEARCH_K = 10
+MAX_SEARCH_K = 100
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", 40))
+
+# Query-string nutrient name -> FoodItem column, used for `<nutrient>_min` / `<nutrient>_max` bounds
+NUTRIENT_COLUMNS = {
+    "calories": FoodItem.calories,
+    "protein":  FoodItem.protein,
+    "carbs":    FoodItem.carbs,
+    "fat":      FoodItem.fat,
+    "sugars":   FoodItem.sugars,
+    "sodium":   FoodItem.sodium,
+}
 
-def make_semantic_search_text_for_embedding(data: dict) -> str:
+def _product_to_dict(p: FoodItem) -> dict:
+    """Serializes a FoodItem object to the JSON shape the frontend expects."""
+    return {
+        "id": str(p.id),
+        "category": p.category_rel.name if p.category_rel else 'כללי',
+        "category_id": p.category_id,
+        "image": p.image_url,
+        "name": p.name,
+        "iddsi": p.iddsi,
+        "calories": p.calories,
+        "protein": p.protein,
+        "carbs": p.carbs,
+        "fat": p.fat,
+        "sugares": p.sugars,
+        "sodium": p.sodium,
+        "contains": p.contains,
+        "mayContain": p.may_contain,
+        "texture": p.texture_rel.name if p.texture_rel else None,
+        "texture_id": p.texture_id,
+        "properties": p.properties,
+        "company": p.company,
+        "textureNotes": p.texture_notes,
+        "allergyNotes": p.allergy_notes,
+        "forbiddenFor": p.forbidden_for,
+        "embeddingStatus": p.embedding_status,
+        "lastEditDate": p.updated_at.strftime('%Y-%m-%d %H:%M:%S') if p.updated_at else None
+    }
+
+def _nutrition_vector(p: FoodItem) -> list[float]:
+    """The 6-value nutrition_vector (calories, protein, carbs, fat, sugars, sodium) of a product."""
+    return [float(v or 0.0) for v in (p.calories, p.protein, p.carbs, p.fat, p.sugars, p.sodium)]
+
+def catalog_query():
     """
-    Builds a human-readable semantic sentence from product data
-    for use as OpenAI embedding input.
+    Base FoodItem query for endpoints that serialize products.
+
+    Category and texture names are joined into the same SELECT (instead of one lazy
+    load per row), and the large vector columns, which are never sent to the client, are skipped.
     """
-    name        = data.get('name', '')
-    company     = data.get('company', '')
-    iddsi       = data.get('iddsi', 0)
-    calories    = data.get('calories', 0.0)
-    protein     = data.get('protein', 0.0)
-    carbs       = data.get('carbs', 0.0)
-    fat         = data.get('fat', 0.0)
-    sugars      = data.get('sugares', 0.0)
-    sodium      = data.get('sodium', 0.0)
-
-    contains    = data.get('contains', [])
-    may_contain = data.get('mayContain', [])
-    properties  = data.get('properties', [])
-
-    texture_notes = data.get('textureNotes', '')
-    allergy_notes = data.get('allergyNotes', '')
-    forbidden_for = data.get('forbiddenFor', '')
-
-    # Format list fields — fall back to readable "none" strings
-    contains_str    = ", ".join(contains)    if contains    else "ללא"
-    may_contain_str = ", ".join(may_contain) if may_contain else "ללא"
-    props_str       = ", ".join(properties)  if properties  else "רגיל"
-
-    parts = [
-        f"שם מוצר: {name}.",
-        f"חברה: {company}." if company else None,
-        f"מרקם IDDSI: {iddsi}.",
-        f"קלוריות: {calories} קק״ל, חלבון: {protein}g, פחמימות: {carbs}g, שומן: {fat}g, סוכר: {sugars}g, נתרן: {sodium}mg.",
-        f"מכיל ודאית: {contains_str}.",
-        f"עלול להכיל: {may_contain_str}.",
-        f"תכונות: {props_str}.",
-        f"הערות מרקם: {texture_notes}."  if texture_notes else None,
-        f"הערות אלרגיה: {allergy_notes}." if allergy_notes else None,
-        f"אסור עבור: {forbidden_for}."    if forbidden_for else None,
-    ]
-
-    return " ".join(p for p in parts if p)
-
-def build_product_embedding_pipeline(data: dict) -> list[float]:
+    return FoodItem.query.options(
+        joinedload(FoodItem.category_rel),
+        joinedload(FoodItem.texture_rel),
+        defer(FoodItem.nutrition_vector),
+        defer(FoodItem.nutrition_std),
+        defer(FoodItem.openai_embedding),
+    )
+
+def _int_list_arg(args, key: str) -> list[int]:
+    """Parses a comma-separated list of integer IDs from the query string (e.g. ?exclude=1,4)."""
+    raw = args.get(key, '')
+    return [int(v) for v in raw.split(',') if v.strip()]
+
+def _jsonb_has_any(column, names: list[str]):
+    """True when a JSONB string array shares at least one element with `names` (NULL arrays never match)."""
+    return func.coalesce(column, cast([], JSONB)).has_any(array(names))
+
+def apply_product_filters(query, args):
     """
-    Full pipeline: data dict → semantic sentence → OpenAI embedding vector.
+    Narrows a FoodItem query with the catalog filters from the query string.
+
+    Supported arguments:
+        q                     - substring match on product name or company
+        category_id           - comma-separated category IDs
+        texture_id            - comma-separated texture IDs
+        iddsi_min, iddsi_max  - inclusive IDDSI range
+        exclude               - comma-separated sensitivity IDs the product must not contain
+        show_may_contain      - 'true' keeps products that only *may* contain an excluded allergen
+        require               - comma-separated sensitivity IDs the product must list as properties
+        <nutrient>_min/_max   - inclusive bounds for calories, protein, carbs, fat, sugars, sodium
+
+    Raises ValueError on malformed numeric arguments.
     """
-    # if there is no flag "AI_ENABLED" it will be false by default, so we won't generate embeddings.
-    ai_enabled = os.environ.get("AI_ENABLED", "false").lower() == "true"
+    term = args.get('q', '').strip()
+    if term:
+        pattern = f"%{term}%"
+        query = query.filter(or_(FoodItem.name.ilike(pattern), FoodItem.company.ilike(pattern)))
 
-    if not ai_enabled:
-        return [0.0] * 1536
+    category_ids = _int_list_arg(args, 'category_id')
+    if category_ids:
+        query = query.filter(FoodItem.category_id.in_(category_ids))
 
+    texture_ids = _int_list_arg(args, 'texture_id')
+    if texture_ids:
+        query = query.filter(FoodItem.texture_id.in_(texture_ids))
 
-    semantic_text = make_semantic_search_text_for_embedding(data)
-    print(f"[Embedding] Semantic text: {semantic_text}")   # helpful during dev
-    embedding = get_embedding(semantic_text)
-    return embedding
+    if args.get('iddsi_min'):
+        query = query.filter(FoodItem.iddsi >= int(args['iddsi_min']))
+    if args.get('iddsi_max'):
+        query = query.filter(FoodItem.iddsi <= int(args['iddsi_max']))
+
+    excluded_ids = _int_list_arg(args, 'exclude')
+    if excluded_ids:
+        check_may_contain = args.get('show_may_contain', 'false').lower() != 'true'
+        # Bitwise tests on the precomputed masks; names only for sensitivities without a bit
+        mask, names = sensitivity_mask(excluded_ids)
+        if mask:
+            query = query.filter(FoodItem.contains_mask.op('&')(mask) == 0)
+            if check_may_contain:
+                query = query.filter(FoodItem.may_contain_mask.op('&')(mask) == 0)
+        if names:
+            query = query.filter(not_(_jsonb_has_any(FoodItem.contains, names)))
+            if check_may_contain:
+                query = query.filter(not_(_jsonb_has_any(FoodItem.may_contain, names)))
+
+    required_ids = _int_list_arg(args, 'require')
+    if required_ids:
+        # properties @> '["a", "b"]' - answered by the jsonb_path_ops GIN index, unlike a mask test
+        names = [name for (name,) in db.session.query(Sensitivity.name).filter(Sensitivity.id.in_(required_ids))]
+        query = query.filter(FoodItem.properties.contains(cast(names, JSONB)))
+
+    for nutrient, column in NUTRIENT_COLUMNS.items():
+        if args.get(f'{nutrient}_min'):
+            query = query.filter(column >= float(args[f'{nutrient}_min']))
+        if args.get(f'{nutrient}_max'):
+            query = query.filter(column <= float(args[f'{nutrient}_max']))
+
+    return query
 
 @products_bp.route('/api/products', methods=['GET'])
 def get_products():
     """Retrieves all food items and formats them for the frontend."""
-    products = FoodItem.query.all()
-    result = []
-    for p in products:
-        category_name = p.category_rel.name if p.category_rel else 'כללי'
-        result.append({
-            "id": str(p.id),
-            "category": category_name,
-            "category_id": p.category_id,
-            "image": p.image_url,
-            "name": p.name,
-            "iddsi": p.iddsi,
-            "calories": p.calories,
-            "protein": p.protein,
-            "carbs": p.carbs,
-            "fat": p.fat,
-            "sugares": p.sugars,
-            "sodium": p.sodium,
-            "contains": p.contains,
-            "mayContain": p.may_contain,
-            "texture": p.texture_rel.name if p.texture_rel else None,
-            "texture_id": p.texture_id,
-            "properties": p.properties,
-            "company": p.company,
-            "textureNotes": p.texture_notes,
-            "allergyNotes": p.allergy_notes,
-            "forbiddenFor": p.forbidden_for,
-            "lastEditDate": p.updated_at.strftime('%Y-%m-%d %H:%M:%S') if p.updated_at else None
-        })
-    return jsonify(result)
+    return versioned_json(CATALOG_TABLES, lambda: [_product_to_dict(p) for p in catalog_query().all()])
+
+@products_bp.route('/api/products/query', methods=['GET'])
+def query_products():
+    """
+    Returns one page of the catalog, filtered and paginated in SQL.
+
+    Accepts the filters documented on `apply_product_filters` plus:
+        limit - page size (default 50, max 200)
+        after - cursor returned as `next_cursor` by the previous page
+
+    Response: {"items": [...], "next_cursor": str | null}
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        query = apply_product_filters(catalog_query(), request.args)
+        after = request.args.get('after')
+        if after:
+            query = query.filter(FoodItem.id > int(after))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {e}"}), 400
+
+    def page():
+        # Keyset pagination: fetch one extra row to know whether another page exists
+        products = query.order_by(FoodItem.id).limit(limit + 1).all()
+        has_more = len(products) > limit
+        products = products[:limit]
+        return {
+            "items": [_product_to_dict(p) for p in products],
+            "next_cursor": str(products[-1].id) if has_more else None,
+        }
+
+    return versioned_json(CATALOG_TABLES, page)
+
+@products_bp.route('/api/products/search', methods=['GET'])
+def search_products():
+    """
+    Natural-language product search: cosine top-k over openai_embedding using the pgvector HNSW index.
+
+    Query string:
+        q - free-text search term (required)
+        k - number of results (default 10, max 100)
+        plus any filter documented on `apply_product_filters` (allergens, texture, IDDSI...),
+        applied inside the same SQL query as the vector ordering.
+
+    Response: {"items": [{...product, "score": float}, ...]} ordered by similarity. Products not
+    embedded yet (just added or edited, or after an embedder switch) cannot be ranked by
+    similarity; those whose text contains the term follow the ranked ones, with "score": null.
+    """
+    term = request.args.get('q', '').strip()
+    if not term:
+        return jsonify({"error": "Search term 'q' is required"}), 400
+    if not embeddings_available():
+        return jsonify({"error": "Semantic search is not available (AI is disabled)"}), 503
+
+    # `q` is the semantic query here, so keep it out of the lexical name/company filter
+    filter_args = request.args.to_dict()
+    filter_args.pop('q')
+    try:
+        k = min(max(int(request.args.get('k', DEFAULT_SEARCH_K)), 1), MAX_SEARCH_K)
+        query = apply_product_filters(catalog_query(), filter_args)
+        id_query = apply_product_filters(db.session.query(FoodItem.id), filter_args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {e}"}), 400
+
+    query_vector = embed_query(term)
+    if not any(query_vector):
+        # The embedding call failed (zeros): every distance would be undefined and the result empty
+        return jsonify({"error": "Semantic search is temporarily unavailable (the query could not be embedded)"}), 503
+
+    items = []
+    for product, dist in nearest_by_embedding(query, query_vector, k, HNSW_EF_SEARCH):
+        item = _product_to_dict(product)
+        item["score"] = round(1.0 - dist, 4)
+        items.append(item)
+
+    if len(items) < k:
+        # Until the re-embedding job reaches them, unembedded products only hold a zero placeholder
+        seen = {int(item["id"]) for item in items}
+        ids = [pid for pid in lexical_ranking(id_query.filter(missing_embedding_condition()), term, k)
+               if pid not in seen][:k - len(items)]
+        products = {p.id: p for p in catalog_query().filter(FoodItem.id.in_(ids))}
+        for product_id in ids:
+            item = _product_to_dict(products[product_id])
+            item["score"] = None
+            items.append(item)
+    return jsonify({"items": items})
+
+@products_bp.route('/api/products/hybrid-search', methods=['GET'])
+def hybrid_search_products():
+    """
+    Typo-tolerant product search over the name, texture notes, allergy notes and forbidden-for
+    text, fused (reciprocal-rank fusion) with semantic search when AI is enabled.
+
+    Query string:
+        q - search term (required)
+        k - number of results (default 10, max 100)
+        plus any filter documented on `apply_product_filters` (allergens, texture, IDDSI...),
+        applied to both rankings before they are cut to their candidates.
+
+    Response: {"items": [{...product, "score": float, "lexical_rank": int | null,
+                          "semantic_rank": int | null}, ...], "semantic": bool, "typo_tolerant": bool}
+    best first.
+    """
+    term = request.args.get('q', '').strip()
+    if not term:
+        return jsonify({"error": "Search term 'q' is required"}), 400
+
+    # `q` is the search term here, so keep it out of the lexical name/company filter
+    filter_args = request.args.to_dict()
+    filter_args.pop('q')
+    try:
+        k = min(max(int(request.args.get('k', DEFAULT_SEARCH_K)), 1), MAX_SEARCH_K)
+        id_query = apply_product_filters(db.session.query(FoodItem.id), filter_args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {e}"}), 400
+
+    rankings = {"lexical": lexical_ranking(id_query, term, max(HYBRID_CANDIDATES, k))}
+    # Lexical results only when embedding the query fails (zeros)
+    query_vector = embed_query(term) if embeddings_available() else None
+    semantic = query_vector is not None and any(query_vector)
+    if semantic:
+        rankings["semantic"] = semantic_ranking(id_query, query_vector, max(HYBRID_CANDIDATES, k))
+    fused = rrf_fuse(rankings.values())[:k]
+
+    products = {p.id: p for p in catalog_query().filter(FoodItem.id.in_([pid for pid, _ in fused]))}
+    ranks = {name: {pid: rank for rank, pid in enumerate(ids, start=1)} for name, ids in rankings.items()}
+    items = []
+    for product_id, score in fused:
+        item = _product_to_dict(products[product_id])
+        item["score"] = round(score, 6)
+        item["lexical_rank"] = ranks["lexical"].get(product_id)
+        item["semantic_rank"] = ranks.get("semantic", {}).get(product_id)
+        items.append(item)
+    return jsonify({"items": items, "semantic": semantic, "typo_tolerant": trigram_search_available()})
+
+@products_bp.route('/api/products/<int:prod_id>/substitutes', methods=['GET'])
+def get_substitutes(prod_id):
+    """
+    Products with the most similar nutrition to a product: L2 top-k over the standardized
+    nutrition vectors, using the pgvector HNSW index on nutrition_std.
+
+    Query string:
+        k     - number of results (default 10, max 50)
+        scope  - 'catalog' (default) or 'cluster': rank exactly, but only the products of the
+                 nutrition clusters nearest to the product (cost grows with the clusters, not the catalog)
+        probes - scope=cluster: number of clusters searched (default 3, max 16)
+        plus any filter documented on `apply_product_filters` (allergens, texture, IDDSI...),
+        applied inside the same SQL query as the vector ordering.
+
+    Response: {"items": [{...product, "distance": float}, ...]} closest first.
+    """
+    target = db.session.query(FoodItem.nutrition_std).filter(FoodItem.id == prod_id).first()
+    if target is None:
+        return jsonify({"error": "Product not found"}), 404
+    if target.nutrition_std is None:
+        return jsonify({"error": "Product has no nutrition profile yet"}), 409
+
+    scope = request.args.get('scope', 'catalog')
+    if scope not in ('catalog', 'cluster'):
+        return jsonify({"error": "scope must be 'catalog' or 'cluster'"}), 400
+    try:
+        k = min(max(int(request.args.get('k', DEFAULT_SUBSTITUTES_K)), 1), MAX_SUBSTITUTES_K)
+        probes = min(max(int(request.args.get('probes', DEFAULT_CLUSTER_PROBES)), 1), MAX_CLUSTER_PROBES)
+        query = apply_product_filters(catalog_query(), request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {e}"}), 400
+
+    if scope == 'cluster':
+        # The product's own cluster comes first: products are assigned to their nearest centroid
+        target_std = type_coerce(target.nutrition_std, Vector(NUTRITION_DIM))
+        cluster_ids = [cid for (cid,) in db.session.query(NutritionCluster.id)
+                       .order_by(NutritionCluster.centroid.l2_distance(target_std)).limit(probes)]
+        if not cluster_ids:
+            return jsonify({"error": "Products have not been clustered yet"}), 409
+        # Members first (an index-only scan), so the products are then fetched by primary key
+        member_ids = [pid for (pid,) in db.session.query(FoodItemCluster.food_item_id)
+                      .filter(FoodItemCluster.cluster_id.in_(cluster_ids))]
+        # l2_distance() instead of <->: the HNSW index only serves the operator, and through it the
+        # cluster filter would apply to its first ef_search candidates instead of the whole clusters
+        exact = func.l2_distance(FoodItem.nutrition_std, target_std)
+        rows = (
+            query.filter(FoodItem.id.in_(member_ids), FoodItem.id != prod_id)
+            .add_columns(exact.label('distance'))
+            .order_by(exact)
+            .limit(k)
+            .all()
+        )
+        return jsonify({"items": _substitute_items(rows), "cluster_ids": cluster_ids})
+
+    # Nearest products first, through the HNSW index and without filters: the planner cannot
+    # estimate the allergen mask tests, and with them it would skip the index and sort the catalog
+    distance = FoodItem.nutrition_std.l2_distance(target.nutrition_std).label('distance')
+    candidates = max(SUBSTITUTES_EF_SEARCH, k)
+    db.session.execute(text(f"SET LOCAL hnsw.ef_search = {candidates}"))
+    nearest = (
+        db.session.query(FoodItem.id.label('id'), distance)
+        .filter(FoodItem.nutrition_std.isnot(None), FoodItem.id != prod_id)
+        .order_by(distance)
+        .limit(candidates)
+        .subquery()
+    )
+    rows = query.join(nearest, nearest.c.id == FoodItem.id).add_columns(nearest.c.distance) \
+        .order_by(nearest.c.distance).limit(k).all()
+    if len(rows) < k:
+        # Restrictive filters can reject most of those candidates: rank the filtered set exactly instead
+        exact = (
+            apply_product_filters(db.session.query(FoodItem.id.label('id'), distance), request.args)
+            .filter(FoodItem.nutrition_std.isnot(None), FoodItem.id != prod_id)
+            .order_by(distance)
+            .limit(k)
+            .subquery()
+        )
+        rows = catalog_query().join(exact, exact.c.id == FoodItem.id).add_columns(exact.c.distance) \
+            .order_by(exact.c.distance).all()
+    return jsonify({"items": _substitute_items(rows)})
+
+def _substitute_items(rows) -> list[dict]:
+    """(product, distance) rows -> serialized products with their distance."""
+    items = []
+    for product, dist in rows:
+        item = _product_to_dict(product)
+        item["distance"] = round(dist, 4)
+        items.append(item)
+    return items
 
 @products_bp.route('/api/upload', methods=['POST'])
 def upload_image():
@@ -148,11 +427,17 @@ def upload_image():
             content_type = file.content_type
             
             # Upload to Supabase Storage bucket named 'products'
-            supabase.storage.from_("products").upload(
-                path=unique_filename,
-                file=file_bytes,
-                file_options={"content-type": content_type}
-            )
+            started = time.perf_counter()
+            try:
+                supabase.storage.from_("products").upload(
+                    path=unique_filename,
+                    file=file_bytes,
+                    file_options={"content-type": content_type}
+                )
+            except Exception:
+                observe_upload("api", started, "error")
+                raise
+            observe_upload("api", started, "ok")
             
             # Get the public URL
             public_url = supabase.storage.from_("products").get_public_url(unique_filename)
@@ -193,12 +478,21 @@ def add_product():
             data.get('sugares', 0.0),
             data.get('sodium', 0.0)
         ],
-        openai_embedding=build_product_embedding_pipeline(data)
+        # The real embedding is computed off the request path by the re-embedding worker
+        openai_embedding=[0.0] * EMBEDDING_DIM,
+        embedding_status=EMBEDDING_PENDING if ai_enabled() else EMBEDDING_READY,
     )
     
     try:
+        set_product_masks(new_product)
         db.session.add(new_product)
+        db.session.flush()
+        nutrition_indexed = index_product_nutrition([new_product.id])
         db.session.commit()
+        if not nutrition_indexed:
+            enqueue_standardization()
+        if ai_enabled():
+            enqueue_reembed([new_product.id])
         return jsonify({"message": "Product added successfully", "id": new_product.id}), 201
     except Exception as e:
         db.session.rollback()
@@ -212,6 +506,7 @@ def update_product(prod_id):
         return jsonify({"error": "Product not found"}), 404
         
     data = request.json
+    semantic_text_before = make_semantic_search_text_for_embedding(product_embedding_data(product))
     try:
         if 'name' in data: product.name = data['name']
         if 'category_id' in data: product.category_id = data['category_id']
@@ -231,8 +526,31 @@ def update_product(prod_id):
         if 'textureNotes' in data: product.texture_notes = data['textureNotes']
         if 'allergyNotes' in data: product.allergy_notes = data['allergyNotes']
         if 'forbiddenFor' in data: product.forbidden_for = data['forbiddenFor']
-        
+
+        nutrients_changed = any(k in data for k in ('calories', 'protein', 'carbs', 'fat', 'sugares', 'sodium'))
+        if nutrients_changed:
+            product.nutrition_vector = _nutrition_vector(product)
+        if any(k in data for k in ('contains', 'mayContain', 'properties')):
+            set_product_masks(product)
+
+        # Only edits to fields that feed the semantic text make the embedding stale
+        needs_reembed = ai_enabled() and (
+            make_semantic_search_text_for_embedding(product_embedding_data(product)) != semantic_text_before
+        )
+        if needs_reembed:
+            product.embedding_status = EMBEDDING_PENDING
+
+        nutrition_indexed = True
+        if nutrients_changed:
+            # Every meal using this product gets its totals refreshed in the same transaction
+            db.session.flush()
+            nutrition_indexed = index_product_nutrition([product.id])
+            recompute_meal_totals(product_ids=[product.id])
         db.session.commit()
+        if not nutrition_indexed:
+            enqueue_standardization()
+        if needs_reembed:
+            enqueue_reembed([product.id])
         return jsonify({"message": "Product updated successfully"})
     except Exception as e:
         db.session.rollback()
@@ -246,17 +564,25 @@ def delete_product(prod_id):
         return jsonify({"error": "Product not found"}), 404
         
     try:
-        # Delete image from Supabase if it exists
-        if product.image_url and "supabase.co/storage/v1/object/public/products/" in product.image_url:
+        # Delete image from Supabase if it exists and no other product shares it
+        # (imported images are content-addressed, so identical images share one object)
+        shared = product.image_url and FoodItem.query.filter(
+            FoodItem.image_url == product.image_url, FoodItem.id != product.id
+        ).first() is not None
+        if product.image_url and not shared and "supabase.co/storage/v1/object/public/products/" in product.image_url:
             filename = product.image_url.split("/")[-1]
             try:
                 supabase.storage.from_("products").remove([filename])
             except Exception as e:
                 print(f"Failed to delete image from Supabase: {e}")
 
+        # The delete cascades to meal_items, so find the meals using the product first
+        affected_meals = meals_using_products([prod_id])
         db.session.delete(product)
+        db.session.flush()
+        recompute_meal_totals(meal_ids=affected_meals)
         db.session.commit()
-        return jsonify({"message": "Product and associated image deleted successfully"})
+        return jsonify({"message": "Product and associated image deleted successfully", "affected_meals": affected_meals})
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
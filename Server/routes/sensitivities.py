@@ -1,14 +1,19 @@
 from flask import Blueprint, jsonify, request, Response
 import pandas as pd
 from models import db, Sensitivity
+from jobs import enqueue_job, job_handler
+from catalog_cache import versioned_json
+from allergen_masks import refresh_allergen_masks
+from routes.jobs import job_accepted, wants_async
 
 sensitivities_bp = Blueprint('sensitivities_bp', __name__)
 
+UPLOAD_JOB = 'sensitivities_upload'
+
 @sensitivities_bp.route('/api/sensitivities', methods=['GET'])
 def get_sensitivities():
     """Retrieves all dietary sensitivities and allergies."""
-    sensitivities = Sensitivity.query.all()
-    return jsonify([{"id": s.id, "name": s.name} for s in sensitivities])
+    return versioned_json(('sensitivities',), lambda: [{"id": s.id, "name": s.name} for s in Sensitivity.query.all()])
 
 @sensitivities_bp.route('/api/sensitivities/table', methods=['GET'])
 def get_sensitivities_table():
@@ -26,42 +31,60 @@ def get_sensitivities_table():
     )
     return response
 
+def _add_sensitivities_from_csv(file) -> int:
+    """Adds every sensitivity in the CSV that does not exist yet (case-insensitive). Returns how many were added."""
+    df = pd.read_csv(file)
+    if "Sensitivity" not in df.columns:
+        raise ValueError("CSV must contain a 'Sensitivity' column")
+        
+    added_count = 0
+    existing_sensitivities = {s.name.strip().lower() for s in Sensitivity.query.all()}
+    
+    for index, row in df.iterrows():
+        sens_name = str(row["Sensitivity"]).strip()
+        if not sens_name or sens_name.lower() == 'nan':
+            continue
+            
+        sens_name_lower = sens_name.lower()
+        if sens_name_lower not in existing_sensitivities:
+            new_sens = Sensitivity(name=sens_name)
+            db.session.add(new_sens)
+            existing_sensitivities.add(sens_name_lower)
+            added_count += 1
+            
+    db.session.flush()
+    refresh_allergen_masks()
+    db.session.commit()
+    return added_count
+
 @sensitivities_bp.route('/api/sensitivities/upload', methods=['POST'])
 def upload_sensitivities():
-    """Uploads a CSV file of sensitivities, ignoring duplicates."""
+    """Uploads a CSV file of sensitivities, ignoring duplicates. With `Prefer: respond-async` the file is queued as a background job."""
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-        
+
+    if wants_async():
+        return job_accepted(enqueue_job(UPLOAD_JOB, {"filename": file.filename}, input_file=file))
+
     try:
-        df = pd.read_csv(file)
-        if "Sensitivity" not in df.columns:
-            return jsonify({"error": "CSV must contain a 'Sensitivity' column"}), 400
-            
-        added_count = 0
-        existing_sensitivities = {s.name.strip().lower() for s in Sensitivity.query.all()}
-        
-        for index, row in df.iterrows():
-            sens_name = str(row["Sensitivity"]).strip()
-            if not sens_name or sens_name.lower() == 'nan':
-                continue
-                
-            sens_name_lower = sens_name.lower()
-            if sens_name_lower not in existing_sensitivities:
-                new_sens = Sensitivity(name=sens_name)
-                db.session.add(new_sens)
-                existing_sensitivities.add(sens_name_lower)
-                added_count += 1
-                
-        db.session.commit()
+        added_count = _add_sensitivities_from_csv(file)
         return jsonify({"message": f"הועלו בהצלחה {added_count} רגישויות חדשות.", "added": added_count}), 200
-        
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@job_handler(UPLOAD_JOB)
+def _run_upload_job(job) -> dict:
+    """Job handler: adds the sensitivities from the uploaded CSV."""
+    return {"added": _add_sensitivities_from_csv(job.input_path())}
+
 @sensitivities_bp.route('/api/sensitivities', methods=['POST'])
 def add_sensitivity():
     """Creates a new dietary sensitivity or allergy property."""
@@ -75,6 +98,9 @@ def add_sensitivity():
         
     new_sens = Sensitivity(name=name)
     db.session.add(new_sens)
+    db.session.flush()
+    # Products may already list this name; give it a bit and pick them up
+    refresh_allergen_masks()
     db.session.commit()
     return jsonify({"message": "Sensitivity created", "id": new_sens.id}), 201
 
@@ -95,6 +121,9 @@ def update_sensitivity(sens_id):
         return jsonify({"error": "Sensitivity name already exists"}), 400
         
     sens.name = new_name
+    db.session.flush()
+    # Products store names, so the rename changes which of them carry this bit
+    refresh_allergen_masks()
     db.session.commit()
     return jsonify({"message": "Sensitivity updated"})
 
@@ -106,5 +135,8 @@ def delete_sensitivity(sens_id):
         return jsonify({"error": "Sensitivity not found"}), 404
         
     db.session.delete(sens)
+    db.session.flush()
+    # Clears the freed bit from every product, so a future sensitivity can reuse it
+    refresh_allergen_masks()
     db.session.commit()
     return jsonify({"message": "Sensitivity deleted"})
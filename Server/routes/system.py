@@ -1,17 +1,23 @@
 import os
 import io
+import csv
 import zipfile
-import uuid
-import requests
 import json
 import pandas as pd
-from flask import Blueprint, jsonify, send_from_directory, current_app, request, Response
-from werkzeug.utils import secure_filename
-from sqlalchemy import text
-from supabase import create_client, Client
+from flask import Blueprint, jsonify, send_from_directory, current_app, request, Response, stream_with_context
+from supabase import create_client
 
 from models import db, FoodItem, Category, Sensitivity, Texture, Diet
-from routes.products import build_product_embedding_pipeline
+from images import ContentAddressedUploader, content_address, content_addressed_name, fetch_images, image_extension
+from bulk_import import import_backup_archive
+from migrations import run_pending_migrations
+from nutrition_features import enqueue_standardization
+from nutrition_clusters import MAX_CLUSTERS, enqueue_cluster_rebuild
+from embeddings import EMBEDDING_MODEL, backfill_status, embedding_cache_stats, start_background_backfill
+from jobs import enqueue_job, job_handler
+from catalog_cache import catalog_cache_stats
+import metrics
+from routes.jobs import job_accepted, wants_async
 
 system_bp = Blueprint('system_bp', __name__)
 
@@ -20,6 +26,11 @@ def status():
     """Simple health check route to verify server status."""
     return jsonify({"status": "Flask is running and connected to PostgreSQL!"})
 
+@system_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, database, embedding, storage upload and cache metrics of this process, in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @system_bp.route('/uploads/<filename>')
 def uploaded_file(filename):
     """Serves locally uploaded files (legacy use-case)."""
@@ -28,339 +39,290 @@ def uploaded_file(filename):
 @system_bp.route('/api/run-migrations', methods=['GET'])
 def run_migrations():
     """
-    Run database migrations manually to add missing columns in production
-    without dropping the tables.
+    Applies any pending schema migrations (see migrations.py) without dropping the tables.
+    They also run at server start; this route is for databases changed while the server was up.
     """
     try:
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS company VARCHAR(100);"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS texture_notes TEXT;"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS allergy_notes TEXT;"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS forbidden_for VARCHAR(200);"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS texture_id INTEGER REFERENCES textures(id);"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS nutrition_vector vector(6);"))
-        db.session.execute(text("ALTER TABLE food_items ADD COLUMN IF NOT EXISTS openai_embedding vector(1536);"))
-        db.session.execute(text("""
-            CREATE TABLE IF NOT EXISTS meals (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(200) NOT NULL,
-                description TEXT,
-                diet_id INTEGER REFERENCES diets(id) ON DELETE SET NULL,
-                product_ids JSONB DEFAULT '[]',
-                total_calories FLOAT DEFAULT 0,
-                total_protein  FLOAT DEFAULT 0,
-                total_carbs    FLOAT DEFAULT 0,
-                total_fat      FLOAT DEFAULT 0,
-                total_sugars   FLOAT DEFAULT 0,
-                total_sodium   FLOAT DEFAULT 0,
-                filter_restriction_ids  JSONB DEFAULT '[]',
-                filter_texture_ids      JSONB DEFAULT '[]',
-                filter_show_may_contain BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """))
-        db.session.commit()
-        return jsonify({"message": "Database migrations completed successfully!"}), 200
+        applied = run_pending_migrations()
+        return jsonify({"message": "Database migrations completed successfully!", "applied": applied}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Migration failed: {str(e)}"}), 500
 
+# ================= Embeddings =================
+
+@system_bp.route('/api/system/embeddings/backfill', methods=['POST'])
+def start_embedding_backfill():
+    """Queues a background job that embeds every product missing an embedding."""
+    job = start_background_backfill()
+    if job is None:
+        return jsonify({"error": "AI is disabled - embeddings cannot be generated"}), 503
+    return job_accepted(job)
+
+@system_bp.route('/api/system/embeddings/backfill', methods=['GET'])
+def get_embedding_backfill():
+    """Reports the most recent embedding backfill job."""
+    status = backfill_status()
+    if status is None:
+        return jsonify({"error": "No backfill has been started"}), 404
+    return jsonify(status)
+
+@system_bp.route('/api/system/embeddings/cache', methods=['GET'])
+def get_embedding_cache_stats():
+    """Reports embedding cache hits and misses for this server process."""
+    return jsonify(embedding_cache_stats())
+
+@system_bp.route('/api/system/catalog-cache', methods=['GET'])
+def get_catalog_cache_stats():
+    """Reports catalog response cache hits and misses for this server process."""
+    return jsonify(catalog_cache_stats())
+
+# ================= Nutrition features =================
+
+@system_bp.route('/api/system/nutrition-scaling', methods=['POST'])
+def start_nutrition_scaling():
+    """
+    Queues a job that recomputes the catalog nutrition statistics and restandardizes every product.
+    Individual edits and imports reuse the current statistics, so run this after the catalog changed a lot.
+    """
+    return job_accepted(enqueue_standardization(rescale=True))
+
+@system_bp.route('/api/system/nutrition-clusters', methods=['POST'])
+def start_nutrition_clustering():
+    """
+    Queues a k-means reclustering of the standardized nutrition vectors. Optional JSON body
+    {"k": int} sets the number of clusters (default: about sqrt(products / 2)).
+    """
+    k = (request.get_json(silent=True) or {}).get('k')
+    if k is not None and (not isinstance(k, int) or not 1 <= k <= MAX_CLUSTERS):
+        return jsonify({"error": f"k must be an integer between 1 and {MAX_CLUSTERS}"}), 400
+    return job_accepted(enqueue_cluster_rebuild(k))
+
 # ================= Backup and Restore (ZIP) =================
 
+# Flush the ZIP stream to the client whenever this many compressed bytes are buffered
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Export jobs report progress each time this many more archive bytes have been written
+EXPORT_PROGRESS_BYTES = 8 * 1024 * 1024
+
+EXPORT_JOB = 'export'
+IMPORT_JOB = 'import'
+
+# Column order of products.csv in the backup archive
+PRODUCT_EXPORT_COLUMNS = [
+    "id", "name", "category_id", "image_url", "iddsi",
+    "calories", "protein", "carbs", "fat", "sugars", "sodium",
+    "contains", "may_contain", "texture_id", "properties", "company",
+    "texture_notes", "allergy_notes", "forbidden_for",
+    "nutrition_vector", "openai_embedding", "embedding_model",
+]
+
+class _ZipStreamSink(io.RawIOBase):
+    """
+    Write-only, non-seekable file object for zipfile. Compressed bytes accumulate here until
+    the response generator drains them, so only the current chunk is ever held in memory.
+    """
+    def __init__(self):
+        self._chunks = []
+        self.buffered = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self.buffered += len(b)
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.buffered = 0
+        return data
+
+def _product_export_row(p: FoodItem, image_path: str) -> dict:
+    """Serializes a FoodItem to one products.csv row (list and vector columns as JSON strings)."""
+    return {
+        "id": p.id,
+        "name": p.name,
+        "category_id": p.category_id,
+        "image_url": image_path if image_path else p.image_url,
+        "iddsi": p.iddsi,
+        "calories": p.calories,
+        "protein": p.protein,
+        "carbs": p.carbs,
+        "fat": p.fat,
+        "sugars": p.sugars,
+        "sodium": p.sodium,
+        "contains": json.dumps(p.contains, ensure_ascii=False) if p.contains else "[]",
+        "may_contain": json.dumps(p.may_contain, ensure_ascii=False) if p.may_contain else "[]",
+        "texture_id": p.texture_id,
+        "properties": json.dumps(p.properties, ensure_ascii=False) if p.properties else "[]",
+        "company": p.company,
+        "texture_notes": p.texture_notes,
+        "allergy_notes": p.allergy_notes,
+        "forbidden_for": p.forbidden_for,
+        "nutrition_vector": json.dumps([float(v) for v in p.nutrition_vector]) if p.nutrition_vector is not None else "",
+        "openai_embedding": json.dumps([float(v) for v in p.openai_embedding]) if p.openai_embedding is not None else "",
+        # The embedder that produced openai_embedding (NULL is the original OpenAI model)
+        "embedding_model": (p.embedding_model or EMBEDDING_MODEL) if p.openai_embedding is not None else "",
+    }
+
+def _generate_export_zip():
+    """
+    Yields the backup ZIP chunk by chunk. Products are streamed from the database with
+    server-side cursors and images are fetched concurrently with only a bounded window held
+    in memory, so memory use stays flat regardless of catalog size.
+    """
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+
+        # 1-4. Taxonomy tables (small) - written whole
+        for filename, model in (('categories.csv', Category), ('sensitivities.csv', Sensitivity),
+                                ('textures.csv', Texture), ('diets.csv', Diet)):
+            df = pd.DataFrame([{"id": row.id, "name": row.name} for row in model.query.all()])
+            zf.writestr(filename, df.to_csv(index=False).encode('utf-8-sig'))
+        yield sink.drain()
+
+        # 5a. Product images, one archive entry per distinct image. Only URL -> archive path is kept in memory.
+        # Images are stored once per distinct content (images/<sha256>.<ext>) and shared by every
+        # product that uses them. Each distinct URL is downloaded once, and URLs that already name
+        # their content (bucket objects uploaded by an import) are downloaded once per content, not
+        # per URL. Downloads run in a bounded thread pool; only this thread writes the archive.
+        url_paths = {}
+        aliases = {}  # content-addressed name -> further URLs naming it, resolved once its download succeeds
+        image_urls = (
+            db.session.query(FoodItem.image_url)
+            .filter(FoodItem.image_url.like('http%'))
+            .distinct()
+            .yield_per(1000)
+        )
+
+        def downloads():
+            for (image_url,) in image_urls:
+                name = content_addressed_name(image_url)
+                if name is None:
+                    yield image_url, image_url
+                elif name in aliases:
+                    aliases[name].append(image_url)
+                else:
+                    aliases[name] = []
+                    yield image_url, image_url
+
+        written = set()
+        for image_url, _, content in fetch_images(downloads()):
+            if content is None:
+                continue
+            local_image_path = f"images/{content_address(content, image_extension(image_url))}"
+            if local_image_path not in written:
+                zf.writestr(local_image_path, content)
+                written.add(local_image_path)
+            url_paths[image_url] = local_image_path
+            for alias in aliases.get(content_addressed_name(image_url), ()):
+                url_paths[alias] = local_image_path
+            if sink.buffered >= EXPORT_CHUNK_SIZE:
+                yield sink.drain()
+
+        # 5b. products.csv, written row by row from a server-side cursor
+        with io.TextIOWrapper(zf.open('products.csv', 'w'), encoding='utf-8-sig', newline='') as out:
+            writer = csv.DictWriter(out, fieldnames=PRODUCT_EXPORT_COLUMNS)
+            writer.writeheader()
+            for p in FoodItem.query.order_by(FoodItem.id).yield_per(500):
+                writer.writerow(_product_export_row(p, url_paths.get(p.image_url, "")))
+                if sink.buffered >= EXPORT_CHUNK_SIZE:
+                    out.flush()
+                    yield sink.drain()
+
+    # Closing the archive writes the central directory
+    yield sink.drain()
+
+EXPORT_FILENAME = "database_backup.zip"
+
 @system_bp.route('/api/system/export', methods=['GET'])
 def export_database():
     """Exports all entities into CSVs and packages all Supabase images into an 'images' folder inside the ZIP."""
+    # Embeddings missing from this backup are filled in by a background backfill job
+    # (picked up by the next export) instead of blocking this request on the embeddings API
+    start_background_backfill()
+
+    # Streamed: the first bytes go out immediately and the archive is never held in memory.
+    # Errors after streaming starts can only abort the download, so they are logged.
+    def generate():
+        try:
+            yield from _generate_export_zip()
+        except Exception as e:
+            print(f"Export failed: {e}")
+            raise
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment;filename={EXPORT_FILENAME}"}
+    )
+
+@system_bp.route('/api/system/export', methods=['POST'])
+def queue_export():
+    """Queues the export as a background job; the archive is downloaded from /api/jobs/<id>/file when done."""
+    return job_accepted(enqueue_job(EXPORT_JOB))
+
+@job_handler(EXPORT_JOB)
+def _run_export_job(job) -> dict:
+    """Job handler: writes the backup archive to the job's file on disk, chunk by chunk."""
+    start_background_backfill()
+    archive = job.new_file()
     try:
-        memory_file = io.BytesIO()
-        
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            
-            # 1. Categories
-            categories = Category.query.all()
-            df_cat = pd.DataFrame([{"id": c.id, "name": c.name} for c in categories])
-            zf.writestr('categories.csv', df_cat.to_csv(index=False).encode('utf-8-sig'))
-            
-            # 2. Sensitivities
-            sensitivities = Sensitivity.query.all()
-            df_sen = pd.DataFrame([{"id": s.id, "name": s.name} for s in sensitivities])
-            zf.writestr('sensitivities.csv', df_sen.to_csv(index=False).encode('utf-8-sig'))
-            
-            # 3. Textures
-            textures = Texture.query.all()
-            df_tex = pd.DataFrame([{"id": t.id, "name": t.name} for t in textures])
-            zf.writestr('textures.csv', df_tex.to_csv(index=False).encode('utf-8-sig'))
-            
-            # 4. Diets
-            diets = Diet.query.all()
-            df_diet = pd.DataFrame([{"id": d.id, "name": d.name} for d in diets])
-            zf.writestr('diets.csv', df_diet.to_csv(index=False).encode('utf-8-sig'))
-            
-            # 5. FoodItems
-            products = FoodItem.query.all()
-
-            # Backfill missing openai_embedding before export so the backup has no nulls
-            needs_commit = False
-            for p in products:
-                if p.openai_embedding is None or all(v == 0.0 for v in p.openai_embedding):
-                    data = {
-                        "name": p.name, "company": p.company, "iddsi": p.iddsi,
-                        "calories": p.calories, "protein": p.protein, "carbs": p.carbs,
-                        "fat": p.fat, "sugares": p.sugars, "sodium": p.sodium,
-                        "contains": p.contains, "mayContain": p.may_contain,
-                        "properties": p.properties, "textureNotes": p.texture_notes,
-                        "allergyNotes": p.allergy_notes, "forbiddenFor": p.forbidden_for,
-                    }
-                    p.openai_embedding = build_product_embedding_pipeline(data)
-                    needs_commit = True
-            if needs_commit:
-                db.session.commit()
-
-            prod_data = []
-
-            for p in products:
-                # Handle Image download into ZIP
-                local_image_path = ""
-                if p.image_url and p.image_url.startswith("http"):
-                    try:
-                        resp = requests.get(p.image_url, stream=True, timeout=5)
-                        if resp.status_code == 200:
-                            ext = p.image_url.split('.')[-1]
-                            if len(ext) > 4 or '?' in ext: ext = 'jpg'
-                            local_image_path = f"images/{p.id}_{uuid.uuid4().hex[:6]}.{ext}"
-                            # Write raw image bytes directly into the zip file
-                            zf.writestr(local_image_path, resp.content)
-                    except Exception as e:
-                        print(f"Failed to fetch image for export: {p.image_url} -> {e}")
-
-                prod_data.append({
-                    "id": p.id,
-                    "name": p.name,
-                    "category_id": p.category_id,
-                    "image_url": local_image_path if local_image_path else p.image_url,
-                    "iddsi": p.iddsi,
-                    "calories": p.calories,
-                    "protein": p.protein,
-                    "carbs": p.carbs,
-                    "fat": p.fat,
-                    "sugars": p.sugars,
-                    "sodium": p.sodium,
-                    "contains": json.dumps(p.contains, ensure_ascii=False) if p.contains else "[]",
-                    "may_contain": json.dumps(p.may_contain, ensure_ascii=False) if p.may_contain else "[]",
-                    "texture_id": p.texture_id,
-                    "properties": json.dumps(p.properties, ensure_ascii=False) if p.properties else "[]",
-                    "company": p.company,
-                    "texture_notes": p.texture_notes,
-                    "allergy_notes": p.allergy_notes,
-                    "forbidden_for": p.forbidden_for,
-                    "nutrition_vector": json.dumps([float(v) for v in p.nutrition_vector]) if p.nutrition_vector is not None else "",
-                    "openai_embedding": json.dumps([float(v) for v in p.openai_embedding]) if p.openai_embedding is not None else "",
-                })
-            df_prod = pd.DataFrame(prod_data)
-            zf.writestr('products.csv', df_prod.to_csv(index=False).encode('utf-8-sig'))
-
-        memory_file.seek(0)
-        
-        return Response(
-            memory_file,
-            mimetype="application/zip",
-            headers={"Content-Disposition": "attachment;filename=database_backup.zip"}
-        )
-    except Exception as e:
-        return jsonify({"error": f"Export failed: {str(e)}"}), 500
+        with archive:
+            size = 0
+            for chunk in _generate_export_zip():
+                archive.write(chunk)
+                size += len(chunk)
+                if size // EXPORT_PROGRESS_BYTES != (size - len(chunk)) // EXPORT_PROGRESS_BYTES:
+                    job.report_progress(bytes_written=size)
+    except Exception:
+        os.remove(archive.name)
+        raise
+    job.attach_file(archive.name)
+    return {"filename": EXPORT_FILENAME, "mimetype": "application/zip", "size": size}
+
+def _backup_uploader():
+    """Content-addressed uploader for packaged images, or None when Supabase is not configured."""
+    supabase_url = os.environ.get("SUPABASE_URL", "")
+    supabase_key = os.environ.get("SUPABASE_ANON_KEY") or os.environ.get("SUPABASE_SERVICE_KEY")
+    if supabase_url and supabase_key:
+        return ContentAddressedUploader(create_client(supabase_url, supabase_key))
+    return None
 
 @system_bp.route('/api/system/import', methods=['POST'])
 def import_database():
-    """Imports CSV data and pushes bundled images directly from the ZIP into Supabase."""
+    """
+    Imports CSV data and pushes bundled images directly from the ZIP into Supabase.
+    With `Prefer: respond-async` the archive is queued as a background job instead (202 + job).
+    """
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-        
+
+    if wants_async():
+        return job_accepted(enqueue_job(IMPORT_JOB, {"filename": file.filename}, input_file=file))
+
     try:
-        supabase_url = os.environ.get("SUPABASE_URL", "")
-        supabase_key = os.environ.get("SUPABASE_ANON_KEY") or os.environ.get("SUPABASE_SERVICE_KEY")
-        supabase: Client = None
-        if supabase_url and supabase_key:
-            supabase = create_client(supabase_url, supabase_key)
-            
         with zipfile.ZipFile(file, 'r') as zf:
-            file_names = zf.namelist()
-            
-            def read_csv_from_zip(filename):
-                if filename in file_names:
-                    with zf.open(filename) as f:
-                        try:
-                            return pd.read_csv(f)
-                        except Exception as e:
-                            # Catching any pandas error (EmptyDataError, ParserError, etc.)
-                            print(f"Skipping {filename} due to read error: {e}")
-                            return None
-                return None
-
-            cat_id_map = {}
-            tex_id_map = {}
-            
-            # --- 1. Categories ---
-            df_cat = read_csv_from_zip('categories.csv')
-            cat_added = 0
-            if df_cat is not None and not df_cat.empty:
-                existing_cats = {c.name.strip().lower(): c for c in Category.query.all()}
-                for _, row in df_cat.iterrows():
-                    old_id = row.get("id")
-                    name = str(row.get("name", "")).strip()
-                    if not name or name.lower() == 'nan': continue
-                    if name.lower() in existing_cats:
-                        cat_id_map[old_id] = existing_cats[name.lower()].id
-                    else:
-                        new_cat = Category(name=name)
-                        db.session.add(new_cat)
-                        db.session.flush()
-                        cat_id_map[old_id] = new_cat.id
-                        existing_cats[name.lower()] = new_cat
-                        cat_added += 1
-
-            # --- 2. Sensitivities ---
-            df_sen = read_csv_from_zip('sensitivities.csv')
-            sen_added = 0
-            if df_sen is not None and not df_sen.empty:
-                existing_sens = {s.name.strip().lower() for s in Sensitivity.query.all()}
-                for _, row in df_sen.iterrows():
-                    name = str(row.get("name", "")).strip()
-                    if not name or name.lower() == 'nan': continue
-                    if name.lower() not in existing_sens:
-                        db.session.add(Sensitivity(name=name))
-                        existing_sens.add(name.lower())
-                        sen_added += 1
-
-            # --- 3. Textures ---
-            df_tex = read_csv_from_zip('textures.csv')
-            tex_added = 0
-            if df_tex is not None and not df_tex.empty:
-                existing_tex = {t.name.strip().lower(): t for t in Texture.query.all()}
-                for _, row in df_tex.iterrows():
-                    old_id = row.get("id")
-                    name = str(row.get("name", "")).strip()
-                    if not name or name.lower() == 'nan': continue
-                    if name.lower() in existing_tex:
-                        tex_id_map[old_id] = existing_tex[name.lower()].id
-                    else:
-                        new_tex = Texture(name=name)
-                        db.session.add(new_tex)
-                        db.session.flush()
-                        tex_id_map[old_id] = new_tex.id
-                        existing_tex[name.lower()] = new_tex
-                        tex_added += 1
-
-            # --- 4. Diets ---
-            df_diet = read_csv_from_zip('diets.csv')
-            diet_added = 0
-            if df_diet is not None and not df_diet.empty:
-                existing_diets = {d.name.strip().lower() for d in Diet.query.all()}
-                for _, row in df_diet.iterrows():
-                    name = str(row.get("name", "")).strip()
-                    if not name or name.lower() == 'nan': continue
-                    if name.lower() not in existing_diets:
-                        db.session.add(Diet(name=name))
-                        existing_diets.add(name.lower())
-                        diet_added += 1
-
-            db.session.commit()
-
-            # --- 5. FoodItems ---
-            df_prod = read_csv_from_zip('products.csv')
-            prod_added = 0
-            if df_prod is not None and not df_prod.empty:
-                existing_prods_names = {p.name.strip().lower() for p in FoodItem.query.all()}
-                
-                for _, row in df_prod.iterrows():
-                    name = str(row.get("name", "")).strip()
-                    if not name or name.lower() == 'nan': continue
-                    if name.lower() in existing_prods_names: continue
-                    
-                    old_cat_id = row.get("category_id")
-                    old_tex_id = row.get("texture_id")
-                    
-                    new_cat_id = cat_id_map.get(old_cat_id) if pd.notna(old_cat_id) else None
-                    new_tex_id = tex_id_map.get(old_tex_id) if pd.notna(old_tex_id) else None
-
-                    # Handle image uploading if we have a locally zipped image or URL
-                    image_url = str(row.get("image_url", ""))
-                    final_image_url = ""
-                    
-                    if image_url and image_url.lower() != 'nan':
-                        if image_url.startswith("images/") and image_url in file_names and supabase:
-                            # Read raw byte data directly from the uploaded zip
-                            img_data = zf.read(image_url)
-                            ext = image_url.split('.')[-1]
-                            unique_filename = f"{uuid.uuid4().hex}_imported.{ext}"
-                            mime_type = f"image/{ext}" if ext != 'jpg' else 'image/jpeg'
-                            
-                            try:
-                                supabase.storage.from_("products").upload(
-                                    path=unique_filename,
-                                    file=img_data,
-                                    file_options={"content-type": mime_type}
-                                )
-                                final_image_url = supabase.storage.from_("products").get_public_url(unique_filename)
-                            except Exception as e:
-                                print(f"Failed to upload packaged image {image_url} to supabase: {e}")
-                        elif image_url.startswith("http"):
-                            # Fallback if the user uploaded an older zip that relies on external URLs
-                            final_image_url = image_url
-
-                    def parse_json_col(val):
-                        if pd.isna(val): return []
-                        try: return json.loads(val)
-                        except: return []
-
-                    def parse_vector_col(val):
-                        # Deserialize a JSON-encoded vector string back to a float list
-                        if pd.isna(val) or str(val).strip() == "": return None
-                        try: return json.loads(val)
-                        except: return None
-
-                    new_prod = FoodItem(
-                        name=name,
-                        category_id=new_cat_id,
-                        image_url=final_image_url,
-                        iddsi=row.get("iddsi", 0) if pd.notna(row.get("iddsi")) else 0,
-                        calories=row.get("calories", 0) if pd.notna(row.get("calories")) else 0,
-                        protein=row.get("protein", 0) if pd.notna(row.get("protein")) else 0,
-                        carbs=row.get("carbs", 0) if pd.notna(row.get("carbs")) else 0,
-                        fat=row.get("fat", 0) if pd.notna(row.get("fat")) else 0,
-                        sugars=row.get("sugars", 0) if pd.notna(row.get("sugars")) else 0,
-                        sodium=row.get("sodium", 0) if pd.notna(row.get("sodium")) else 0,
-                        contains=parse_json_col(row.get("contains")),
-                        may_contain=parse_json_col(row.get("may_contain")),
-                        texture_id=new_tex_id,
-                        properties=parse_json_col(row.get("properties")),
-                        company=row.get("company", "") if pd.notna(row.get("company")) else "",
-                        texture_notes=row.get("texture_notes", "") if pd.notna(row.get("texture_notes")) else "",
-                        allergy_notes=row.get("allergy_notes", "") if pd.notna(row.get("allergy_notes")) else "",
-                        forbidden_for=row.get("forbidden_for", "") if pd.notna(row.get("forbidden_for")) else "",
-                        nutrition_vector=parse_vector_col(row.get("nutrition_vector")),
-                        openai_embedding=parse_vector_col(row.get("openai_embedding")),
-                    )
-                    db.session.add(new_prod)
-                    existing_prods_names.add(name.lower())
-                    prod_added += 1
-                
-                db.session.commit()
+            details = import_backup_archive(zf, _backup_uploader())
 
         return jsonify({
             "message": "ייבוא הושלם בהצלחה!",
-            "details": {
-                "categories_added": cat_added,
-                "sensitivities_added": sen_added,
-                "textures_added": tex_added,
-                "diets_added": diet_added,
-                "products_added": prod_added
-            }
+            "details": details
         }), 200
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Import failed: {str(e)}"}), 500
+
+@job_handler(IMPORT_JOB)
+def _run_import_job(job) -> dict:
+    """Job handler: imports the uploaded backup archive."""
+    job.report_progress(stage="importing")
+    with zipfile.ZipFile(job.input_path(), 'r') as zf:
+        return import_backup_archive(zf, _backup_uploader())
@@ -1,14 +1,18 @@
 from flask import Blueprint, jsonify, request, Response
 import pandas as pd
 from models import db, Texture
+from jobs import enqueue_job, job_handler
+from catalog_cache import versioned_json
+from routes.jobs import job_accepted, wants_async
 
 textures_bp = Blueprint('textures_bp', __name__)
 
+UPLOAD_JOB = 'textures_upload'
+
 @textures_bp.route('/api/texture', methods=['GET'])
 def get_textures():
     """Retrieves all food texture definitions."""
-    textures = Texture.query.all()
-    return jsonify([{"id": s.id, "name": s.name} for s in textures])
+    return versioned_json(('textures',), lambda: [{"id": s.id, "name": s.name} for s in Texture.query.all()])
 
 @textures_bp.route('/api/texture/table', methods=['GET'])
 def get_textures_table():
@@ -26,42 +30,58 @@ def get_textures_table():
     )
     return response
 
+def _add_textures_from_csv(file) -> int:
+    """Adds every texture in the CSV that does not exist yet (case-insensitive). Returns how many were added."""
+    df = pd.read_csv(file)
+    if "Texture" not in df.columns:
+        raise ValueError("CSV must contain a 'Texture' column")
+        
+    added_count = 0
+    existing_textures = {t.name.strip().lower() for t in Texture.query.all()}
+    
+    for index, row in df.iterrows():
+        texture_name = str(row["Texture"]).strip()
+        if not texture_name or texture_name.lower() == 'nan':
+            continue
+            
+        texture_name_lower = texture_name.lower()
+        if texture_name_lower not in existing_textures:
+            new_texture = Texture(name=texture_name)
+            db.session.add(new_texture)
+            existing_textures.add(texture_name_lower)
+            added_count += 1
+            
+    db.session.commit()
+    return added_count
+
 @textures_bp.route('/api/texture/upload', methods=['POST'])
 def upload_textures():
-    """Uploads a CSV file of textures, ignoring duplicates."""
+    """Uploads a CSV file of textures, ignoring duplicates. With `Prefer: respond-async` the file is queued as a background job."""
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
-        
+
+    if wants_async():
+        return job_accepted(enqueue_job(UPLOAD_JOB, {"filename": file.filename}, input_file=file))
+
     try:
-        df = pd.read_csv(file)
-        if "Texture" not in df.columns:
-            return jsonify({"error": "CSV must contain a 'Texture' column"}), 400
-            
-        added_count = 0
-        existing_textures = {t.name.strip().lower() for t in Texture.query.all()}
-        
-        for index, row in df.iterrows():
-            texture_name = str(row["Texture"]).strip()
-            if not texture_name or texture_name.lower() == 'nan':
-                continue
-                
-            texture_name_lower = texture_name.lower()
-            if texture_name_lower not in existing_textures:
-                new_texture = Texture(name=texture_name)
-                db.session.add(new_texture)
-                existing_textures.add(texture_name_lower)
-                added_count += 1
-                
-        db.session.commit()
+        added_count = _add_textures_from_csv(file)
         return jsonify({"message": f"הועלו בהצלחה {added_count} מרקמים חדשים.", "added": added_count}), 200
-        
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@job_handler(UPLOAD_JOB)
+def _run_upload_job(job) -> dict:
+    """Job handler: adds the textures from the uploaded CSV."""
+    return {"added": _add_textures_from_csv(job.input_path())}
+
 @textures_bp.route('/api/texture', methods=['POST'])
 def add_texture():
     """Creates a new food texture definition."""
@@ -0,0 +1,50 @@
+"""
+Embeds every product that is missing an OpenAI embedding, outside of the API server.
+
+Texts are sent in batches (--batch-size per request) with --concurrency requests in flight.
+Progress is committed after every round and the last committed product id is written to the
+checkpoint file, so an interrupted run resumes where it stopped.
+
+Usage (from the Server directory):
+    python scripts/backfill_embeddings.py --batch-size 100 --concurrency 4
+"""
+
+import argparse
+import os
+import time
+
+from app import app
+from embeddings import EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY, backfill_missing_embeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_CONCURRENCY)
+    parser.add_argument("--checkpoint", default=".embedding_backfill_checkpoint")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    after_id = 0
+    if not args.restart and os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as f:
+            after_id = int(f.read().strip() or 0)
+        print(f"Resuming after product id {after_id}")
+
+    started = time.perf_counter()
+
+    def on_progress(last_id, embedded):
+        with open(args.checkpoint, "w") as f:
+            f.write(str(last_id))
+        print(f"  embedded {embedded} products (up to id {last_id}, {time.perf_counter() - started:.1f}s)")
+
+    with app.app_context():
+        stats = backfill_missing_embeddings(args.batch_size, args.concurrency, after_id, on_progress)
+
+    print(f"Done: {stats['embedded']} embedded, {stats['failed']} failed in {time.perf_counter() - started:.1f}s")
+    if stats["failed"] == 0 and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: allergen exclusion through JSONB name arrays vs. the precomputed bitmask columns.
+
+Inserts --products synthetic products (and the synthetic sensitivities they reference), then runs
+the catalog's "exclude these allergens, including may-contain" filter both ways for random
+allergen selections and reports mean latency and whether both paths return the same rows.
+All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_allergen_filter.py --products 100000 --queries 20 --exclude 3
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db
+from allergen_masks import refresh_allergen_masks
+
+PREFIX = "bench-allergen-"
+ALLERGENS = [f"{PREFIX}{i}" for i in range(16)]
+
+# The same filter both ways; {select} is 'count(*)' for timing and 'id' for the result comparison
+JSONB_SQL = """
+    SELECT {select} FROM food_items
+    WHERE NOT (COALESCE(contains, '[]'::jsonb) ?| CAST(:names AS TEXT[]))
+      AND NOT (COALESCE(may_contain, '[]'::jsonb) ?| CAST(:names AS TEXT[]))
+"""
+MASK_SQL = """
+    SELECT {select} FROM food_items
+    WHERE contains_mask & :mask = 0
+      AND may_contain_mask & :mask = 0
+"""
+
+
+def timed_count(sql: str, params) -> float:
+    """Runs the filter as a count over the whole table and returns elapsed_ms."""
+    start = time.perf_counter()
+    db.session.execute(text(sql.format(select="count(*)")), params).scalar()
+    return (time.perf_counter() - start) * 1000
+
+
+def matching_ids(sql: str, params) -> set:
+    return set(db.session.execute(text(sql.format(select="id")), params).scalars())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--exclude", type=int, default=3, help="allergens excluded per query")
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            db.session.execute(text("""
+                INSERT INTO sensitivities (name) SELECT unnest(CAST(:names AS TEXT[])) ON CONFLICT (name) DO NOTHING
+            """), {"names": ALLERGENS})
+            db.session.execute(text("""
+                INSERT INTO food_items (name, iddsi, calories, protein, carbs, fat, sugars, sodium,
+                                        contains, may_contain, properties)
+                SELECT :prefix || g, 0, 0, 0, 0, 0, 0, 0,
+                       jsonb_build_array(:prefix || (g % 16), :prefix || ((g * 7) % 16)),
+                       jsonb_build_array(:prefix || ((g * 3) % 16)),
+                       '[]'
+                FROM generate_series(1, :n) AS g
+            """), {"prefix": PREFIX, "n": args.products})
+            started = time.perf_counter()
+            refresh_allergen_masks()
+            db.session.commit()
+            print(f"mask backfill   : {time.perf_counter() - started:.2f}s for {args.products} products")
+            # Steady state: statistics current and the visibility map set
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("VACUUM ANALYZE food_items"))
+
+            bits = dict(db.session.execute(text(
+                "SELECT name, bit_index FROM sensitivities WHERE name LIKE :p"
+            ), {"p": PREFIX + "%"}).all())
+
+            jsonb_ms, mask_ms, mismatches = [], [], 0
+            for _ in range(args.queries):
+                names = random.sample(ALLERGENS, args.exclude)
+                mask = sum(1 << bits[n] for n in names)
+                jsonb_ms.append(timed_count(JSONB_SQL, {"names": names}))
+                mask_ms.append(timed_count(MASK_SQL, {"mask": mask}))
+                mismatches += matching_ids(JSONB_SQL, {"names": names}) != matching_ids(MASK_SQL, {"mask": mask})
+
+            print(f"jsonb names     : {sum(jsonb_ms) / len(jsonb_ms):8.2f} ms/query")
+            print(f"bitmask         : {sum(mask_ms) / len(mask_ms):8.2f} ms/query")
+            print(f"result mismatch : {mismatches} of {args.queries} queries")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM sensitivities WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: peak memory of GET /api/system/export for a large catalog with images.
+
+Inserts --products synthetic products whose images are served by a local HTTP server,
+streams the export through the Flask test client (discarding the bytes), and reports
+archive size, duration, the number of image downloads and the growth of the process' peak
+RSS. With --distinct-images below --products, products share image URLs the way catalog
+items share a photo; each distinct URL should be downloaded once. The synthetic rows are
+deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_export_memory.py --products 10000 --image-kb 100 --distinct-images 2000
+"""
+
+import argparse
+import os
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import text
+
+from app import app
+from models import db
+
+NAME_PREFIX = "bench-export-"
+
+
+def start_image_server(image_bytes: bytes) -> ThreadingHTTPServer:
+    """Serves the same JPEG-sized payload for any GET path on a random local port, counting requests in server.gets."""
+    class ImageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            server.gets += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(image_bytes)))
+            self.end_headers()
+            self.wfile.write(image_bytes)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    server.gets = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--image-kb", type=int, default=100)
+    parser.add_argument("--distinct-images", type=int, default=None, help="default: one image per product")
+    args = parser.parse_args()
+    distinct = args.distinct_images or args.products
+
+    server = start_image_server(os.urandom(args.image_kb * 1024))
+    base_url = f"http://127.0.0.1:{server.server_port}/images"
+
+    with app.app_context():
+        db.session.execute(text("""
+            INSERT INTO food_items (name, image_url, iddsi, calories, protein, carbs, fat, sugars, sodium,
+                                    contains, may_contain, properties)
+            SELECT :prefix || g, :base_url || '/' || (g % :distinct) || '.jpg', g % 8, g % 500, 1, 1, 1, 1, 1,
+                   '[]', '[]', '[]'
+            FROM generate_series(1, :n) AS g
+        """), {"prefix": NAME_PREFIX, "base_url": base_url, "n": args.products, "distinct": distinct})
+        db.session.commit()
+
+    try:
+        client = app.test_client()
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+
+        response = client.get("/api/system/export", buffered=False)
+        archive_bytes = 0
+        for chunk in response.response:
+            archive_bytes += len(chunk)
+        response.close()
+
+        elapsed = time.perf_counter() - started
+        print(f"products        : {args.products} x {args.image_kb} KiB images")
+        print(f"archive size    : {archive_bytes / 1024 / 1024:.1f} MiB in {elapsed:.1f}s")
+        print(f"image downloads : {server.gets} for {distinct} distinct URLs")
+        print(f"peak RSS growth : {peak_rss_mb() - rss_before:.1f} MiB (peak {peak_rss_mb():.1f} MiB)")
+    finally:
+        server.shutdown()
+        with app.app_context():
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": NAME_PREFIX + "%"})
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
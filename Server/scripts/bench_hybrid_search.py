@@ -0,0 +1,104 @@
+"""
+Benchmark: hybrid product search (GET /api/products/hybrid-search) over a synthetic Hebrew catalog.
+
+Inserts --products synthetic products whose names and notes combine Hebrew words, then searches
+for --queries random product names, each with one typo (a letter dropped or swapped with its
+neighbour), with and without an allergen filter. Reports the mean and worst endpoint latency and
+how often the product searched for is among the top k results. Whether the trigram index is in
+use (typo-tolerant) or search fell back to substring matching is printed first. All synthetic
+rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_hybrid_search.py --products 50000 --queries 50 --k 10
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db
+from allergen_masks import refresh_allergen_masks
+from product_search import trigram_search_available
+
+PREFIX = "bench-hybrid-"
+WORDS = [
+    "יוגורט", "גבינה", "לבנה", "חלב", "שקדים", "פירה", "תפוחי", "אדמה", "עוף", "טחון", "דג", "אמנון",
+    "סלמון", "אורז", "פתיתים", "מרק", "ירקות", "עדשים", "חומוס", "טחינה", "אבוקדו", "בננה", "תפוח",
+    "רסק", "דייסה", "שיבולת", "שועל", "קוטג", "ביצה", "חביתה", "פודינג", "וניל", "שוקולד", "ג'לי",
+    "תות", "אפרסק", "דלעת", "גזר", "קישוא", "חציל", "מחית", "רך", "טבעי", "מועשר", "דל", "שומן",
+]
+NOTES = ["מרקם אחיד", "נמעך במזלג", "ללא חתיכות", "טחון דק", "סמיך", "נוזלי"]
+
+
+def with_typo(name: str) -> str:
+    """The name with one typo in its longest word: a letter dropped or swapped with the next one."""
+    words = name.split()
+    i = max(range(len(words)), key=lambda w: len(words[w]))
+    word = words[i]
+    pos = random.randrange(len(word) - 1)
+    if random.random() < 0.5:
+        word = word[:pos] + word[pos + 1:]
+    else:
+        word = word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:]
+    words[i] = word
+    return " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rows = [
+        {"name": " ".join(rng.sample(WORDS, 3)) + f" {i}", "notes": rng.choice(NOTES),
+         "allergen": f"{PREFIX}{i % 8}"}
+        for i in range(args.products)
+    ]
+    with app.app_context():
+        try:
+            sensitivity_ids = list(db.session.execute(text("""
+                INSERT INTO sensitivities (name) SELECT unnest(CAST(:names AS TEXT[])) RETURNING id
+            """), {"names": [f"{PREFIX}{i}" for i in range(8)]}).scalars())
+            product_ids = list(db.session.execute(text("""
+                INSERT INTO food_items (name, company, texture_notes, contains, may_contain)
+                SELECT r.name, :prefix, r.notes, jsonb_build_array(r.allergen), '[]'
+                FROM unnest(CAST(:names AS TEXT[]), CAST(:notes AS TEXT[]), CAST(:allergens AS TEXT[]))
+                     AS r(name, notes, allergen)
+                RETURNING id
+            """), {"prefix": PREFIX, "names": [r["name"] for r in rows], "notes": [r["notes"] for r in rows],
+                   "allergens": [r["allergen"] for r in rows]}).scalars())
+            refresh_allergen_masks()
+            db.session.commit()
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("VACUUM ANALYZE food_items"))
+            print(f"lexical mode: {'trigram (typo-tolerant)' if trigram_search_available() else 'substring fallback'}")
+
+            client = app.test_client()
+            for label, extra in (("no filter", ""), ("1 allergen excl.", f"&exclude={sensitivity_ids[1]}")):
+                timings, hits = [], 0
+                for i in random.sample(range(args.products), args.queries):
+                    # The running number keeps the name unique; search by its words only
+                    term = with_typo(rows[i]["name"].rsplit(" ", 1)[0])
+                    started = time.perf_counter()
+                    response = client.get(f"/api/products/hybrid-search?k={args.k}&q={term}{extra}")
+                    timings.append((time.perf_counter() - started) * 1000)
+                    found = [int(item["id"]) for item in response.json["items"]]
+                    hits += product_ids[i] in found
+                print(f"{label:<17}: mean {statistics.mean(timings):7.1f} ms, max {max(timings):7.1f} ms, "
+                      f"product in top {args.k}: {hits}/{args.queries}")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM food_items WHERE company = :p"), {"p": PREFIX})
+            db.session.execute(text("DELETE FROM sensitivities WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
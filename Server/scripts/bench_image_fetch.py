@@ -0,0 +1,66 @@
+"""
+Benchmark: export image download throughput vs. concurrency.
+
+Runs images.fetch_images against a local HTTP server that answers every request after a
+fixed latency (simulating a remote storage bucket) and prints images/second for each
+worker count. Throughput should scale roughly linearly until the pool is saturated.
+
+Usage (from the Server directory):
+    python scripts/bench_image_fetch.py --images 200 --latency-ms 100 --workers 1,4,8,16
+"""
+
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from images import fetch_images
+
+
+def start_image_server(image_bytes: bytes, latency_s: float) -> ThreadingHTTPServer:
+    """Serves `image_bytes` for any GET path after `latency_s` seconds, on a random local port."""
+    class SlowImageHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(image_bytes)))
+            self.end_headers()
+            self.wfile.write(image_bytes)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowImageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--workers", default="1,4,8,16")
+    args = parser.parse_args()
+
+    server = start_image_server(os.urandom(args.image_kb * 1024), args.latency_ms / 1000)
+    items = [(i, f"http://127.0.0.1:{server.server_port}/images/{i}.jpg") for i in range(args.images)]
+
+    try:
+        for workers in (int(w) for w in args.workers.split(",")):
+            started = time.perf_counter()
+            fetched = sum(1 for _, _, content in fetch_images(items, workers=workers) if content is not None)
+            elapsed = time.perf_counter() - started
+            print(f"workers={workers:<3}: {fetched}/{args.images} images in {elapsed:6.2f}s "
+                  f"({fetched / elapsed:7.1f} images/s)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
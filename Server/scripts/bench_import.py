@@ -0,0 +1,92 @@
+"""
+Benchmark: bulk import of a synthetic backup archive.
+
+Builds an in-memory ZIP in the /api/system/export layout with --products products (plus
+categories and textures), imports it with bulk_import.import_backup_archive, and reports
+the time spent. Pass --embeddings to include 1536-dim embeddings (a much larger archive).
+All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_import.py --products 50000
+"""
+
+import argparse
+import io
+import json
+import random
+import time
+import zipfile
+
+import pandas as pd
+from sqlalchemy import text
+
+from app import app
+from models import db
+from bulk_import import import_backup_archive
+
+PREFIX = "bench-import-"
+ALLERGENS = ["gluten", "milk", "eggs", "soy", "sesame", "nuts", "peanuts", "fish"]
+
+
+def build_archive(n_products: int, with_embeddings: bool) -> bytes:
+    """Synthetic backup ZIP with the same files and columns the export writes."""
+    categories = pd.DataFrame({"id": range(1, 21), "name": [f"{PREFIX}cat-{i}" for i in range(1, 21)]})
+    textures = pd.DataFrame({"id": range(1, 8), "name": [f"{PREFIX}tex-{i}" for i in range(1, 8)]})
+
+    rows = []
+    for i in range(n_products):
+        nutrients = [round(random.uniform(0, 500), 1) for _ in range(6)]
+        rows.append({
+            "id": i + 1,
+            "name": f"{PREFIX}product-{i}",
+            "category_id": random.randint(1, 20),
+            "image_url": "",
+            "iddsi": random.randint(0, 7),
+            "calories": nutrients[0], "protein": nutrients[1], "carbs": nutrients[2],
+            "fat": nutrients[3], "sugars": nutrients[4], "sodium": nutrients[5],
+            "contains": json.dumps(random.sample(ALLERGENS, 2)),
+            "may_contain": json.dumps(random.sample(ALLERGENS, 1)),
+            "texture_id": random.randint(1, 7),
+            "properties": "[]",
+            "company": "bench",
+            "texture_notes": "", "allergy_notes": "", "forbidden_for": "",
+            "nutrition_vector": json.dumps(nutrients),
+            "openai_embedding": json.dumps([round(random.random(), 6) for _ in range(1536)]) if with_embeddings else "",
+        })
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("categories.csv", categories.to_csv(index=False).encode("utf-8-sig"))
+        zf.writestr("textures.csv", textures.to_csv(index=False).encode("utf-8-sig"))
+        zf.writestr("products.csv", pd.DataFrame(rows).to_csv(index=False).encode("utf-8-sig"))
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--embeddings", action="store_true")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    archive = build_archive(args.products, args.embeddings)
+    print(f"archive built   : {len(archive) / 1024 / 1024:.1f} MiB in {time.perf_counter() - started:.1f}s")
+
+    with app.app_context():
+        try:
+            started = time.perf_counter()
+            with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+                report = import_backup_archive(zf)
+            elapsed = time.perf_counter() - started
+            print(f"import          : {report['products_added']} products in {elapsed:.2f}s "
+                  f"({report['products_added'] / elapsed:,.0f} products/s)")
+            print(f"report          : {report}")
+        finally:
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM categories WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM textures WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
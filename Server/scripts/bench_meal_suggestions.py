@@ -0,0 +1,94 @@
+"""
+Benchmark: constraint-based meal suggestions over a synthetic catalog.
+
+Inserts --products synthetic products (random nutrients, IDDSI levels, allergens and properties),
+then runs each scenario below --repeat times through meal_suggestions.suggest_meals and reports
+the median and worst latency, how many products passed the restrictions, and how many of the
+returned meals meet every target. The one-off load of the in-memory catalog is timed separately.
+All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_meal_suggestions.py --products 10000 --repeat 20
+"""
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db, Diet
+from allergen_masks import refresh_allergen_masks
+from meal_suggestions import catalog_snapshot, suggest_meals
+
+PREFIX = "bench-suggest-"
+ALLERGENS = [f"{PREFIX}{i}" for i in range(12)]
+DIET = f"{PREFIX}diet"
+
+
+def scenarios(sensitivity_ids, diet_id):
+    """(name, suggest_meals keyword arguments)"""
+    lunch = {"calories": {"min": 550, "max": 700}, "protein": {"min": 30, "max": 45}}
+    return [
+        ("no restrictions, 3 items", {"targets": lunch}),
+        ("3 allergens excluded", {"targets": lunch, "exclude_ids": sensitivity_ids[:3]}),
+        ("allergens + IDDSI 4-5", {"targets": lunch, "exclude_ids": sensitivity_ids[:3], "iddsi_min": 4, "iddsi_max": 5}),
+        ("diet + 4 targets", {"diet_id": diet_id, "targets": {
+            **lunch, "sodium": {"max": 900}, "sugars": {"max": 25}}}),
+        ("5 items, 6 targets", {"size": 5, "targets": {
+            "calories": {"min": 900, "max": 1100}, "protein": {"min": 50}, "carbs": {"max": 140},
+            "fat": {"max": 40}, "sugars": {"max": 35}, "sodium": {"max": 1500}}}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            sensitivity_ids = list(db.session.execute(text("""
+                INSERT INTO sensitivities (name) SELECT unnest(CAST(:names AS TEXT[])) RETURNING id
+            """), {"names": ALLERGENS}).scalars())
+            diet = Diet(name=DIET)
+            db.session.add(diet)
+            db.session.execute(text("""
+                INSERT INTO food_items (name, iddsi, calories, protein, carbs, fat, sugars, sodium,
+                                        contains, may_contain, properties)
+                SELECT :prefix || g, g % 8,
+                       50 + random() * 450, random() * 35, random() * 60,
+                       random() * 25, random() * 20, random() * 700,
+                       jsonb_build_array(:prefix || (g % 12)),
+                       jsonb_build_array(:prefix || ((g * 5) % 12)),
+                       CASE WHEN g % 3 = 0 THEN jsonb_build_array(CAST(:diet AS TEXT)) ELSE '[]' END
+                FROM generate_series(1, :n) AS g
+            """), {"prefix": PREFIX, "diet": DIET, "n": args.products})
+            refresh_allergen_masks()
+            db.session.commit()
+
+            started = time.perf_counter()
+            catalog_snapshot()
+            print(f"catalog load: {(time.perf_counter() - started) * 1000:.1f} ms for {args.products}+ products\n")
+
+            for name, kwargs in scenarios(sensitivity_ids, diet.id):
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    result = suggest_meals(limit=10, **kwargs)
+                    timings.append((time.perf_counter() - started) * 1000)
+                fitting = sum(s["meets_targets"] for s in result["suggestions"])
+                print(f"{name:<26}: median {statistics.median(timings):6.1f} ms, max {max(timings):6.1f} ms, "
+                      f"{result['candidates']:>5} candidates, {fitting}/{len(result['suggestions'])} meals meet targets")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM sensitivities WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM diets WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
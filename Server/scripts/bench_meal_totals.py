@@ -0,0 +1,91 @@
+"""
+Benchmark: recomputing meal nutrition totals per meal vs. with one set-based UPDATE.
+
+Inserts --products synthetic products and --meals synthetic meals (each with 3-8 of those
+products as items), then recomputes every synthetic meal's totals twice: once meal by meal through the
+ORM (load the products, sum in Python, write the meal), and once with
+meal_nutrition.recompute_meal_totals. Also times the refresh triggered by a single product edit,
+and verifies that the consistency check finds nothing afterwards. All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_meal_totals.py --meals 10000 --products 2000
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db, Meal, MealItem, FoodItem
+from meal_nutrition import TOTAL_COLUMNS, inconsistent_meals, recompute_meal_totals
+
+PREFIX = "bench-meal-"
+
+
+def recompute_per_meal(meal_ids) -> None:
+    """The naive approach: one product query and one UPDATE per meal."""
+    for meal in Meal.query.filter(Meal.id.in_(meal_ids)).all():
+        products = {p.id: p for p in FoodItem.query.filter(FoodItem.id.in_(meal.product_ids)).all()}
+        for nutrient, total in TOTAL_COLUMNS.items():
+            setattr(meal, total, sum(getattr(products[pid], nutrient) or 0 for pid in meal.product_ids if pid in products))
+        db.session.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meals", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=2000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            product_ids = list(db.session.execute(text("""
+                INSERT INTO food_items (name, iddsi, calories, protein, carbs, fat, sugars, sodium)
+                SELECT :prefix || g, 0, random() * 500, random() * 50, random() * 80,
+                       random() * 30, random() * 40, random() * 900
+                FROM generate_series(1, :n) AS g
+                RETURNING id
+            """), {"prefix": PREFIX, "n": args.products}).scalars())
+            meal_ids = list(db.session.execute(text("""
+                INSERT INTO meals (name) SELECT :prefix || g FROM generate_series(1, :n) AS g RETURNING id
+            """), {"prefix": PREFIX, "n": args.meals}).scalars())
+            db.session.execute(MealItem.__table__.insert(), [
+                {"meal_id": meal_id, "position": pos, "food_item_id": pid, "quantity": 1.0}
+                for meal_id in meal_ids
+                for pos, pid in enumerate(random.sample(product_ids, random.randint(3, 8)))
+            ])
+            db.session.commit()
+
+            started = time.perf_counter()
+            recompute_per_meal(meal_ids)
+            per_meal_s = time.perf_counter() - started
+            db.session.rollback()
+
+            started = time.perf_counter()
+            updated = recompute_meal_totals(meal_ids=meal_ids)
+            set_based_s = time.perf_counter() - started
+            db.session.commit()
+
+            # A product edit: refresh only the meals that list it
+            product_id = random.choice(product_ids)
+            db.session.execute(text("UPDATE food_items SET calories = calories + 1 WHERE id = :id"), {"id": product_id})
+            started = time.perf_counter()
+            affected = recompute_meal_totals(product_ids=[product_id])
+            product_edit_ms = (time.perf_counter() - started) * 1000
+            db.session.commit()
+
+            print(f"per meal (ORM)  : {per_meal_s:8.2f} s for {len(meal_ids)} meals")
+            print(f"set-based UPDATE: {set_based_s:8.2f} s ({updated} meals written)")
+            print(f"product edit    : {product_edit_ms:8.2f} ms ({affected} meals refreshed)")
+            print(f"inconsistent    : {len(inconsistent_meals(meal_ids))} meals after recompute")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM meals WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: k-means nutrition clusters over a synthetic catalog.
+
+Inserts --products synthetic products with random nutrients and allergens, standardizes them and
+times a full rebuild (mini-batch k-means plus writing the assignments), the incremental
+assignment of single products, the cluster browsing endpoints, and substitutes with
+scope=cluster (1 and --probes clusters) against the default catalog-wide lookup, with recall@k of both against an exact
+scan of the whole catalog. All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_nutrition_clusters.py --products 20000 --queries 50 --k 10 --probes 3
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db
+from allergen_masks import refresh_allergen_masks
+from nutrition_features import refresh_nutrition_scaling
+from nutrition_clusters import assign_clusters, rebuild_clusters
+
+PREFIX = "bench-clusters-"
+
+EXACT_SQL = """
+    SELECT id FROM food_items
+    WHERE id != :id AND nutrition_std IS NOT NULL
+    ORDER BY nutrition_std <-> (SELECT nutrition_std FROM food_items WHERE id = :id)
+    LIMIT :k
+"""
+
+
+def exact_ids(product_id: int, k: int) -> set:
+    """Ground truth: the top-k of an exact scan over the whole catalog."""
+    with db.engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text("SET LOCAL enable_indexscan = off"))
+            return {row[0] for row in conn.execute(text(EXACT_SQL), {"id": product_id, "k": k})}
+
+
+def timed_ms(func):
+    started = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--probes", type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            product_ids = list(db.session.execute(text("""
+                INSERT INTO food_items (name, iddsi, calories, protein, carbs, fat, sugars, sodium, contains, may_contain)
+                SELECT :prefix || g, g % 8, random() * 600, random() * 40, random() * 90,
+                       random() * 35, random() * 30, random() * 1200, '[]', '[]'
+                FROM generate_series(1, :n) AS g
+                RETURNING id
+            """), {"prefix": PREFIX, "n": args.products}).scalars())
+            refresh_allergen_masks()
+            refresh_nutrition_scaling()
+            db.session.commit()
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("VACUUM ANALYZE food_items"))
+
+            elapsed, result = timed_ms(rebuild_clusters)
+            db.session.commit()
+            print(f"rebuild            : {elapsed:8.1f} ms, {result['clusters']} clusters over {result['products']} products")
+            sizes = db.session.execute(text(
+                "SELECT count(*) FROM food_item_clusters GROUP BY cluster_id")).scalars().all()
+            print(f"cluster sizes      : median {statistics.median(sizes):.0f}, max {max(sizes)}")
+
+            timings = []
+            for product_id in random.sample(product_ids, args.queries):
+                timings.append(timed_ms(lambda: assign_clusters([product_id]))[0])
+            db.session.commit()
+            print(f"assign one product : {statistics.mean(timings):8.2f} ms")
+
+            client = app.test_client()
+            elapsed, response = timed_ms(lambda: client.get("/api/nutrition-clusters"))
+            print(f"list clusters      : {elapsed:8.2f} ms")
+            cluster_ids = [c["id"] for c in response.json["clusters"]]
+            timings = [timed_ms(lambda: client.get(f"/api/nutrition-clusters/{c}/products?limit=50"))[0]
+                       for c in random.sample(cluster_ids, min(args.queries, len(cluster_ids)))]
+            print(f"browse cluster page: {statistics.mean(timings):8.2f} ms")
+
+            for label, query in (("catalog", "scope=catalog"), ("cluster x1", "scope=cluster&probes=1"),
+                                 (f"cluster x{args.probes}", f"scope=cluster&probes={args.probes}")):
+                timings, recalls = [], []
+                for product_id in random.sample(product_ids, args.queries):
+                    elapsed, response = timed_ms(
+                        lambda: client.get(f"/api/products/{product_id}/substitutes?k={args.k}&{query}"))
+                    timings.append(elapsed)
+                    truth = exact_ids(product_id, args.k)
+                    found = {int(i["id"]) for i in response.json["items"]}
+                    recalls.append(len(truth & found) / len(truth) if truth else 1.0)
+                print(f"subst. {label:<12}: {statistics.mean(timings):8.2f} ms/request, "
+                      f"recall@{args.k} vs whole catalog = {statistics.mean(recalls):.3f}")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            # Back to the statistics and clusters of the real catalog
+            refresh_nutrition_scaling()
+            rebuild_clusters()
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
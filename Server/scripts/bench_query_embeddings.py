@@ -0,0 +1,90 @@
+"""
+Benchmark: local (offline) embedder and the query embedding cache.
+
+Runs with EMBEDDER=local and AI_ENABLED=true. Inserts --products synthetic products with Hebrew
+names, embeds their semantic text with the local embedder (timed), then searches
+GET /api/products/search for --queries product names with one typo each. Reports the endpoint
+latency on first use and when the query embedding is served from the cache, and how often the
+product searched for is in the top k. All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_query_embeddings.py --products 20000 --queries 50 --k 10
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+os.environ["EMBEDDER"] = "local"
+os.environ["AI_ENABLED"] = "true"
+
+from sqlalchemy import text, update
+
+from app import app
+from models import db, FoodItem
+from embeddings import (
+    current_embedder, embedding_cache_stats, get_embeddings, make_semantic_search_text_for_embedding,
+    product_embedding_data, semantic_columns,
+)
+from bench_hybrid_search import NOTES, WORDS, with_typo
+
+PREFIX = "bench-query-embeddings-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = [" ".join(rng.sample(WORDS, 3)) for _ in range(args.products)]
+    with app.app_context():
+        try:
+            db.session.execute(text("""
+                INSERT INTO food_items (name, company, texture_notes, contains, may_contain, properties)
+                SELECT r.name, :prefix, r.notes, '[]', '[]', '[]'
+                FROM unnest(CAST(:names AS TEXT[]), CAST(:notes AS TEXT[])) AS r(name, notes)
+            """), {"prefix": PREFIX, "names": names, "notes": [rng.choice(NOTES) for _ in names]})
+            products = FoodItem.query.options(semantic_columns()).filter(FoodItem.company == PREFIX) \
+                .order_by(FoodItem.id).all()
+            texts = [make_semantic_search_text_for_embedding(product_embedding_data(p)) for p in products]
+
+            started = time.perf_counter()
+            vectors = get_embeddings(texts)
+            elapsed = time.perf_counter() - started
+            print(f"embedder          : {current_embedder().name}")
+            print(f"embed products    : {elapsed:.2f}s ({len(texts) / elapsed:,.0f} texts/s)")
+            db.session.execute(update(FoodItem), [
+                {"id": p.id, "openai_embedding": v, "embedding_model": current_embedder().name}
+                for p, v in zip(products, vectors)
+            ])
+            db.session.commit()
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("VACUUM ANALYZE food_items"))
+
+            client = app.test_client()
+            picks = random.sample(range(len(products)), args.queries)
+            terms = [with_typo(names[i]) for i in picks]
+            for label in ("first query", "cached query"):
+                timings, hits = [], 0
+                for i, term in zip(picks, terms):
+                    started = time.perf_counter()
+                    response = client.get(f"/api/products/search?k={args.k}&q={term}")
+                    timings.append((time.perf_counter() - started) * 1000)
+                    hits += products[i].id in {int(item["id"]) for item in response.json["items"]}
+                print(f"{label:<18}: mean {statistics.mean(timings):7.1f} ms, "
+                      f"product in top {args.k}: {hits}/{args.queries}")
+            stats = embedding_cache_stats()
+            print(f"query cache       : {stats['query_hits']} hits, {stats['query_misses']} misses")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM food_items WHERE company = :p"), {"p": PREFIX})
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: nutrition substitutes (GET /api/products/<id>/substitutes) over a synthetic catalog.
+
+Inserts --products synthetic products with random nutrients and allergens, standardizes them,
+then for --queries random products calls the substitutes endpoint with and without an allergen
+filter. Reports the mean endpoint latency and recall@k against an exact sequential scan over
+the same standardized vectors. All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/bench_substitutes.py --products 50000 --queries 50 --k 10
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db
+from allergen_masks import refresh_allergen_masks
+from nutrition_features import refresh_nutrition_scaling
+
+PREFIX = "bench-substitutes-"
+ALLERGENS = [f"{PREFIX}{i}" for i in range(8)]
+
+EXACT_SQL = """
+    SELECT id FROM food_items
+    WHERE id != :id AND nutrition_std IS NOT NULL {extra}
+    ORDER BY nutrition_std <-> (SELECT nutrition_std FROM food_items WHERE id = :id)
+    LIMIT :k
+"""
+
+
+def exact_ids(product_id: int, k: int, mask: int) -> set:
+    """Ground truth: the same top-k as an exact scan."""
+    extra = "AND contains_mask & :mask = 0 AND may_contain_mask & :mask = 0" if mask else ""
+    with db.engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text("SET LOCAL enable_indexscan = off"))
+            rows = conn.execute(text(EXACT_SQL.format(extra=extra)), {"id": product_id, "k": k, "mask": mask})
+            return {row[0] for row in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            sensitivity_ids = list(db.session.execute(text("""
+                INSERT INTO sensitivities (name) SELECT unnest(CAST(:names AS TEXT[])) RETURNING id
+            """), {"names": ALLERGENS}).scalars())
+            product_ids = list(db.session.execute(text("""
+                INSERT INTO food_items (name, iddsi, calories, protein, carbs, fat, sugars, sodium, contains, may_contain)
+                SELECT :prefix || g, g % 8, random() * 600, random() * 40, random() * 90,
+                       random() * 35, random() * 30, random() * 1200,
+                       jsonb_build_array(:prefix || (g % 8)), '[]'
+                FROM generate_series(1, :n) AS g
+                RETURNING id
+            """), {"prefix": PREFIX, "n": args.products}).scalars())
+            refresh_allergen_masks()
+            started = time.perf_counter()
+            refresh_nutrition_scaling()
+            db.session.commit()
+            print(f"standardize     : {time.perf_counter() - started:.2f}s for all products")
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("VACUUM ANALYZE food_items"))
+
+            bits = dict(db.session.execute(text(
+                "SELECT id, bit_index FROM sensitivities WHERE id = ANY(:ids)"), {"ids": sensitivity_ids}).all())
+            client = app.test_client()
+            for label, excluded in (("no filter", []), ("2 allergens excl.", sensitivity_ids[:2])):
+                mask = sum(1 << bits[s] for s in excluded)
+                query = f"k={args.k}" + (f"&exclude={','.join(map(str, excluded))}" if excluded else "")
+                timings, recalls = [], []
+                for product_id in random.sample(product_ids, args.queries):
+                    started = time.perf_counter()
+                    items = client.get(f"/api/products/{product_id}/substitutes?{query}").json["items"]
+                    timings.append((time.perf_counter() - started) * 1000)
+                    truth = exact_ids(product_id, args.k, mask)
+                    recalls.append(len(truth & {int(i["id"]) for i in items}) / len(truth) if truth else 1.0)
+                print(f"{label:<16}: {sum(timings) / len(timings):8.2f} ms/request, "
+                      f"recall@{args.k} = {sum(recalls) / len(recalls):.3f}")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM sensitivities WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            # Back to statistics of the real catalog
+            refresh_nutrition_scaling()
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: HNSW approximate search vs. exact scan over food_items.openai_embedding.
+
+For a sample of query vectors (existing product embeddings with a little noise), runs
+the same cosine top-k query twice - once through the HNSW index and once as an exact
+sequential scan - and reports mean latency and recall@k for each ef_search value.
+
+Usage (from the Server directory):
+    python scripts/bench_vector_search.py --queries 50 --k 10 --ef 20,40,100
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db
+
+TOP_K_SQL = text("""
+    SELECT id FROM food_items
+    WHERE openai_embedding IS NOT NULL
+    ORDER BY openai_embedding <=> CAST(:vec AS vector)
+    LIMIT :k
+""")
+
+
+def top_k(vec: str, k: int, exact: bool, ef_search: int) -> tuple[list[int], float]:
+    """Runs one top-k query in its own transaction and returns (ids, elapsed_ms)."""
+    with db.engine.connect() as conn:
+        with conn.begin():
+            if exact:
+                conn.execute(text("SET LOCAL enable_indexscan = off"))
+            else:
+                conn.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+            start = time.perf_counter()
+            ids = [row[0] for row in conn.execute(TOP_K_SQL, {"vec": vec, "k": k})]
+            return ids, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef", default="20,40,100", help="comma-separated hnsw.ef_search values")
+    args = parser.parse_args()
+
+    with app.app_context():
+        rows = db.session.execute(text(
+            "SELECT openai_embedding::text FROM food_items "
+            "WHERE openai_embedding IS NOT NULL AND vector_norm(openai_embedding) > 0 "
+            "ORDER BY random() LIMIT :n"
+        ), {"n": args.queries}).scalars().all()
+        if not rows:
+            print("No non-zero embeddings found - run the embedding backfill first.")
+            return
+
+        queries = []
+        for raw in rows:
+            values = [float(v) + random.gauss(0, 0.01) for v in raw.strip("[]").split(",")]
+            queries.append("[" + ",".join(f"{v:.6f}" for v in values) + "]")
+
+        exact_results, exact_ms = [], []
+        for vec in queries:
+            ids, ms = top_k(vec, args.k, exact=True, ef_search=0)
+            exact_results.append(set(ids))
+            exact_ms.append(ms)
+        print(f"exact scan       : {sum(exact_ms) / len(exact_ms):8.2f} ms/query")
+
+        for ef in (int(v) for v in args.ef.split(",")):
+            recalls, ann_ms = [], []
+            for vec, truth in zip(queries, exact_results):
+                ids, ms = top_k(vec, args.k, exact=False, ef_search=ef)
+                ann_ms.append(ms)
+                recalls.append(len(truth & set(ids)) / len(truth) if truth else 1.0)
+            print(f"hnsw ef_search={ef:<4}: {sum(ann_ms) / len(ann_ms):8.2f} ms/query, "
+                  f"recall@{args.k} = {sum(recalls) / len(recalls):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Check: the JSONB containment filter on food_items.properties uses its jsonb_path_ops GIN index.
+
+Inserts --products synthetic products with contains / may_contain / properties arrays, runs
+VACUUM ANALYZE, then EXPLAINs an @> containment query on each indexed column (only properties:
+allergen exclusions use the masks) and verifies the plan reaches the column's GIN index (a
+Bitmap Index Scan). Prints each plan's scan nodes and exits non-zero if any query falls back
+to a sequential scan. All synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    python scripts/check_jsonb_indexes.py --products 100000
+"""
+
+import argparse
+import json
+import sys
+
+from sqlalchemy import text
+
+from app import app
+from models import db
+
+PREFIX = "check-jsonb-"
+NAMES = 40
+
+# column -> index expected to serve `column @> :value`
+INDEXED_COLUMNS = {
+    "properties": "ix_food_items_properties_gin",
+}
+
+
+def scan_nodes(plan: dict):
+    """Yields (node type, relation or index name) for every scan node in an EXPLAIN (FORMAT JSON) plan."""
+    if "Scan" in plan["Node Type"]:
+        yield plan["Node Type"], plan.get("Index Name") or plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from scan_nodes(child)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    args = parser.parse_args()
+
+    failures = 0
+    with app.app_context():
+        try:
+            # Each product lists 2 of NAMES names per column, so one name matches ~5% of the catalog
+            db.session.execute(text("""
+                INSERT INTO food_items (name, iddsi, calories, protein, carbs, fat, sugars, sodium,
+                                        contains, may_contain, properties)
+                SELECT :prefix || g, 0, 0, 0, 0, 0, 0, 0,
+                       jsonb_build_array(:prefix || (g % :names), :prefix || ((g * 7) % :names)),
+                       jsonb_build_array(:prefix || ((g * 3) % :names), :prefix || ((g * 11) % :names)),
+                       jsonb_build_array(:prefix || ((g * 5) % :names), :prefix || ((g * 13) % :names))
+                FROM generate_series(1, :n) AS g
+            """), {"prefix": PREFIX, "names": NAMES, "n": args.products})
+            db.session.commit()
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("VACUUM ANALYZE food_items"))
+
+            for column, index in INDEXED_COLUMNS.items():
+                plan = db.session.execute(
+                    text(f"EXPLAIN (FORMAT JSON) SELECT id FROM food_items WHERE {column} @> CAST(:value AS JSONB)"),
+                    {"value": json.dumps([f"{PREFIX}1"])},
+                ).scalar()
+                nodes = list(scan_nodes(plan[0]["Plan"]))
+                ok = ("Bitmap Index Scan", index) in nodes
+                failures += not ok
+                print(f"{column:<12}: {'ok  ' if ok else 'FAIL'} {', '.join(f'{t} on {n}' for t, n in nodes)}")
+        finally:
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.commit()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
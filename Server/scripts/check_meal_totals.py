@@ -0,0 +1,44 @@
+"""
+Check: every meal's stored nutrition totals match the sum of its products' current nutrients.
+
+Lists the meals whose Meal.total_* columns disagree with their products and exits non-zero if
+any do. Pass --fix to recompute the inconsistent meals (one set-based UPDATE) and commit.
+
+Usage (from the Server directory):
+    python scripts/check_meal_totals.py [--fix]
+"""
+
+import argparse
+import sys
+
+from app import app
+from models import db
+from meal_nutrition import inconsistent_meals, recompute_meal_totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fix", action="store_true", help="recompute the inconsistent meals")
+    args = parser.parse_args()
+
+    with app.app_context():
+        stale = inconsistent_meals()
+        for meal in stale:
+            diffs = ", ".join(
+                f"{n} {meal['stored'][n]} != {meal['computed'][n]}"
+                for n in meal["stored"] if meal["stored"][n] != meal["computed"][n]
+            )
+            print(f"meal {meal['id']}: {diffs}")
+        print(f"{len(stale)} inconsistent meal(s)")
+
+        if stale and args.fix:
+            updated = recompute_meal_totals(meal_ids=[m["id"] for m in stale])
+            db.session.commit()
+            print(f"recomputed {updated} meal(s)")
+            stale = inconsistent_meals()
+
+    sys.exit(1 if stale else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Profile: database cost of the main read endpoints, from the per-request instrumentation headers.
+
+Calls each endpoint below --repeat times through the Flask test client against the configured
+database and prints, slowest first, the median request time, DB time, pool wait and query
+count read back from the Server-Timing and X-DB-Query-Count response headers. Endpoints whose
+query count grows with the data (an N+1 pattern) stand out in the last column. Read-only.
+
+Usage (from the Server directory):
+    python scripts/profile_endpoints.py --repeat 10
+"""
+
+import argparse
+import re
+import statistics
+
+from app import app
+
+ENDPOINTS = [
+    "/api/products",
+    "/api/products/query?limit=50",
+    "/api/products/hybrid-search?q=test",
+    "/api/meals",
+    "/api/meals?expand=products",
+    "/api/nutrition-clusters",
+    "/api/categories",
+    "/api/sensitivities",
+    "/api/texture",
+    "/api/diets",
+]
+
+TIMING = re.compile(r'([\w-]+);dur=([\d.]+)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    results = []
+    for url in ENDPOINTS:
+        samples = []
+        for _ in range(args.repeat):
+            response = client.get(url)
+            timings = {name: float(dur) for name, dur in TIMING.findall(response.headers.get("Server-Timing", ""))}
+            samples.append((timings.get("app", 0.0), timings.get("db", 0.0), timings.get("db-pool", 0.0),
+                            int(response.headers.get("X-DB-Query-Count", 0)), response.status_code))
+        columns = list(zip(*samples))
+        results.append((url, *(statistics.median(c) for c in columns[:3]), max(columns[3]), columns[4][-1]))
+
+    print(f"{'endpoint':<40} {'status':>6} {'total ms':>9} {'db ms':>8} {'pool ms':>8} {'queries':>8}")
+    for url, total, db_ms, pool_ms, queries, status in sorted(results, key=lambda r: -r[1]):
+        print(f"{url:<40} {status:>6} {total:9.1f} {db_ms:8.1f} {pool_ms:8.2f} {queries:8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,7 @@
-import os
-from openai import OpenAI
 from app import app, db
 from models import FoodItem, Category
-from dotenv import load_dotenv
-
-load_dotenv()
-api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key) if api_key else None
+# Cached: re-seeding only calls the embeddings API for text it has never embedded before
+from embeddings import get_embedding
 
 # הרשימה הסגורה המותרת (לפי כפתורי הסינון באפיון):
 # "gluten", "milk", "eggs", "soy", "sesame", "nuts", "peanuts", "fish"
@@ -135,25 +130,13 @@ hospital_food_db = [
 ]
 
 
-def get_embedding(text):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        return [0.0] * 1536
-    try:
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Embedding failed: {e}")
-        return [0.0] * 1536
-
-
 def seed_database():
     with app.app_context():
         print("Clearing out old data...")
-        db.drop_all()
+        # Keep the embedding cache so unchanged products are not re-embedded
+        db.metadata.drop_all(bind=db.engine, tables=[
+            t for t in db.metadata.sorted_tables if t.name != 'embedding_cache'
+        ])
         db.create_all()
 
         print("Seeding Categories first...")
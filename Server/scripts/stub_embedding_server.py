@@ -0,0 +1,76 @@
+"""
+Local stand-in for the OpenAI embeddings API, for testing the embedding backfill offline.
+
+Answers POST /v1/embeddings with deterministic pseudo-random unit vectors derived from each
+input text, so repeated runs embed identical text identically. An optional per-request
+latency simulates the real API round-trip.
+
+Usage (from the Server directory):
+    python scripts/stub_embedding_server.py --port 8001 --latency-ms 300
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub AI_ENABLED=true \\
+        python scripts/backfill_embeddings.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIM = 1536
+
+
+def fake_embedding(text: str) -> list[float]:
+    """Deterministic unit vector seeded by the SHA-256 of the text."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    values = [rng.gauss(0, 1) for _ in range(DIM)]
+    norm = math.sqrt(sum(v * v for v in values))
+    return [v / norm for v in values]
+
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    latency_s = 0.0
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        time.sleep(self.latency_s)
+        payload = json.dumps({
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(t)} for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    EmbeddingHandler.latency_s = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), EmbeddingHandler)
+    print(f"Stub embeddings API listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
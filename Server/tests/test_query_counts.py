@@ -0,0 +1,76 @@
+"""
+Regression test: the catalog and meal endpoints issue a constant number of SQL statements,
+however many products, meals and meal items there are (no N+1 lazy loads).
+
+Runs against the database in DATABASE_URL (skipped without one), reading the statement count
+from the X-DB-Query-Count response header. Synthetic rows are deleted afterwards.
+
+Usage (from the Server directory):
+    JOB_WORKER_IN_PROCESS=false python -m pytest -q tests
+"""
+
+import itertools
+import os
+
+import pytest
+
+if not os.environ.get("DATABASE_URL"):
+    pytest.skip("needs a database (DATABASE_URL)", allow_module_level=True)
+
+from sqlalchemy import text
+
+from app import app
+from models import db, Diet, Meal, MealItem
+
+PREFIX = "test-query-counts-"
+_batches = itertools.count()
+
+
+@pytest.fixture(scope="module")
+def client():
+    try:
+        yield app.test_client()
+    finally:
+        with app.app_context():
+            db.session.rollback()
+            db.session.execute(text("DELETE FROM meals WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM food_items WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.execute(text("DELETE FROM diets WHERE name LIKE :p"), {"p": PREFIX + "%"})
+            db.session.commit()
+
+
+def add_rows(n: int) -> int:
+    """Adds n products and n meals, each with its own diet; the last meal holds all n products. Returns its id."""
+    batch = f"{next(_batches)}-{n}"
+    with app.app_context():
+        product_ids = [pid for (pid,) in db.session.execute(text("""
+            INSERT INTO food_items (name, calories, protein, carbs, fat, sugars, sodium, contains, may_contain, properties)
+            SELECT :prefix || 'product-' || :batch || '-' || g, g, 1, 1, 1, 1, 1, '[]', '[]', '[]'
+            FROM generate_series(1, :n) AS g
+            RETURNING id
+        """), {"prefix": PREFIX, "batch": batch, "n": n})]
+        meals = [Meal(name=f"{PREFIX}meal-{batch}-{i}", diet=Diet(name=f"{PREFIX}diet-{batch}-{i}")) for i in range(n)]
+        db.session.add_all(meals)
+        db.session.flush()
+        db.session.add_all(MealItem(meal_id=meals[-1].id, position=pos, food_item_id=pid)
+                           for pos, pid in enumerate(product_ids))
+        db.session.commit()
+        return meals[-1].id
+
+
+def statement_count(client, url: str) -> int:
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return int(response.headers["X-DB-Query-Count"])
+
+
+@pytest.mark.parametrize("url", [
+    "/api/products",
+    "/api/meals",
+    "/api/meals?expand=products",
+    "/api/meals/{meal_id}",
+])
+def test_statement_count_does_not_grow_with_rows(client, url):
+    # The first request after each insert sees new data versions, so cached catalog responses are rebuilt
+    counts = [statement_count(client, url.format(meal_id=add_rows(n))) for n in (3, 30)]
+    assert counts[0] == counts[1], f"{url}: {counts[0]} statements with 3 rows each, {counts[1]} with 30"
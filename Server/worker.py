@@ -0,0 +1,23 @@
+"""
+Background job worker: runs queued jobs (exports, imports, CSV uploads, embeddings) outside the web process.
+
+Usage (from the Server directory):
+    python worker.py                      # run forever
+    python worker.py --once               # drain the queue and exit (e.g. from cron)
+    python worker.py --kinds export,import
+"""
+
+import argparse
+
+from app import app
+from jobs import work
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument("--kinds", default="", help="comma-separated job kinds to run (default: all)")
+    args = parser.parse_args()
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip()] or None
+    ran = work(app, kinds=kinds, once=args.once)
+    print(f"Worker finished after {ran} job(s).")